@@ -0,0 +1,296 @@
+# alertas.py
+"""
+Alertas de mudança de status (OK → BAIXO → CRÍTICO) a cada carga do catálogo.
+
+O motor guarda, por série (depósito), as colunas que definem o status
+(estoque atual/mín/máx) e o status do último snapshot. Numa carga nova
+só os SKUs novos ou com esses valores alterados têm o status
+recalculado; os que pioraram para BAIXO/CRÍTICO viram notificações, com deduplicação (mesmo status não é
+repetido), intervalo mínimo por SKU (a não ser que piore) e teto por
+ciclo (o excedente vira um resumo). O envio vai para um sink plugável:
+
+  arquivo:alertas.jsonl   uma linha JSON por alerta
+  webhook:https://...     POST {"alertas": [...]}
+  email:saida/            um .eml por lote (stand-in de e-mail)
+
+O `Vigia` roda o motor numa thread, relendo as fontes a cada intervalo,
+para avisar mesmo com ninguém com a página aberta. Avulso:
+  python -m alertas --sink arquivo:alertas.jsonl --intervalo 30
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from email.message import EmailMessage
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+from estoque import carregar_fontes, ler_depositos, status_estoque
+from metricas import span
+import snapshots
+
+CONFIG_PADRAO = os.environ.get('ESTOQUE_ALERTAS', '')
+COLUNAS_STATUS = ['estoque_atual', 'estoque_min', 'estoque_max']
+NIVEL = {'OK': 0, 'EXCESSO': 0, 'BAIXO': 1, 'CRÍTICO': 2}
+
+
+# ======================
+# SINKS
+# ======================
+class SinkArquivo:
+    """Acrescenta uma linha JSON por alerta em `caminho`."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def enviar(self, alertas):
+        with open(self.caminho, 'a', encoding='utf-8') as f:
+            for a in alertas:
+                f.write(json.dumps(a, ensure_ascii=False) + '\n')
+
+
+class SinkWebhook:
+    """POST JSON {"alertas": [...]}; resposta não-2xx levanta exceção."""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def enviar(self, alertas):
+        r = requests.post(self.url, json={'alertas': alertas}, timeout=self.timeout)
+        r.raise_for_status()
+
+
+class SinkEmail:
+    """Stand-in de e-mail: grava cada lote como um .eml em `pasta`."""
+
+    def __init__(self, pasta, destinatarios=('compras',), remetente='estoque@localhost'):
+        self.pasta = Path(pasta)
+        self.destinatarios = list(destinatarios)
+        self.remetente = remetente
+
+    def enviar(self, alertas):
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        msg = EmailMessage()
+        msg['From'] = self.remetente
+        msg['To'] = ', '.join(self.destinatarios)
+        msg['Subject'] = f"[Estoque] {len(alertas)} alerta(s) de estoque"
+        msg.set_content('\n'.join(formatar(a) for a in alertas))
+        nome = f"alertas_{datetime.now():%Y%m%d_%H%M%S_%f}.eml"
+        (self.pasta / nome).write_bytes(bytes(msg))
+
+
+def sink_de_config(config):
+    """'tipo:destino' -> sink (None se vazio). Ver docstring do módulo."""
+    if not config:
+        return None
+    tipo, _, destino = config.partition(':')
+    if tipo == 'arquivo':
+        return SinkArquivo(destino or 'alertas.jsonl')
+    if tipo == 'webhook':
+        return SinkWebhook(destino)
+    if tipo == 'email':
+        para = os.environ.get('ESTOQUE_ALERTAS_PARA', 'compras').split(',')
+        return SinkEmail(destino or 'alertas_email', para)
+    raise ValueError(f"sink de alertas desconhecido: {config}")
+
+
+def formatar(alerta):
+    if alerta.get('tipo') == 'resumo':
+        return f"+{alerta['omitidos']} outro(s) SKU(s) mudaram de status ({alerta['serie']})"
+    return (f"{alerta['para']}: {alerta['codigo']} — {alerta['nome']} ({alerta['serie']}) "
+            f"{alerta['de'] or 'novo'} → {alerta['para']}, estoque {alerta['estoque_atual']:g} / mín {alerta['estoque_min']:g}")
+
+
+# ======================
+# MOTOR
+# ======================
+class MotorAlertas:
+    """
+    Estado por série + regras de envio. `avaliar(serie, df)` a cada carga;
+    thread-safe. `historico`: últimos alertas enviados (mais recente no fim).
+    """
+
+    def __init__(self, sink, intervalo_sku=3600, max_por_ciclo=50, alertar_carga_inicial=False,
+                 chave=snapshots.CHAVE, relogio=time.time):
+        self.sink = sink
+        self.intervalo_sku = intervalo_sku
+        self.max_por_ciclo = max_por_ciclo
+        self.alertar_carga_inicial = alertar_carga_inicial
+        self.chave = chave
+        self.relogio = relogio
+        self.historico = deque(maxlen=200)
+        self.enviados = 0
+        self.erros = deque(maxlen=20)
+        self._series = {}        # serie -> {'versao', 'chaves', 'valores', 'status'} (arrays alinhados)
+        self._notificado = {}    # (serie, chave) -> (status, instante)
+        self._pendentes = []     # lote que o sink recusou: reenviado no próximo ciclo
+        self._lock = threading.Lock()
+
+    def avaliar(self, serie, df):
+        """Processa um snapshot da `serie`. Retorna a lista de alertas enviados."""
+        with self._lock, span('alertas', serie):
+            transicoes = self._transicoes(serie, df)
+            return self._enviar(self._filtrar(serie, transicoes))
+
+    def _transicoes(self, serie, df):
+        versao = df.attrs.get('versao')
+        estado = self._series.get(serie)
+        if estado and versao is not None and estado['versao'] == versao:
+            return []
+        df = df.drop_duplicates(self.chave)
+        chaves = df[self.chave].to_numpy(dtype=object)
+        valores = df[COLUNAS_STATUS].apply(pd.to_numeric, errors='coerce').fillna(0).to_numpy()
+        if estado is None:
+            status = status_estoque(df).to_numpy(dtype=object)
+            self._series[serie] = {'versao': versao, 'chaves': chaves, 'valores': valores, 'status': status}
+            if not self.alertar_carga_inicial:
+                return []
+            idx, antigos = np.arange(len(df)), np.full(len(df), None, dtype=object)
+        else:
+            # posição de cada SKU no snapshot anterior (-1 = novo); mesma ordem → sem lookup
+            if np.array_equal(chaves, estado['chaves']):
+                pos = np.arange(len(chaves))
+            else:
+                pos = pd.Index(estado['chaves']).get_indexer(chaves)
+            existe = pos >= 0
+            mudou = ~existe
+            mudou[existe] = (valores[existe] != estado['valores'][pos[existe]]).any(axis=1)
+            idx = np.flatnonzero(mudou)
+            status = np.empty(len(chaves), dtype=object)
+            status[existe] = estado['status'][pos[existe]]
+            status[idx] = status_estoque(df.iloc[idx]).to_numpy(dtype=object)
+            antigos = np.where(existe[idx], estado['status'][np.maximum(pos[idx], 0)], None)
+            estado.update(versao=versao, chaves=chaves, valores=valores, status=status)
+
+        saida = []
+        for (_, linha), de, para in zip(df.iloc[idx].iterrows(), antigos, status[idx]):
+            if de == para:
+                continue
+            saida.append({
+                'serie': serie, 'chave': linha[self.chave], 'codigo': str(linha['codigo']),
+                'nome': str(linha.get('nome', '')), 'de': de, 'para': para,
+                'estoque_atual': float(linha['estoque_atual']), 'estoque_min': float(linha['estoque_min']),
+            })
+        return saida
+
+    def _filtrar(self, serie, transicoes):
+        """Dedup + intervalo por SKU + teto por ciclo."""
+        agora = self.relogio()
+        enviar = []
+        for t in transicoes:
+            k = (serie, t['chave'])
+            nivel = NIVEL.get(t['para'], 0)
+            ultimo = self._notificado.get(k)
+            if nivel == 0:
+                self._notificado.pop(k, None)    # recuperou: a próxima piora volta a avisar
+                continue
+            if ultimo and ultimo[0] == t['para']:
+                continue
+            piorou = ultimo is None or nivel > NIVEL.get(ultimo[0], 0)
+            if ultimo and not piorou and agora - ultimo[1] < self.intervalo_sku:
+                continue
+            self._notificado[k] = (t['para'], agora)
+            enviar.append(t)
+        # CRÍTICO primeiro; o que passar do teto entra num resumo
+        enviar.sort(key=lambda t: -NIVEL[t['para']])
+        em = datetime.now().isoformat(timespec='seconds')
+        lote = [dict(t, em=em, tipo='status') for t in enviar[:self.max_por_ciclo]]
+        if len(enviar) > self.max_por_ciclo:
+            lote.append({'tipo': 'resumo', 'serie': serie, 'omitidos': len(enviar) - self.max_por_ciclo, 'em': em})
+        return lote
+
+    def _enviar(self, lote):
+        lote = self._pendentes + lote
+        if not lote:
+            return []
+        try:
+            self.sink.enviar(lote)
+        except Exception as e:
+            self._pendentes = lote[-10 * self.max_por_ciclo:]
+            self.erros.append(f"{datetime.now():%H:%M:%S} {e}")
+            return []
+        self._pendentes = []
+        self.historico.extend(lote)
+        self.enviados += len(lote)
+        return lote
+
+
+# ======================
+# VIGIA (THREAD)
+# ======================
+class Vigia:
+    """
+    Relê as fontes a cada `intervalo` segundos e passa cada depósito ao motor.
+    As leituras não contam como uso no cache compartilhado (ver
+    estoque.ler_produtos): o vigia não segura ali o catálogo de uma empresa
+    que ninguém está olhando.
+    """
+
+    def __init__(self, motor, fontes, intervalo=30, empresa=None):
+        self.motor = motor
+        self.fontes = fontes
+        self.intervalo = intervalo
+        self.empresa = empresa
+        self.ciclos = 0
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, name='vigia-alertas', daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+    def ciclo(self):
+        for fonte, df, erro in ler_depositos(self.fontes, empresa=self.empresa, recente=False):
+            if erro:
+                self.motor.erros.append(f"{datetime.now():%H:%M:%S} {fonte['deposito']}: {erro}")
+            else:
+                self.motor.avaliar(fonte['deposito'], df)
+        self.ciclos += 1
+
+    def _rodar(self):
+        while not self._parar.is_set():
+            try:
+                self.ciclo()
+            except Exception as e:
+                self.motor.erros.append(f"{datetime.now():%H:%M:%S} {e}")
+            self._parar.wait(self.intervalo)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--sink', default=CONFIG_PADRAO or 'arquivo:alertas.jsonl', help='tipo:destino')
+    ap.add_argument('--intervalo', type=float, default=30, help='segundos entre leituras')
+    ap.add_argument('--intervalo-sku', type=float, default=3600, help='segundos mínimos entre alertas do mesmo SKU')
+    ap.add_argument('--max-por-ciclo', type=int, default=50)
+    ap.add_argument('--fontes', default=None, help='JSON de fontes (padrão: ESTOQUE_FONTES / fontes.json)')
+    args = ap.parse_args()
+
+    motor = MotorAlertas(sink_de_config(args.sink), intervalo_sku=args.intervalo_sku, max_por_ciclo=args.max_por_ciclo)
+    fontes = carregar_fontes(args.fontes) if args.fontes else carregar_fontes()
+    vigia = Vigia(motor, fontes, args.intervalo).iniciar()
+    print(f"Vigiando {len(fontes)} fonte(s) a cada {args.intervalo:g}s -> {args.sink}")
+    vistos = 0
+    try:
+        while True:
+            time.sleep(1)
+            novos = min(motor.enviados - vistos, len(motor.historico))
+            for a in list(motor.historico)[len(motor.historico) - novos:]:
+                print(formatar(a))
+            vistos = motor.enviados
+    except KeyboardInterrupt:
+        vigia.parar()
+
+
+if __name__ == '__main__':
+    main()
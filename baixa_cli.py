@@ -0,0 +1,231 @@
+# baixa_cli.py
+"""
+Baixa por faturamento em lote, sem Streamlit.
+
+Lê vários arquivos de faturamento (diretório, glob ou lista) em paralelo,
+soma a demanda por código normalizado, expande kits e grava os relatórios
+de preview, não encontrados (com sugestões de códigos parecidos),
+proveniência e integridade do catálogo (ver validacao.py). Códigos com alias (ver estoque.registrar_aliases) são
+resolvidos antes da conciliação. Com --simular/--aplicar envia as saídas
+ao webhook como uma tarefa (ver tarefas.py) e grava o resultado; uma
+tarefa interrompida (Ctrl+C, queda) continua com --retomar, sem reenviar
+as linhas que já deram certo.
+
+Exemplos:
+  python baixa_cli.py faturas/ --saida relatorios/
+  python baixa_cli.py "exports/*.csv" --colaborador Maria --aplicar
+  python baixa_cli.py --retomar 20250101_120000_ab12cd --saida relatorios/
+  python baixa_cli.py faturas/ --empresa silva --simular
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from estoque import (
+    SHEETS_URL, WEBHOOK_URL, REGISTRO_APLICADAS, ALIASES, ler_produtos, ler_fatura, consolidar_faturas,
+    digest_arquivo, ja_aplicadas, mapa_aliases
+)
+import conciliacao
+import empresas
+import tarefas
+import validacao
+
+EXTENSOES = ('.csv', '.xls', '.xlsx')
+
+
+def listar_arquivos(entradas):
+    """Expande diretórios e globs em arquivos CSV/XLS/XLSX (ordenados, sem repetição)."""
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = [os.path.join(entrada, n) for n in os.listdir(entrada)]
+        else:
+            candidatos = glob.glob(entrada, recursive=True) or [entrada]
+        arquivos += [c for c in candidatos if os.path.isfile(c) and c.lower().endswith(EXTENSOES)]
+    return sorted(set(arquivos))
+
+
+def nomes_relativos(caminhos):
+    """
+    {caminho: nome} com o caminho relativo à raiz comum das entradas:
+    dir1/vendas.csv e dir2/vendas.csv não se confundem nos erros e na
+    proveniência. Tudo na mesma pasta: só o nome do arquivo.
+    """
+    if not caminhos:
+        return {}
+    raiz = os.path.commonpath([os.path.dirname(os.path.abspath(c)) for c in caminhos])
+    return {c: os.path.relpath(os.path.abspath(c), raiz) for c in caminhos}
+
+
+def ler_arquivo(caminho, nome=None):
+    """Worker do pool: (nome, df, erro)."""
+    nome = nome or os.path.basename(caminho)
+    try:
+        with open(caminho, 'rb') as f:
+            df, erro = ler_fatura(f)
+        return nome, df, erro
+    except Exception as e:
+        return nome, None, f"Erro ao processar arquivo: {e}"
+
+
+def ler_em_paralelo(caminhos, processos=None):
+    """Lê os arquivos num pool de processos; mantém a ordem de entrada (nomes: ver nomes_relativos)."""
+    nomes = list(nomes_relativos(caminhos).values())
+    if processos == 1 or len(caminhos) <= 1:
+        return [ler_arquivo(c, n) for c, n in zip(caminhos, nomes)]
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        return list(pool.map(ler_arquivo, caminhos, nomes))
+
+
+def processar_lote(caminhos, produtos_df, processos=None, aliases=None):
+    """Lê os arquivos em paralelo e consolida (ver estoque.consolidar_faturas)."""
+    return consolidar_faturas(ler_em_paralelo(caminhos, processos), produtos_df, aliases)
+
+
+def gravar(df, pasta, nome):
+    caminho = pasta / nome
+    df.to_csv(caminho, index=False, encoding='utf-8-sig')
+    return caminho
+
+
+def executar_tarefa(fila, tid, pasta, incertas=False):
+    """Roda a tarefa neste processo; Ctrl+C deixa a tarefa retomável."""
+    def progresso(i, total, codigo):
+        print(f"\r{i+1}/{total} {codigo:<30}", end='', file=sys.stderr)
+
+    print(f"Tarefa {tid}", file=sys.stderr)
+    try:
+        estado = fila.executar(tid, incertas=incertas, progresso=progresso if sys.stderr.isatty() else None)
+    except KeyboardInterrupt:
+        print(f"\nInterrompida: python baixa_cli.py --retomar {tid}", file=sys.stderr)
+        return 130
+    finally:
+        if sys.stderr.isatty():
+            print(file=sys.stderr)
+        gravar(pd.DataFrame(fila.resultados(tid)), pasta, 'resultado_baixas.csv')
+    if estado == 'executando':
+        print(f"A tarefa {tid} está sendo executada por outro processo (app ou CLI).", file=sys.stderr)
+        return 4
+    p = fila.progresso(tid)
+    print(f"Baixas: {p['sucesso']} sucesso(s), {p['erro']} erro(s), {p['incertas']} incerta(s)"
+          f"{' (simulação)' if p['test_mode'] else ''}")
+    return 1 if p['erro'] or p['incertas'] else 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('entradas', nargs='*', help='arquivos, diretórios ou globs')
+    ap.add_argument('--saida', type=Path, default=None, help='pasta dos relatórios (padrão: baixa_<data>)')
+    ap.add_argument('--processos', type=int, default=None, help='processos do pool (padrão: nº de CPUs)')
+    ap.add_argument('--colaborador', default='CLI')
+    ap.add_argument('--empresa', metavar='ID',
+                    help='empresa de empresas.json: planilha/webhook do 1º depósito, registro, aliases e tarefas dela')
+    ap.add_argument('--sheets-url', default=None, help=f'padrão: {SHEETS_URL}')
+    ap.add_argument('--webhook-url', default=None, help=f'padrão: {WEBHOOK_URL}')
+    modo = ap.add_mutually_exclusive_group()
+    modo.add_argument('--simular', action='store_true', help='roda o loop de baixas em modo teste')
+    modo.add_argument('--aplicar', action='store_true', help='envia as saídas ao webhook (altera planilha)')
+    ap.add_argument('--forcar', action='store_true', help='aplica mesmo arquivos já registrados como aplicados')
+    ap.add_argument('--registro', default=None, help=f'registro JSON das faturas aplicadas (padrão: {REGISTRO_APLICADAS})')
+    ap.add_argument('--aliases', default=None, help=f'JSON de aliases de códigos, fatura -> catálogo (padrão: {ALIASES})')
+    ap.add_argument('--tarefas', default=None, help=f'pasta das tarefas de baixa (padrão: {tarefas.PASTA_PADRAO})')
+    ap.add_argument('--retomar', metavar='ID', help='continua uma tarefa interrompida (ignora as entradas)')
+    ap.add_argument('--incertas', action='store_true',
+                    help='com --retomar, reenvia também as linhas sem resposta do webhook (confira o histórico antes)')
+    args = ap.parse_args(argv)
+    padroes = {'sheets_url': SHEETS_URL, 'webhook_url': WEBHOOK_URL, 'registro': REGISTRO_APLICADAS,
+               'aliases': ALIASES, 'tarefas': tarefas.PASTA_PADRAO}
+    if args.empresa:
+        todas = empresas.carregar_empresas()
+        if args.empresa not in todas:
+            ap.error(f"empresa desconhecida: {args.empresa} (disponíveis: {', '.join(todas)})")
+        e = todas[args.empresa]
+        padroes = {'sheets_url': e['fontes'][0]['url'], 'webhook_url': e['fontes'][0]['webhook'],
+                   'registro': e['registro_aplicadas'], 'aliases': e['aliases'], 'tarefas': e['tarefas']}
+    for opcao, valor in padroes.items():
+        if getattr(args, opcao) is None:
+            setattr(args, opcao, valor)
+
+    fila = tarefas.Tarefas(args.tarefas, registro_aplicadas=args.registro)
+    if args.retomar:
+        if fila.progresso(args.retomar)['estado'] in tarefas.ATIVAS:
+            print(f"A tarefa {args.retomar} está executando em outro processo (app ou CLI).", file=sys.stderr)
+            return 4
+        pasta = args.saida or Path(f"baixa_{datetime.now():%Y%m%d_%H%M%S}")
+        pasta.mkdir(parents=True, exist_ok=True)
+        return executar_tarefa(fila, args.retomar, pasta, args.incertas)
+    if not args.entradas:
+        ap.error('informe os arquivos de faturamento (ou --retomar ID)')
+
+    caminhos = listar_arquivos(args.entradas)
+    if not caminhos:
+        print("Nenhum arquivo CSV/XLS/XLSX encontrado.", file=sys.stderr)
+        return 2
+
+    try:
+        produtos_df = ler_produtos(args.sheets_url)
+    except Exception as e:
+        print(f"Erro ao carregar dados da planilha: {e}", file=sys.stderr)
+        return 2
+
+    lote = processar_lote(caminhos, produtos_df, args.processos, mapa_aliases(args.aliases))
+    pasta = args.saida or Path(f"baixa_{datetime.now():%Y%m%d_%H%M%S}")
+    pasta.mkdir(parents=True, exist_ok=True)
+
+    for nome, erro in lote['erros']:
+        print(f"[erro] {nome}: {erro}", file=sys.stderr)
+    gravar(pd.DataFrame(lote['erros'], columns=['Arquivo', 'Erro']), pasta, 'erros_leitura.csv')
+    gravar(lote['preview'], pasta, 'preview.csv')
+    gravar(lote['proveniencia'], pasta, 'proveniencia.csv')
+    nok = lote['nok']
+    if not nok.empty:
+        nok = nok[['codigo', 'quantidade', 'codigo_key', 'arquivos']]
+        nok.columns = ['Código', 'Quantidade', 'Chave Normalizada', 'Arquivos']
+    gravar(nok, pasta, 'nao_encontrados.csv')
+    if not nok.empty:
+        sug = conciliacao.sugerir(conciliacao.construir_indice(produtos_df), nok['Código'])
+        gravar(sug, pasta, 'sugestoes.csv')
+
+    problemas = validacao.validar(produtos_df)
+    gravar(problemas, pasta, 'integridade_catalogo.csv')
+    ok = lote['ok']
+    for chave in sorted(validacao.chaves_em_colisao(problemas) & set(ok['codigo_key'])):
+        print(f"[aviso] {chave}: chave usada por mais de um SKU do catálogo; a baixa vai para um só deles",
+              file=sys.stderr)
+    print(f"{len(caminhos)} arquivo(s), {len(lote['erros'])} com erro | "
+          f"{len(ok)} encontrados ({len(lote['via_alias'])} por alias), {len(lote['nok'])} não encontrados -> {pasta}")
+
+    digests = {}
+    nomes = nomes_relativos(caminhos)
+    com_erro = {nome for nome, _ in lote['erros']}
+    for c in caminhos:
+        if nomes[c] in com_erro:
+            continue
+        with open(c, 'rb') as f:
+            digests[c] = digest_arquivo(f)
+    repetidos = ja_aplicadas(digests, args.registro)
+    for c, reg in repetidos.items():
+        if reg.get('tarefa'):
+            print(f"[aviso] {c} está na tarefa {reg['tarefa']} (criada em {reg['data_hora']} por "
+                  f"{reg['colaborador']}), ainda não concluída", file=sys.stderr)
+        else:
+            print(f"[aviso] {c} já foi aplicado em {reg['data_hora']} por {reg['colaborador']}", file=sys.stderr)
+    if args.aplicar and repetidos and not args.forcar:
+        print("Arquivos já aplicados; use --forcar para aplicar mesmo assim.", file=sys.stderr)
+        return 3
+
+    if (args.simular or args.aplicar) and not ok.empty:
+        tid = fila.criar(ok, args.colaborador, test_mode=args.simular, webhook_url=args.webhook_url,
+                         digests=digests, rotulo='; '.join(nomes[c] for c in digests))
+        return executar_tarefa(fila, tid, pasta)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
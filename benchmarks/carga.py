@@ -0,0 +1,366 @@
+# benchmarks/carga.py
+"""
+Teste de carga: N sessões simultâneas do streamlit_app.py ou do
+mobile_app.py, sem navegador (AppTest), contra o stand-in local do
+Sheets / webhook (benchmarks/servidor.py).
+
+Cada sessão é uma thread com o seu AppTest que abre o app e segue um
+roteiro sorteado (trocar de página, filtros, busca, upload de
+faturamento, carrinho, relatórios), com uma pausa entre as ações. As
+sessões dividem o processo como num container de verdade: mesmo cache,
+mesmo GIL. Para cada N relata os percentis de latência por rerun (geral
+e por ação), reruns/s, a memória do processo (RSS) por sessão e o tempo
+de cada página / fragmento dentro do script (spans `render` e `fragment`).
+O AppTest sempre reexecuta o script inteiro; o span do fragmento é o que
+um rerun só do fragmento custa no navegador.
+
+  python -m benchmarks.carga --app streamlit_app.py --sessoes 1,5,10,20
+  python -m benchmarks.carga --app mobile_app.py --sessoes 10 --skus 50000 --latencia 0.2
+
+Os apps são apontados para o stand-in por ESTOQUE_SHEETS_URL /
+ESTOQUE_WEBHOOK_URL (ver estoque.py).
+"""
+import argparse
+import contextlib
+import functools
+import gc
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from streamlit.components.v2.component_manager import BidiComponentManager
+from streamlit.logger import set_log_level
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1.util import patch_config_options
+
+from benchmarks.servidor import ServidorLocal
+from benchmarks.sinteticos import arquivo_upload, gerar_catalogo, gerar_fatura, gerar_vendas, para_csv
+
+RAIZ = Path(__file__).resolve().parent.parent
+PERCENTIS = (50, 90, 95, 99)
+
+
+def rss_mb():
+    """RSS atual do processo (Linux); fora dele, o pico (ru_maxrss)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+def runtime_compartilhado():
+    """
+    Runtime falso, cache de bytecode e `global.appTest` fixos para o
+    processo todo, como no servidor real. O AppTest troca os três a cada
+    run: com sessões em paralelo, uma derrubaria o runtime da outra (e o
+    registro dos widgets), e cada rerun recompilaria o script (o ast.parse
+    concorrente ainda quebra no Python 3.11).
+    """
+    rt = mock.MagicMock(spec=Runtime)
+    rt.media_file_mgr = MediaFileManager(MemoryMediaFileStorage('/mock/media'))
+    rt.dataframe_source_mgr = DataframeSourceManager()
+    rt.cache_storage_manager = MemoryCacheStorageManager()
+    cache_script = ScriptCache()
+    pilha = contextlib.ExitStack()
+    pilha.enter_context(mock.patch.multiple(Runtime, instance=classmethod(lambda cls: rt),
+                                            exists=classmethod(lambda cls: True)))
+    pilha.enter_context(patch_config_options({'global.appTest': True}))
+    pilha.enter_context(mock.patch('streamlit.testing.v1.app_test.patch_config_options',
+                                   lambda opcoes: contextlib.nullcontext()))
+    for modulo in ('app_test', 'local_script_runner'):
+        pilha.enter_context(mock.patch(f'streamlit.testing.v1.{modulo}.ScriptCache', lambda: cache_script))
+    return pilha
+
+
+@functools.cache
+def componentes():
+    """Registro de componentes, um só (o AppTest varre os pacotes instalados a cada sessão nova)."""
+    registro = BidiComponentManager()
+    registro.discover_and_register_components(start_file_watching=False)
+    return registro
+
+
+def _por_rotulo(widgets, inicio):
+    return next(w for w in widgets if str(w.label).startswith(inicio))
+
+
+# ======================
+# ROTEIROS
+# ======================
+# Cada ação recebe a sessão e faz um ou mais reruns via `sessao.rerun(nome, widget)`.
+def _ir_para(s, pagina):
+    radio = s.at.sidebar.radio[0]
+    if radio.value != pagina:
+        s.rerun('pagina', radio.set_value(pagina))
+
+
+def cockpit_pagina(s):
+    radio = s.at.sidebar.radio[0]
+    s.rerun('pagina', radio.set_value(s.rng.choice([p for p in radio.options if p != radio.value])))
+
+
+def cockpit_categoria(s):
+    sel = _por_rotulo(s.at.sidebar.selectbox, '📂')
+    s.rerun('categoria', sel.set_value(s.rng.choice(sel.options)))
+
+
+def cockpit_status(s):
+    sel = _por_rotulo(s.at.sidebar.selectbox, '🚦')
+    s.rerun('status', sel.set_value(s.rng.choice(sel.options)))
+
+
+def cockpit_busca(s):
+    _ir_para(s, 'Movimentação')
+    s.rerun('busca', _por_rotulo(s.at.text_input, '🔍').set_value(s.rng.choice(s.dados['codigos'])[-4:]))
+
+
+def cockpit_faturamento(s):
+    # o file_uploader é substituído pelo arquivo de faturamento sintético (ver _uploader)
+    radio = s.at.sidebar.radio[0]
+    s.rerun('faturamento', radio.set_value('Baixa por Faturamento'))
+
+
+def cockpit_carrinho(s):
+    _ir_para(s, 'Movimentação')
+    s.rerun('busca', _por_rotulo(s.at.text_input, '🔍').set_value(s.rng.choice(s.dados['codigos'])[-4:]))
+    entrada = [b for b in s.at.button if str(b.label) == '+ Entrada']
+    if entrada:
+        s.rerun('carrinho_adicionar', entrada[0].click())
+        confirmar = [b for b in s.at.button if str(b.label).startswith('✅ CONFIRMAR')]
+        if confirmar and not confirmar[0].disabled:
+            s.rerun('carrinho_confirmar', confirmar[0].click())   # webhook + limpa o cache de todos
+
+
+def cockpit_min_max(s):
+    _ir_para(s, 'Análise Mín/Máx')
+    if s.rng.random() < 0.5:
+        s.rerun('min_max', s.at.checkbox[-1].set_value(not s.at.checkbox[-1].value))
+    else:
+        sel = _por_rotulo(s.at.selectbox, 'Tipo de Análise')
+        s.rerun('min_max', sel.set_value(s.rng.choice(sel.options)))
+
+
+def mobile_categoria(s):
+    sel = s.at.selectbox(key='mobile_cat')
+    s.rerun('categoria', sel.set_value(s.rng.choice(sel.options)))
+
+
+def mobile_status(s):
+    sel = s.at.selectbox(key='mobile_status')
+    s.rerun('status', sel.set_value(s.rng.choice(sel.options)))
+
+
+def mobile_busca(s):
+    s.rerun('busca', s.at.text_input(key='mobile_search').set_value(s.rng.choice(s.dados['codigos'])[-4:]))
+
+
+def mobile_relatorio(s):
+    s.rerun('relatorio', s.at.button(key=s.rng.choice(['rel1', 'rel2'])).click())
+
+
+# app -> {ação: (peso, função)}
+ROTEIROS = {
+    'streamlit_app.py': {
+        'pagina': (3, cockpit_pagina),
+        'categoria': (2, cockpit_categoria),
+        'status': (1, cockpit_status),
+        'busca': (3, cockpit_busca),
+        'faturamento': (1, cockpit_faturamento),
+        'min_max': (1, cockpit_min_max),
+        'carrinho': (0.3, cockpit_carrinho),
+    },
+    'mobile_app.py': {
+        'categoria': (2, mobile_categoria),
+        'status': (2, mobile_status),
+        'busca': (3, mobile_busca),
+        'relatorio': (1, mobile_relatorio),
+    },
+}
+
+
+# ======================
+# SESSÃO
+# ======================
+class Sessao(threading.Thread):
+    """Um operador: abre o app e executa `acoes` ações sorteadas do roteiro."""
+
+    def __init__(self, app, roteiro, dados, acoes, pausa, timeout, seed, largada):
+        super().__init__(daemon=True)
+        self.app = app
+        self.roteiro = roteiro
+        self.dados = dados
+        self.acoes = acoes
+        self.pausa = pausa
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.largada = largada
+        self.at = None
+        self.latencias = []      # (ação, segundos)
+        self.erros = []
+
+    def rerun(self, acao, widget):
+        t0 = time.perf_counter()
+        widget.run(timeout=self.timeout)
+        self.latencias.append((acao, time.perf_counter() - t0))
+        if self.at.exception:
+            raise RuntimeError(f"{acao}: {self.at.exception[0].message}")
+
+    def run(self):
+        nomes = list(self.roteiro)
+        pesos = [self.roteiro[n][0] for n in nomes]
+        try:
+            self.at = AppTest.from_file(self.app, default_timeout=self.timeout)
+            self.at._bidi_component_manager = componentes()
+            self.largada.wait()
+            self.rerun('abrir', self.at)
+            for _ in range(self.acoes):
+                time.sleep(self.rng.uniform(0, 2 * self.pausa))
+                self.roteiro[self.rng.choices(nomes, pesos)[0]][1](self)
+        except Exception as e:
+            self.erros.append(f"{type(e).__name__}: {e}")
+
+
+def _uploader(fatura, vendas):
+    """file_uploader de mentira: faturamento (múltiplos arquivos) ou vendas (um arquivo)."""
+    def file_uploader(*args, accept_multiple_files=False, **kwargs):
+        if accept_multiple_files:
+            return [arquivo_upload(fatura)]
+        return arquivo_upload(vendas, 'vendas.csv')
+    return file_uploader
+
+
+def percentis(valores):
+    if not valores:
+        return {f"p{p}": None for p in PERCENTIS} | {'max': None}
+    ms = np.asarray(valores) * 1000
+    return {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTIS} | {'max': float(ms.max())}
+
+
+def rodada(app, roteiro, dados, n, args):
+    """N sessões ao mesmo tempo; retorna o resumo da rodada."""
+    import metricas     # o app já importou, com ESTOQUE_METRICAS=1 (ver main)
+    metricas.resetar()
+    gc.collect()
+    rss_antes = rss_mb()
+    largada = threading.Event()
+    sessoes = [Sessao(app, roteiro, dados, args.acoes, args.pausa, args.timeout, args.seed + i, largada)
+               for i in range(n)]
+    for s in sessoes:
+        s.start()
+    t0 = time.perf_counter()
+    largada.set()
+    for s in sessoes:
+        s.join()
+    duracao = time.perf_counter() - t0
+    rss_depois = rss_mb()          # as sessões (AppTest + session_state) ainda vivas
+
+    lat = [(a, t) for s in sessoes for a, t in s.latencias]
+    por_acao = {}
+    for a, t in lat:
+        por_acao.setdefault(a, []).append(t)
+    resumo = {
+        'sessoes': n,
+        'reruns': len(lat),
+        'reruns_por_s': len(lat) / duracao if duracao else None,
+        'duracao_s': duracao,
+        'latencia_ms': percentis([t for _, t in lat]),
+        'por_acao': {a: {'reruns': len(v), **percentis(v)} for a, v in sorted(por_acao.items())},
+        'rss_mb': rss_depois,
+        'mb_por_sessao': (rss_depois - rss_antes) / n,
+        'erros': [e for s in sessoes for e in s.erros],
+        # tempo de cada página / fragmento dentro do script (spans de metricas.py)
+        'spans': {f"{m['estagio']}/{m['rotulo']}": {k: m[k] for k in ('contagem', 'p50_ms', 'p95_ms', 'max_ms')}
+                  for m in metricas.resumo() if m['estagio'] in ('render', 'fragment')},
+    }
+    del sessoes
+    gc.collect()
+    return resumo
+
+
+def imprimir(r, detalhe):
+    lat = r['latencia_ms']
+    print(f"{r['sessoes']:>4} sessões  {r['reruns']:>5} reruns  {r['reruns_por_s']:6.1f}/s  "
+          + '  '.join(f"{k} {v:7.0f}" for k, v in lat.items() if v is not None)
+          + f" ms  RSS {r['rss_mb']:7.1f} MB  {r['mb_por_sessao']:6.1f} MB/sessão  erros {len(r['erros'])}")
+    if detalhe:
+        for a, p in r['por_acao'].items():
+            print(f"        {a:<20} {p['reruns']:>5}x  p50 {p['p50']:7.0f}  p95 {p['p95']:7.0f}  max {p['max']:7.0f} ms")
+        for nome, m in sorted(r['spans'].items()):
+            print(f"        [{nome:<26}] {m['contagem']:>5}x  p50 {m['p50_ms']:7.0f}  p95 {m['p95_ms']:7.0f}  max {m['max_ms']:7.0f} ms")
+    for e in r['erros'][:3]:
+        print(f"        ! {e}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--app', default='streamlit_app.py', choices=sorted(ROTEIROS))
+    ap.add_argument('--sessoes', default='1,5,10', help='nº de sessões simultâneas por rodada (vírgula)')
+    ap.add_argument('--acoes', type=int, default=15, help='ações por sessão (fora a abertura)')
+    ap.add_argument('--pausa', type=float, default=0.5, help='pausa média entre ações, em s')
+    ap.add_argument('--skus', type=int, default=10_000)
+    ap.add_argument('--linhas-fatura', type=int, default=500)
+    ap.add_argument('--latencia', type=float, default=0.0, help='latência do Sheets local, em s')
+    ap.add_argument('--latencia-webhook', type=float, default=0.0)
+    ap.add_argument('--timeout', type=float, default=120, help='limite por rerun, em s')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--detalhe', action='store_true', help='percentis por ação')
+    ap.add_argument('--salvar', type=Path, default=None, help='pasta para gravar o JSON da execução')
+    args = ap.parse_args()
+
+    catalogo = gerar_catalogo(args.skus)
+    dados = {'codigos': catalogo['codigo'].astype(str).tolist()}
+    uploader = _uploader(gerar_fatura(catalogo, args.linhas_fatura), gerar_vendas(catalogo, args.linhas_fatura))
+    pasta_tmp = tempfile.mkdtemp(prefix='carga_')
+
+    with ServidorLocal(para_csv(catalogo), latencia=args.latencia, latencia_webhook=args.latencia_webhook) as srv:
+        # antes do 1º import de estoque (o app importa na abertura da 1ª sessão)
+        ambiente = {
+            'ESTOQUE_SHEETS_URL': srv.sheets_url,
+            'ESTOQUE_WEBHOOK_URL': srv.webhook_url,
+            'ESTOQUE_FONTES': os.path.join(pasta_tmp, 'sem_fontes.json'),
+            'ESTOQUE_LINHA_DO_TEMPO': os.path.join(pasta_tmp, 'linha_do_tempo'),
+            'ESTOQUE_ALERTAS': '',
+            'ESTOQUE_METRICAS': '1',
+        }
+        app = str(RAIZ / args.app)
+        roteiro = ROTEIROS[args.app]
+        resultado = {'app': args.app, 'skus': args.skus, 'acoes': args.acoes, 'pausa': args.pausa,
+                     'data': datetime.now().isoformat(timespec='seconds'), 'rodadas': []}
+        set_log_level('error')     # avisos de thread sem ScriptRunContext etc. a cada rerun
+        with mock.patch.dict(os.environ, ambiente), mock.patch('streamlit.file_uploader', uploader), \
+                runtime_compartilhado():
+            # aquecimento (imports, cache): fora da medição
+            aquecida = threading.Event()
+            aquecida.set()
+            Sessao(app, roteiro, dados, 3, 0, args.timeout, -1, aquecida).run()
+            print(f"{args.app}: {args.skus} SKUs, {args.acoes} ações/sessão, pausa média {args.pausa:g}s")
+            for n in [int(x) for x in args.sessoes.split(',')]:
+                r = rodada(app, roteiro, dados, n, args)
+                resultado['rodadas'].append(r)
+                imprimir(r, args.detalhe)
+        resultado['chamadas_servidor'] = dict(srv.chamadas)
+
+    if args.salvar:
+        args.salvar.mkdir(parents=True, exist_ok=True)
+        arq = args.salvar / f"carga_{Path(args.app).stem}_{datetime.now():%Y%m%d_%H%M%S}.json"
+        arq.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+        print(f"\nResultados gravados em {arq}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# benchmarks/importacao.py
+"""
+Tempo de import a frio (interpretador novo por medição) das dependências
+dos apps, para acompanhar o custo de cold start.
+
+  python -m benchmarks.importacao --repeticoes 5
+
+Mostra a mediana de cada grupo (medida depois do import base, que o
+Streamlit paga de qualquer jeito) e confirma que importar os módulos do
+app não carrega plotly.express (só a montagem de um gráfico carrega).
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+BASE = 'import streamlit, pandas, requests'
+MODULOS = 'import estoque, filtros, resumo, graficos, metricas, painel_metricas'
+
+# nome -> (preâmbulo não medido, trecho medido)
+GRUPOS = {
+    'base (streamlit+pandas+requests)': ('', BASE),
+    'módulos do app': (BASE, MODULOS),
+    'plotly.express': (BASE, 'import plotly.express'),
+    '1º gráfico (pizza)': (BASE + '; ' + MODULOS,
+                           'graficos.pizza_status(pandas.Series({"OK": 1}), {})'),
+}
+
+
+def medir(preambulo, codigo):
+    """Segundos do trecho num interpretador novo; e se plotly.express foi carregado."""
+    script = (preambulo + "\nimport time; t0 = time.perf_counter()\n" + codigo +
+              "\nimport sys; print(time.perf_counter() - t0, 'plotly.express' in sys.modules)")
+    out = subprocess.check_output([sys.executable, '-c', script], text=True).split()
+    return float(out[-2]), out[-1] == 'True'
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--repeticoes', type=int, default=5)
+    args = ap.parse_args()
+
+    for nome, (preambulo, codigo) in GRUPOS.items():
+        tempos, plotly = [], False
+        for _ in range(args.repeticoes):
+            t, plotly = medir(preambulo, codigo)
+            tempos.append(t)
+        print(f"{nome:<34} mediana {statistics.median(tempos)*1000:8.1f} ms   plotly.express: {'sim' if plotly else 'não'}")
+
+
+if __name__ == '__main__':
+    main()
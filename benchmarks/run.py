@@ -0,0 +1,261 @@
+# benchmarks/run.py
+"""
+Mede tempo e pico de memória das rotinas críticas com dados sintéticos e
+o stand-in local (sem rede):
+
+  carregar_produtos (e recarga sem mudanças), parse do CSV do catálogo,
+  leitura com pushdown na gviz (colunas + categoria), normalize_key,
+  expandir_kits, kits montáveis, ciclo de alertas, linha do tempo
+  (gravar delta / reconstruir instante), exportações (CSV / XLSX até
+  20k linhas / Parquet), processar_faturamento, sugestões para os códigos
+  não encontrados (índice de trigramas / consulta em lote), relatório de
+  faltantes, baixa em lote (direta e como tarefa com diário por linha),
+  o cache compartilhado entre empresas (medida de tamanho + despejo LRU),
+  a verificação de integridade do catálogo e a conciliação com o
+  historico_baixas (reprodução completa / incremental de 1.000 linhas).
+
+Cada execução grava benchmarks/resultados/<data>_<commit>.json e compara
+com o último resultado de outra versão, marcando regressões acima da
+tolerância.
+
+Uso (na raiz do repositório):
+  python -m benchmarks.run
+  python -m benchmarks.run --tamanhos 1000,100000,1000000 --repeticoes 5
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import alertas
+import cache_memoria
+import conciliacao
+import consulta
+import estoque
+import exportar
+import kits
+import linha_do_tempo
+import razao
+import tarefas
+import validacao
+from benchmarks.servidor import ServidorLocal
+from benchmarks.sinteticos import (
+    arquivo_upload, gerar_catalogo, gerar_fatura, gerar_historico, gerar_vendas, para_csv
+)
+
+PASTA_RESULTADOS = Path(__file__).parent / 'resultados'
+
+
+def medir(fn, repeticoes=3):
+    """Retorna (tempos em s, pico de memória em MB, último resultado)."""
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        gc.collect()
+        t0 = time.perf_counter()
+        resultado = fn()
+        tempos.append(time.perf_counter() - t0)
+
+    # pico medido em rodada separada: tracemalloc distorce o tempo
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tempos, pico / 2**20, resultado
+
+
+def versao_codigo():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return 'desconhecida'
+
+
+def casos(n, linhas_fatura, linhas_baixa, latencia_webhook):
+    """Gera os dados de um tamanho e devolve [(nome, callable)] + servidor."""
+    catalogo = gerar_catalogo(n)
+    fatura = gerar_fatura(catalogo, linhas_fatura)
+    vendas = gerar_vendas(catalogo, linhas_fatura)
+    historico_csv = para_csv(gerar_historico(catalogo, min(n, 100_000)))
+    srv = ServidorLocal(
+        para_csv(catalogo),
+        abas={'historico_baixas': historico_csv},
+        latencia_webhook=latencia_webhook,
+    ).iniciar()
+
+    produtos = estoque.ler_produtos(srv.sheets_url)
+    catalogo_csv = para_csv(catalogo)
+    fatura_norm = fatura.rename(columns={'Código': 'codigo', 'Quantidade': 'quantidade'})
+    ok, nok, erro = estoque.processar_faturamento(arquivo_upload(fatura), produtos)
+    if erro:
+        raise RuntimeError(erro)
+    lote = ok.head(linhas_baixa).reset_index(drop=True)
+    indice_codigos = conciliacao.construir_indice(produtos)
+
+    motor_alertas = alertas.MotorAlertas(alertas.SinkArquivo(os.devnull), intervalo_sku=0)
+    alterado = produtos.copy()
+    alterado.loc[alterado.index[:100], 'estoque_atual'] = 0
+    alterado.attrs['versao'] = 'alterado'
+    motor_alertas.avaliar('benchmark', produtos)
+
+    fila = tarefas.Tarefas(tempfile.mkdtemp(prefix='bench_tarefas_'), registro_aplicadas=os.devnull)
+
+    def baixa_em_tarefa():
+        tid = fila.criar(lote, 'benchmark', webhook_url=srv.webhook_url)
+        return fila.executar(tid)
+
+    ldt = linha_do_tempo.LinhaDoTempo(tempfile.mkdtemp(prefix='bench_ldt_'))
+    ldt.registrar('benchmark', produtos)
+    versoes = iter(range(10**9))
+
+    def gravar_delta():
+        alterado.attrs['versao'] = f"ldt_{next(versoes)}"
+        return ldt.registrar('benchmark', alterado)
+
+    # orçamento para 3 catálogos: as duas empresas ativas ficam, as paradas se revezam na vaga que sobra
+    cache = cache_memoria.CacheLRU(orcamento=int(3.5 * cache_memoria.tamanho(produtos)))
+    ids_empresas = [f"empresa_{i}" for i in range(4)]
+
+    def cache_empresas():
+        for ociosa in ids_empresas[2:] * 2:
+            for e in (*ids_empresas[:2], ociosa):
+                cache.obter((e, 'catalogo'), produtos.copy)
+        return cache.estatisticas()
+
+    historico = estoque.ler_csv(historico_csv)
+    razao_mem = razao.Razao(caminho=None)
+    razao_mem.atualizar(historico.iloc[:-1000])
+    checkpoint = razao_mem.checkpoint
+
+    def razao_completo():
+        return razao.conciliar(razao.Razao(caminho=None).atualizar(historico)['saldos'], produtos)
+
+    def razao_incremental():
+        razao_mem.checkpoint = checkpoint
+        return razao.conciliar(razao_mem.atualizar(historico)['saldos'], produtos)
+
+    colunas_mobile = ['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'estoque_max', 'custo_unitario']
+    filtro_cat = [consulta.categoria_igual(catalogo['categoria'].iloc[0])]
+
+    lista = [
+        ('carregar_produtos', lambda: (estoque.esquecer_parseados(), estoque.ler_produtos(srv.sheets_url))),
+        ('recarga_inalterada', lambda: estoque.ler_produtos(srv.sheets_url)),
+        ('parse_catalogo', lambda: estoque.ler_csv(catalogo_csv, estoque.COLUNAS_CATALOGO)),
+        ('gviz_pushdown', lambda: consulta.ler_planilha(srv.sheets_url, colunas_mobile, filtro_cat)),
+        ('normalize_key', lambda: catalogo['codigo'].astype(str).map(estoque.normalize_key)),
+        ('expandir_kits', lambda: estoque.expandir_kits(fatura_norm, produtos)),
+        ('kits_montaveis', lambda: kits.disponibilidade(produtos)),
+        ('alertas_ciclo', lambda: (motor_alertas.avaliar('benchmark', alterado),
+                                   motor_alertas.avaliar('benchmark', produtos))),
+        ('linha_do_tempo_delta', gravar_delta),
+        ('linha_do_tempo_instante', lambda: ldt.catalogo_em('benchmark')),
+        ('exportar_csv', lambda: exportar.exportar(produtos, 'CSV')),
+        ('exportar_xlsx', lambda: exportar.exportar(produtos.head(20_000), 'XLSX')),
+        ('exportar_parquet', lambda: exportar.exportar(produtos, 'Parquet')),
+        ('processar_faturamento', lambda: estoque.processar_faturamento(arquivo_upload(fatura), produtos)),
+        ('indice_codigos', lambda: conciliacao.construir_indice(produtos)),
+        ('sugerir_codigos', lambda: conciliacao.sugerir(indice_codigos, nok['codigo'])),
+        ('relatorio_faltantes', lambda: estoque.relatorio_faltantes(vendas, produtos)),
+        ('baixa_em_lote', lambda: estoque.aplicar_baixas(lote, 'benchmark', webhook_url=srv.webhook_url)),
+        ('baixa_em_tarefa', baixa_em_tarefa),
+        ('cache_empresas', cache_empresas),
+        ('validar_catalogo', lambda: validacao.validar(produtos)),
+        ('razao_completo', razao_completo),
+        ('razao_incremental', razao_incremental),
+    ]
+    return lista, srv
+
+
+def comparar(atual, anterior, tolerancia):
+    """Imprime a razão atual/anterior (tempo mínimo) por caso; retorna nº de regressões."""
+    ref = {(c['caso'], c['n']): c for c in anterior['casos']}
+    regressoes = 0
+    print(f"\nComparação com {anterior['versao']} ({anterior['data']}):")
+    for c in atual['casos']:
+        r = ref.get((c['caso'], c['n']))
+        if not r or not r['tempo_min_s']:
+            continue
+        razao = c['tempo_min_s'] / r['tempo_min_s']
+        marca = '  <-- REGRESSÃO' if razao > 1 + tolerancia else ''
+        regressoes += bool(marca)
+        print(f"  {c['caso']:<22} n={c['n']:>8}  {razao:5.2f}x tempo  "
+              f"{c['pico_mb']:8.1f} MB (antes {r['pico_mb']:.1f}){marca}")
+    return regressoes
+
+
+def referencia(pasta, versao):
+    """Último resultado de outra versão do código (ou o último, se só houver esta)."""
+    arquivos = sorted(pasta.glob('*.json')) if pasta.exists() else []
+    dados = [json.loads(a.read_text()) for a in arquivos]
+    outras = [d for d in dados if d.get('versao') != versao]
+    return (outras or dados or [None])[-1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--tamanhos', default='1000,10000,100000', help='SKUs por catálogo, separados por vírgula')
+    ap.add_argument('--repeticoes', type=int, default=3)
+    ap.add_argument('--linhas-fatura', type=int, default=5000)
+    ap.add_argument('--linhas-baixa', type=int, default=200, help='linhas enviadas ao webhook local')
+    ap.add_argument('--latencia-webhook', type=float, default=0.0)
+    ap.add_argument('--casos', default='', help='filtra casos por nome (vírgula)')
+    ap.add_argument('--tolerancia', type=float, default=0.2, help='0.2 = 20%% mais lento é regressão')
+    ap.add_argument('--saida', type=Path, default=PASTA_RESULTADOS)
+    ap.add_argument('--nao-salvar', action='store_true')
+    args = ap.parse_args()
+
+    filtro = {c.strip() for c in args.casos.split(',') if c.strip()}
+    resultado = {
+        'versao': versao_codigo(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'casos': [],
+    }
+
+    for n in [int(t) for t in args.tamanhos.split(',')]:
+        lista, srv = casos(n, args.linhas_fatura, args.linhas_baixa, args.latencia_webhook)
+        try:
+            for nome, fn in lista:
+                if filtro and nome not in filtro:
+                    continue
+                tempos, pico, _ = medir(fn, args.repeticoes)
+                caso = {
+                    'caso': nome, 'n': n,
+                    'tempo_min_s': min(tempos),
+                    'tempo_mediana_s': statistics.median(tempos),
+                    'pico_mb': pico,
+                }
+                resultado['casos'].append(caso)
+                print(f"{nome:<22} n={n:>8}  mediana {caso['tempo_mediana_s']*1000:10.1f} ms  "
+                      f"min {caso['tempo_min_s']*1000:10.1f} ms  pico {pico:8.1f} MB")
+        finally:
+            srv.parar()
+
+    regressoes = 0
+    anterior = referencia(args.saida, resultado['versao'])
+    if anterior:
+        regressoes = comparar(resultado, anterior, args.tolerancia)
+
+    if not args.nao_salvar:
+        args.saida.mkdir(parents=True, exist_ok=True)
+        arq = args.saida / f"{datetime.now():%Y%m%d_%H%M%S}_{resultado['versao']}.json"
+        arq.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+        print(f"\nResultados gravados em {arq}")
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,240 @@
+# benchmarks/servidor.py
+"""
+Stand-in HTTP local do Google Sheets e do webhook do Apps Script.
+
+  GET  /spreadsheets/d/<id>/export?format=csv          -> catálogo (CSV)
+  GET  /spreadsheets/d/<id>/gviz/tq?tqx=out:csv&sheet=X -> aba X (CSV)
+       ...&tq=select A, C where B = 'x' and E < F limit N -> subconjunto
+  POST /macros/s/<id>/exec                             -> movimentação (JSON)
+
+Latência e taxa de erro configuráveis, para medir o app sem rede.
+Uso avulso: python -m benchmarks.servidor --skus 10000 --porta 8765
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PLANILHA_ID = 'planilha-local'
+SCRIPT_ID = 'script-local'
+
+
+class ServidorLocal:
+    """
+    Servidor em thread. `abas` = {nome: bytes CSV}; a aba 'produtos' é a
+    servida pelo export. `suporta_tq=False` faz a gviz recusar queries
+    (testa o fallback local). Use como context manager.
+    """
+
+    def __init__(self, catalogo_csv, abas=None, latencia=0.0, latencia_webhook=0.0,
+                 taxa_erro=0.0, taxa_falha_http=0.0, porta=0, seed=0, suporta_tq=True):
+        self.abas = dict(abas or {})
+        self.abas['produtos'] = catalogo_csv
+        self.latencia = latencia
+        self.latencia_webhook = latencia_webhook
+        self.taxa_erro = taxa_erro
+        self.taxa_falha_http = taxa_falha_http
+        self.suporta_tq = suporta_tq
+        self.chamadas = {'export': 0, 'gviz': 0, 'webhook': 0}
+        self.bytes_enviados = {'export': 0, 'gviz': 0}
+        self.movimentos = []
+        self._estoque = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', porta), self._handler())
+        self._thread = None
+
+    # ---------- URLs ----------
+    @property
+    def base_url(self):
+        host, porta = self._httpd.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    @property
+    def sheets_url(self):
+        return f"{self.base_url}/spreadsheets/d/{PLANILHA_ID}/export?format=csv"
+
+    def gviz_url(self, aba):
+        return f"{self.base_url}/spreadsheets/d/{PLANILHA_ID}/gviz/tq?tqx=out:csv&sheet={aba}"
+
+    @property
+    def webhook_url(self):
+        return f"{self.base_url}/macros/s/{SCRIPT_ID}/exec"
+
+    # ---------- ciclo de vida ----------
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+    # ---------- gviz tq ----------
+    def _consultar(self, dados, tq):
+        """Subconjunto da linguagem de query da gviz: select / where (and) / limit."""
+        m = re.fullmatch(r"\s*select\s+(.+?)(?:\s+where\s+(.+?))?(?:\s+limit\s+(\d+))?\s*", tq, re.I)
+        if not m:
+            raise ValueError(f"query inválida: {tq}")
+        linhas = list(csv.reader(io.StringIO(dados.decode('utf-8'))))
+        cab, corpo = linhas[0], linhas[1:]
+
+        def idx(letra):
+            i = 0
+            for ch in letra:
+                i = i * 26 + ord(ch) - 64
+            if not 0 < i <= len(cab):
+                raise ValueError(f"coluna inválida: {letra}")
+            return i - 1
+
+        sel = list(range(len(cab))) if m.group(1).strip() == '*' else [idx(c.strip()) for c in m.group(1).split(',')]
+        if m.group(2):
+            conds = re.findall(r"([A-Z]+)\s*(!=|<=|>=|=|<|>)\s*([A-Z]+|'[^']*'|\"[^\"]*\"|-?[\d.]+)", m.group(2))
+            for esq, op, dir_ in conds:
+                i = idx(esq)
+                if dir_[0] in '\'"':
+                    valor, numerico = (lambda _: dir_[1:-1]), False
+                elif dir_[0].isalpha():
+                    j = idx(dir_)
+                    valor, numerico = (lambda r, j=j: r[j]), True
+                else:
+                    valor, numerico = (lambda _: dir_), True
+                corpo = [r for r in corpo if _comparar(r[i], op, valor(r), numerico)]
+        if m.group(3):
+            corpo = corpo[:int(m.group(3))]
+        out = io.StringIO()
+        w = csv.writer(out, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        w.writerow([cab[i] for i in sel])
+        w.writerows([[r[i] for i in sel] for r in corpo])
+        return out.getvalue().encode('utf-8')
+
+    # ---------- webhook ----------
+    def _movimentar(self, payload):
+        if self._estoque is None:
+            import pandas as pd
+            from io import BytesIO
+            df = pd.read_csv(BytesIO(self.abas['produtos']), usecols=['codigo', 'estoque_atual'])
+            self._estoque = dict(zip(df['codigo'].astype(str), df['estoque_atual']))
+        codigo = str(payload.get('codigo', ''))
+        if codigo not in self._estoque:
+            return {'success': False, 'message': f'Código {codigo} não encontrado'}
+        qtd = int(payload.get('quantidade', 0))
+        sinal = 1 if payload.get('tipo') == 'entrada' else -1
+        self._estoque[codigo] = int(self._estoque[codigo]) + sinal * qtd
+        self.movimentos.append(payload)
+        return {'success': True, 'message': 'OK', 'novo_estoque': self._estoque[codigo]}
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, corpo, tipo):
+                self.send_response(status)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if servidor.latencia:
+                    time.sleep(servidor.latencia)
+                if url.path.endswith('/export'):
+                    servidor.chamadas['export'] += 1
+                    servidor.bytes_enviados['export'] += len(servidor.abas['produtos'])
+                    return self._responder(200, servidor.abas['produtos'], 'text/csv; charset=utf-8')
+                if url.path.endswith('/gviz/tq'):
+                    servidor.chamadas['gviz'] += 1
+                    qs = parse_qs(url.query)
+                    aba = qs.get('sheet', ['produtos'])[0]
+                    if aba not in servidor.abas:
+                        return self._responder(400, b'Invalid sheet', 'text/plain')
+                    corpo = servidor.abas[aba]
+                    if 'tq' in qs:
+                        if not servidor.suporta_tq:
+                            return self._responder(400, b'Invalid query', 'text/plain')
+                        try:
+                            corpo = servidor._consultar(corpo, qs['tq'][0])
+                        except ValueError as e:
+                            return self._responder(400, str(e).encode(), 'text/plain')
+                    servidor.bytes_enviados['gviz'] += len(corpo)
+                    return self._responder(200, corpo, 'text/csv; charset=utf-8')
+                self._responder(404, b'not found', 'text/plain')
+
+            def do_POST(self):
+                if not urlparse(self.path).path.endswith('/exec'):
+                    return self._responder(404, b'not found', 'text/plain')
+                tamanho = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(tamanho) or b'{}')
+                if servidor.latencia_webhook:
+                    time.sleep(servidor.latencia_webhook)
+                with servidor._lock:
+                    servidor.chamadas['webhook'] += 1
+                    sorteio = servidor._rng.random()
+                    if sorteio < servidor.taxa_falha_http:
+                        # Apps Script fora do ar devolve HTML, não JSON
+                        return self._responder(500, b'<html>Erro interno</html>', 'text/html')
+                    if sorteio < servidor.taxa_falha_http + servidor.taxa_erro:
+                        resp = {'success': False, 'message': 'Erro simulado'}
+                    else:
+                        resp = servidor._movimentar(payload)
+                self._responder(200, json.dumps(resp).encode(), 'application/json')
+
+        return Handler
+
+
+def _comparar(a, op, b, numerico):
+    if numerico:
+        try:
+            a, b = float(a), float(b)
+        except ValueError:
+            return False
+    return {'=': a == b, '!=': a != b, '<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b}[op]
+
+
+def main():
+    from benchmarks.sinteticos import gerar_catalogo, gerar_historico, para_csv
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--skus', type=int, default=10_000)
+    ap.add_argument('--porta', type=int, default=8765)
+    ap.add_argument('--latencia', type=float, default=0.0, help='segundos por GET')
+    ap.add_argument('--latencia-webhook', type=float, default=0.0, help='segundos por POST')
+    ap.add_argument('--taxa-erro', type=float, default=0.0, help='fração de respostas success=False')
+    ap.add_argument('--taxa-falha-http', type=float, default=0.0, help='fração de HTTP 500')
+    args = ap.parse_args()
+
+    catalogo = gerar_catalogo(args.skus)
+    srv = ServidorLocal(
+        para_csv(catalogo),
+        abas={'historico_baixas': para_csv(gerar_historico(catalogo, args.skus))},
+        latencia=args.latencia, latencia_webhook=args.latencia_webhook,
+        taxa_erro=args.taxa_erro, taxa_falha_http=args.taxa_falha_http, porta=args.porta,
+    )
+    print(f"Sheets : {srv.sheets_url}")
+    print(f"gviz   : {srv.gviz_url('historico_baixas')}")
+    print(f"Webhook: {srv.webhook_url}")
+    try:
+        srv._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# benchmarks/sinteticos.py
+"""
+Gerador de dados sintéticos: catálogo (1k–1M SKUs, com kits e códigos
+acentuados), arquivos de faturamento/vendas e histórico de baixas.
+Mesma seed -> mesmos dados, para medições repetíveis.
+"""
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# prefixos com acento/ç: exercitam normalize_key (ex.: "AÇO-1" ~ "ACO-1")
+PREFIXOS = ['P', 'AÇO', 'PÉ', 'MÃE', 'CAFÉ', 'MAÇÃ', 'TÊNIS', 'SOFÁ']
+PREFIXOS_SEM_ACENTO = ['P', 'ACO', 'PE', 'MAE', 'CAFE', 'MACA', 'TENIS', 'SOFA']
+
+
+def gerar_catalogo(n, frac_kits=0.05, n_categorias=40, frac_acentos=0.2, seed=42):
+    """Catálogo no formato da planilha (inclui colunas de kits)."""
+    rng = np.random.default_rng(seed)
+    n_kits = int(n * frac_kits)
+    n_simples = n - n_kits
+
+    pref = np.where(rng.random(n_simples) < frac_acentos,
+                    rng.integers(1, len(PREFIXOS), n_simples), 0)
+    codigos = [f"{PREFIXOS[p]}-{i:07d}" for i, p in enumerate(pref)]
+    codigos += [f"KIT-{i:07d}" for i in range(n_kits)]
+
+    minimo = rng.integers(0, 50, n)
+    df = pd.DataFrame({
+        'codigo': codigos,
+        'nome': [f"Produto {i}" for i in range(n)],
+        'categoria': [f"Categoria {c:03d}" for c in rng.integers(0, n_categorias, n)],
+        'estoque_atual': rng.integers(0, 200, n),
+        'estoque_min': minimo,
+        'estoque_max': minimo * 2 + rng.integers(0, 100, n),
+        'custo_unitario': np.round(rng.random(n) * 100, 2),
+        'eh_kit': [''] * n_simples + ['sim'] * n_kits,
+        'componentes': [''] * n,
+        'quantidades': [''] * n,
+    })
+
+    if n_kits and n_simples:
+        tamanhos = rng.integers(2, 5, n_kits)
+        comps = rng.integers(0, n_simples, tamanhos.sum())
+        qtds = rng.integers(1, 4, tamanhos.sum())
+        fim = np.cumsum(tamanhos)
+        ini = fim - tamanhos
+        df.loc[n_simples:, 'componentes'] = [
+            ','.join(codigos[c] for c in comps[a:b]) for a, b in zip(ini, fim)
+        ]
+        df.loc[n_simples:, 'quantidades'] = [
+            ','.join(str(q) for q in qtds[a:b]) for a, b in zip(ini, fim)
+        ]
+    return df
+
+
+def _variar_codigo(codigo, rng):
+    """Simula como o marketplace exporta o código: sem acento, minúsculo, com espaços."""
+    r = rng.random()
+    if r < 0.3:
+        pref, _, num = codigo.partition('-')
+        if pref in PREFIXOS:
+            codigo = f"{PREFIXOS_SEM_ACENTO[PREFIXOS.index(pref)]}-{num}"
+    elif r < 0.4:
+        codigo = codigo.lower()
+    elif r < 0.45:
+        codigo = f" {codigo} "
+    return codigo
+
+
+def gerar_fatura(catalogo, n_linhas, frac_desconhecidos=0.02, col_codigo='Código',
+                 col_quantidade='Quantidade', seed=7):
+    """Arquivo de faturamento (linhas repetidas, kits, códigos variantes e desconhecidos)."""
+    rng = np.random.default_rng(seed)
+    codigos = catalogo['codigo'].to_numpy()
+    escolhidos = codigos[rng.integers(0, len(codigos), n_linhas)]
+    linhas = [_variar_codigo(c, rng) for c in escolhidos]
+    desconhecidos = rng.random(n_linhas) < frac_desconhecidos
+    for i in np.flatnonzero(desconhecidos):
+        linhas[i] = f"XX-{i:07d}"
+    return pd.DataFrame({col_codigo: linhas, col_quantidade: rng.integers(1, 6, n_linhas)})
+
+
+def gerar_vendas(catalogo, n_linhas, seed=11):
+    """Arquivo de vendas para o Relatório de Faltantes (cabeçalho já sem acento)."""
+    return gerar_fatura(catalogo, n_linhas, col_codigo='codigo', col_quantidade='quantidade', seed=seed)
+
+
+def gerar_historico(catalogo, n_movimentos, seed=13):
+    """Aba historico_baixas no formato gravado pelo Apps Script."""
+    rng = np.random.default_rng(seed)
+    codigos = catalogo['codigo'].to_numpy()
+    inicio = pd.Timestamp('2026-01-01')
+    return pd.DataFrame({
+        'data_hora': (inicio + pd.to_timedelta(np.sort(rng.integers(0, 86400 * 90, n_movimentos)), unit='s'))
+                     .strftime('%Y-%m-%d %H:%M:%S'),
+        'codigo': codigos[rng.integers(0, len(codigos), n_movimentos)],
+        'tipo': np.where(rng.random(n_movimentos) < 0.7, 'saida', 'entrada'),
+        'quantidade': rng.integers(1, 10, n_movimentos),
+        'colaborador': rng.choice(['Pericles', 'Maria', 'Camila', 'Cris VantiStella'], n_movimentos),
+    })
+
+
+def para_csv(df, encoding='utf-8'):
+    return df.to_csv(index=False).encode(encoding)
+
+
+def arquivo_upload(df, nome='faturamento.csv', encoding='utf-8'):
+    """BytesIO com `.name`, como o UploadedFile do Streamlit."""
+    buf = BytesIO(para_csv(df, encoding))
+    buf.name = nome
+    return buf
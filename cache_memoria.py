@@ -0,0 +1,181 @@
+# cache_memoria.py
+"""
+Cache em memória compartilhado pelas empresas, com orçamento em bytes.
+
+Snapshots do catálogo, campos derivados, índices e cubos de todas as
+empresas ficam num só cache por processo. O total é limitado por
+ESTOQUE_CACHE_MB; ao passar do orçamento, saem os itens usados há mais
+tempo (LRU) — de qualquer empresa. Uma empresa sem acesso há um tempo
+perde os itens para as ativas, e a próxima visita só reconstrói o que
+faltar.
+
+Chaves são tuplas começando pelo dono (id da empresa; 'parse' para o
+parse de estoque.ler_produtos fora de uma empresa, como no CLI, e 'export'
+para exportações sem empresa): as estatísticas e o `descartar` agrupam
+por esse prefixo. Leituras de fundo (o vigia de alertas) usam
+pegar(..., tocar=False), que não conta como uso: uma empresa parada
+continua saindo primeiro. O tamanho de cada item é estimado ao guardar
+(DataFrames com memory_usage(deep=True), arrays numpy pelo nbytes) e
+pode ser remedido depois (`remedir`) quando o item cresce no lugar.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+ORCAMENTO_MB = float(os.environ.get('ESTOQUE_CACHE_MB', '512'))
+AMOSTRA = 200       # containers maiores que isto: mede uma amostra e extrapola
+
+
+def tamanho(obj, _vistos=None):
+    """Bytes aproximados de `obj` (objetos repetidos contam uma vez)."""
+    vistos = set() if _vistos is None else _vistos
+    if id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        n = obj.memory_usage(deep=True)
+        return int(n.sum() if hasattr(n, 'sum') else n)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object and obj.size:
+            return obj.nbytes + _amostrado(obj.ravel().tolist(), vistos)
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + _amostrado(list(obj), vistos) + _amostrado(list(obj.values()), vistos)
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + _amostrado(list(obj), vistos)
+    return sys.getsizeof(obj)
+
+
+def _amostrado(itens, vistos):
+    if len(itens) <= AMOSTRA:
+        return sum(tamanho(x, vistos) for x in itens)
+    passo = len(itens) / AMOSTRA
+    amostra = sum(tamanho(itens[int(i * passo)], vistos) for i in range(AMOSTRA))
+    return int(amostra * len(itens) / AMOSTRA)
+
+
+class CacheLRU:
+    """Cache LRU com orçamento em bytes. Thread-safe dentro do processo."""
+
+    def __init__(self, orcamento=int(ORCAMENTO_MB * 2**20)):
+        self.orcamento = orcamento
+        self._itens = OrderedDict()     # chave -> [valor, bytes, guardado_em]; o fim é o mais recente
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._construindo = {}          # chave -> Lock: uma construção por chave, as outras threads esperam
+        self.acertos, self.faltas, self.despejos = Counter(), Counter(), Counter()
+        self.recusados = 0              # maiores que o orçamento inteiro: devolvidos sem guardar
+
+    def obter(self, chave, fabricar, validade=None):
+        """
+        Valor da chave; sem ele (ou mais velho que `validade` segundos),
+        `fabricar()` constrói e guarda. Construções simultâneas da mesma
+        chave rodam uma vez só.
+        """
+        valor = self._pegar(chave, validade)
+        if valor is not _AUSENTE:
+            return valor
+        with self._lock:
+            lock_chave = self._construindo.setdefault(chave, threading.Lock())
+        with lock_chave:
+            valor = self._pegar(chave, validade, contar=False)
+            if valor is _AUSENTE:
+                valor = fabricar()
+                self.guardar(chave, valor)
+        with self._lock:
+            self._construindo.pop(chave, None)
+        return valor
+
+    def pegar(self, chave, padrao=None, tocar=True):
+        """
+        Valor da chave (marcado como usado agora) ou `padrao`. tocar=False
+        lê sem mexer na ordem do LRU nem nas estatísticas.
+        """
+        valor = self._pegar(chave, None, contar=tocar, tocar=tocar)
+        return padrao if valor is _AUSENTE else valor
+
+    def _pegar(self, chave, validade, contar=True, tocar=True):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None and validade is not None and time.time() - item[2] > validade:
+                self._remover(chave)
+                item = None
+            if item is None:
+                if contar:
+                    self.faltas[chave[0]] += 1
+                return _AUSENTE
+            if tocar:
+                self._itens.move_to_end(chave)
+            if contar:
+                self.acertos[chave[0]] += 1
+            return item[0]
+
+    def guardar(self, chave, valor):
+        """Guarda (ou troca) o valor e despeja os menos usados até caber no orçamento."""
+        n = tamanho(valor)
+        with self._lock:
+            if chave in self._itens:
+                self._remover(chave)
+            if n > self.orcamento:
+                self.recusados += 1
+                return
+            self._itens[chave] = [valor, n, time.time()]
+            self._bytes += n
+            self._despejar(chave)
+
+    def remedir(self, chave):
+        """Mede de novo um item que cresceu no lugar (p.ex. um estado atualizado)."""
+        with self._lock:
+            item = self._itens.get(chave)
+        if item is None:
+            return
+        n = tamanho(item[0])
+        with self._lock:
+            if self._itens.get(chave) is item:
+                self._bytes += n - item[1]
+                item[1] = n
+                self._despejar(chave)
+
+    def descartar(self, prefixo=()):
+        """Remove os itens cuja chave começa com `prefixo` (tupla; vazio = tudo)."""
+        with self._lock:
+            for chave in [c for c in self._itens if c[:len(prefixo)] == prefixo]:
+                self._remover(chave)
+
+    def _remover(self, chave):
+        self._bytes -= self._itens.pop(chave)[1]
+
+    def _despejar(self, manter):
+        while self._bytes > self.orcamento and len(self._itens) > 1:
+            chave = next(iter(self._itens))
+            if chave == manter:
+                self._itens.move_to_end(chave)
+                chave = next(iter(self._itens))
+            self._remover(chave)
+            self.despejos[chave[0]] += 1
+
+    def estatisticas(self):
+        """dict: bytes, orcamento, itens, recusados e, por dono, bytes/itens/acertos/faltas/despejos."""
+        with self._lock:
+            donos = {}
+            for chave, (_, n, _) in self._itens.items():
+                d = donos.setdefault(chave[0], {'bytes': 0, 'itens': 0})
+                d['bytes'] += n
+                d['itens'] += 1
+            for dono in set(self.acertos) | set(self.faltas) | set(self.despejos):
+                donos.setdefault(dono, {'bytes': 0, 'itens': 0})
+            for dono, d in donos.items():
+                d.update(acertos=self.acertos[dono], faltas=self.faltas[dono], despejos=self.despejos[dono])
+            return {'bytes': self._bytes, 'orcamento': self.orcamento, 'itens': len(self._itens),
+                    'recusados': self.recusados, 'donos': donos}
+
+
+_AUSENTE = object()
+
+# um por processo: os dois apps e o estoque.ler_produtos dividem o orçamento
+COMPARTILHADO = CacheLRU()
@@ -0,0 +1,113 @@
+# conciliacao.py
+"""
+Sugestões para códigos da fatura que não existem no catálogo.
+
+As chaves normalizadas do catálogo (`codigo_key`) viram um índice invertido
+de trigramas, montado uma vez por snapshot: para cada trigrama, as posições
+dos SKUs que o contêm (arrays numpy em formato CSR). Um código desconhecido
+só é comparado com os SKUs que dividem trigramas com ele: a contagem sai de
+um `bincount` das listas, o coeficiente de Dice escolhe os melhores
+candidatos e o `difflib` reordena os poucos que sobram.
+
+As sugestões aceitas viram aliases (estoque.registrar_aliases) e as próximas
+faturas resolvem o código direto, sem passar por aqui.
+"""
+import difflib
+
+import numpy as np
+import pandas as pd
+
+from estoque import normalize_key
+
+BORDA = '#'          # marca início/fim: "AB" -> "#AB#" (códigos curtos também têm trigramas)
+SEPARADOR = '-'      # fora dos trigramas: "C1" e "C-1" dividem trigramas
+PRE_CANDIDATOS = 10  # por sugestão pedida, quantos candidatos do Dice vão para o difflib
+SIMILARIDADE_MIN = 0.5
+COLUNAS = ['codigo', 'codigo_key', 'ordem', 'sugestao', 'sugestao_key', 'nome', 'similaridade']
+
+
+def _trigramas(chave):
+    """Trigramas da chave como inteiros (3 code points de 21 bits), sem repetição."""
+    p = [ord(ch) for ch in f"{BORDA}{chave.replace(SEPARADOR, '')}{BORDA}"]
+    return {(p[i] << 42) | (p[i + 1] << 21) | p[i + 2] for i in range(len(p) - 2)}
+
+
+def construir_indice(produtos_df):
+    """
+    Índice de trigramas das chaves do catálogo (chaves repetidas: fica a primeira).
+    dict: chaves, codigos, nomes, gramas {trigrama: id}, inicio (CSR), posicoes, n_gramas.
+    """
+    cat = produtos_df.drop_duplicates('codigo_key')
+    cat = cat[cat['codigo_key'] != '']
+    chaves = cat['codigo_key'].astype(str).reset_index(drop=True)
+    base = {
+        'chaves': chaves.to_numpy(dtype=object),
+        'codigos': cat['codigo'].astype(str).to_numpy(dtype=object),
+        'nomes': (cat['nome'] if 'nome' in cat.columns else pd.Series('', index=cat.index)).astype(str).to_numpy(dtype=object),
+    }
+
+    # trigramas de todas as chaves de uma vez, em blocos de mesmo comprimento:
+    # cada bloco vira uma matriz de code points (linhas × caracteres)
+    texto = BORDA + chaves.str.replace(SEPARADOR, '', regex=False) + BORDA
+    gramas, donos = [np.empty(0, dtype=np.uint64)], [np.empty(0, dtype=np.int64)]
+    for tam, pos in texto.groupby(texto.str.len(), sort=False).indices.items():
+        cp = np.array(texto.iloc[pos].tolist(), dtype=f'U{tam}').view(np.uint32).reshape(len(pos), tam)
+        cp = cp.astype(np.uint64)
+        g = np.sort((cp[:, :-2] << np.uint64(42)) | (cp[:, 1:-1] << np.uint64(21)) | cp[:, 2:], axis=1)
+        unico = np.ones(g.shape, dtype=bool)          # trigrama repetido na mesma chave conta uma vez
+        unico[:, 1:] = g[:, 1:] != g[:, :-1]
+        gramas.append(g[unico])
+        donos.append(np.repeat(pos, tam - 2)[unico.ravel()])
+    donos = np.concatenate(donos)
+
+    ids, vocab = pd.factorize(np.concatenate(gramas))
+    ordem = np.argsort(ids, kind='stable')
+    contagem = np.bincount(ids, minlength=len(vocab))
+    return {
+        **base,
+        'gramas': dict(zip(vocab.tolist(), range(len(vocab)))),
+        'inicio': np.concatenate([[0], np.cumsum(contagem)]).astype(np.int64),
+        'posicoes': donos[ordem],
+        'n_gramas': np.bincount(donos, minlength=len(chaves)),
+    }
+
+
+def candidatos(indice, chave, k=3):
+    """[(posição, similaridade)] dos k SKUs mais parecidos com a chave, melhor primeiro."""
+    trigramas = _trigramas(chave)
+    gramas = [indice['gramas'][g] for g in trigramas if g in indice['gramas']]
+    if not gramas:
+        return []
+    inicio, posicoes = indice['inicio'], indice['posicoes']
+    listas = np.concatenate([posicoes[inicio[g]:inicio[g + 1]] for g in gramas])
+    comuns = np.bincount(listas, minlength=len(indice['chaves']))
+    pos = np.flatnonzero(comuns)
+    dice = 2 * comuns[pos] / (len(trigramas) + indice['n_gramas'][pos])
+    m = min(len(pos), k * PRE_CANDIDATOS)
+    if m < len(pos):
+        melhores = np.argpartition(-dice, m - 1)[:m]
+        pos, dice = pos[melhores], dice[melhores]
+
+    # difflib só nos pré-candidatos; empate: mais trigramas em comum, depois a chave
+    sm = difflib.SequenceMatcher(b=chave, autojunk=False)
+    notas = []
+    for p, d in zip(pos.tolist(), dice.tolist()):
+        sm.set_seq1(indice['chaves'][p])
+        notas.append((-sm.ratio(), -d, indice['chaves'][p], p))
+    notas.sort()
+    return [(p, -nota) for nota, _, _, p in notas[:k]]
+
+
+def sugerir(indice, codigos, k=3, minimo=SIMILARIDADE_MIN):
+    """
+    Sugestões em lote para os códigos (como vieram na fatura): uma linha por
+    (código, candidato) com similaridade >= `minimo`, até k por código.
+    Colunas: codigo, codigo_key, ordem, sugestao, sugestao_key, nome, similaridade.
+    """
+    linhas = []
+    for codigo in dict.fromkeys(codigos):
+        chave = normalize_key(codigo)
+        for ordem, (p, nota) in enumerate(c for c in candidatos(indice, chave, k) if c[1] >= minimo):
+            linhas.append((codigo, chave, ordem + 1, indice['codigos'][p], indice['chaves'][p],
+                           indice['nomes'][p], round(nota, 3)))
+    return pd.DataFrame(linhas, columns=COLUNAS)
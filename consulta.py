@@ -0,0 +1,224 @@
+# consulta.py
+"""
+Projeção de colunas e filtros simples empurrados para a query `tq` do
+endpoint gviz do Google Sheets, com avaliação local como fallback.
+
+  ler_planilha(url, colunas=['codigo', 'nome'], filtros=[categoria_igual('Casa')])
+
+A gviz endereça colunas por letra (A, B, ...): o cabeçalho é lido uma vez
+por URL (`limit 0`) e mapeado para as letras. Se a gviz falhar, devolver
+colunas inesperadas ou o filtro não puder ser expresso, baixa o export
+completo e aplica projeção + filtros com pandas — o resultado é o mesmo.
+
+A gviz infere um tipo por coluna pela maioria das células e devolve vazias
+as do tipo minoritário (ex.: códigos alfanuméricos numa coluna `codigo`
+quase toda numérica). `codigo` nunca é vazio num catálogo válido: se vier
+vazio na resposta, a URL passa a usar o export. Nas outras colunas de
+texto (nome, categoria...) isso não é detectado — um filtro `=` sobre uma
+delas pode deixar de fora linhas cuja célula a gviz esvaziou.
+"""
+import hashlib
+import re
+import threading
+from io import BytesIO
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pandas as pd
+import requests
+
+from estoque import ler_csv
+from metricas import span
+
+OPERADORES = ('=', '!=', '<', '<=', '>', '>=')
+
+_cabecalhos = {}
+_sem_gviz = set()        # URLs cuja gviz falhou: vão direto ao export
+_lock = threading.Lock()
+
+
+class Col(str):
+    """Referência a outra coluna no lado direito de um filtro."""
+
+
+def categoria_igual(categoria):
+    return ('categoria', '=', categoria)
+
+
+ABAIXO_DO_MINIMO = ('estoque_atual', '<', Col('estoque_min'))
+ATE_O_MINIMO = ('estoque_atual', '<=', Col('estoque_min'))
+
+
+def url_gviz(url):
+    """Export/edit URL da planilha -> endpoint gviz em CSV (mantém gid/sheet)."""
+    u = urlparse(url)
+    if '/gviz/tq' in u.path:
+        return url
+    m = re.match(r'(.*/spreadsheets/d/[^/]+)', u.path)
+    if not m:
+        raise ValueError(f"URL de planilha não reconhecida: {url}")
+    qs = parse_qs(u.query)
+    params = {'tqx': 'out:csv'}
+    gid = qs.get('gid') or re.findall(r'gid=(\d+)', u.fragment)
+    if gid:
+        params['gid'] = gid[0]
+    return f"{u.scheme}://{u.netloc}{m.group(1)}/gviz/tq?{urlencode(params)}"
+
+
+def url_aba(url, aba):
+    """URL da planilha -> endpoint gviz em CSV da aba `aba` (pelo nome)."""
+    base = url_gviz(url).split('?')[0]
+    return f"{base}?{urlencode({'tqx': 'out:csv', 'sheet': aba})}"
+
+
+def url_edicao(url):
+    """URL da planilha (export/gviz/edit) -> link de edição no Google Sheets."""
+    base = url_gviz(url).split('/gviz/')[0]
+    return f"{base}/edit?usp=sharing"
+
+
+def url_export(url):
+    """Edit URL -> export CSV (export/gviz ficam como estão)."""
+    if '/edit' in url:
+        return url.replace('/edit#gid=0', '/export?format=csv').replace('/edit', '/export?format=csv')
+    return url
+
+
+def _literal(valor):
+    if isinstance(valor, bool):
+        return 'true' if valor else 'false'
+    if isinstance(valor, (int, float)):
+        return repr(valor)
+    valor = str(valor)
+    for aspas in ("'", '"'):
+        if aspas not in valor:
+            return f"{aspas}{valor}{aspas}"
+    raise ValueError("literal com os dois tipos de aspas")
+
+
+def montar_tq(letras, colunas=None, filtros=()):
+    """
+    Query gviz: `select A, C where B = 'x' and E < F`.
+    `letras`: {cabecalho: letra}. Levanta ValueError se algo não for expressável.
+    """
+    sel = '*' if not colunas else ', '.join(letras[c] for c in colunas)
+    conds = []
+    for coluna, op, valor in filtros:
+        if op not in OPERADORES:
+            raise ValueError(f"operador não suportado: {op}")
+        direito = letras[valor] if isinstance(valor, Col) else _literal(valor)
+        conds.append(f"{letras[coluna]} {op} {direito}")
+    tq = f"select {sel}"
+    if conds:
+        tq += " where " + " and ".join(conds)
+    return tq
+
+
+def aplicar_local(df, colunas=None, filtros=()):
+    """Mesma semântica de `montar_tq`, avaliada com pandas."""
+    mask = pd.Series(True, index=df.index)
+    for coluna, op, valor in filtros:
+        esq = df[coluna]
+        dir_ = df[valor] if isinstance(valor, Col) else valor
+        if op not in ('=', '!=') or isinstance(valor, Col) or isinstance(valor, (int, float)):
+            esq = pd.to_numeric(esq, errors='coerce')
+            if isinstance(valor, Col):
+                dir_ = pd.to_numeric(dir_, errors='coerce')
+        else:
+            esq = esq.astype(str)
+            dir_ = str(valor)
+        mask &= {
+            '=': esq.__eq__, '!=': esq.__ne__, '<': esq.__lt__,
+            '<=': esq.__le__, '>': esq.__gt__, '>=': esq.__ge__,
+        }[op](dir_).fillna(False).astype(bool)
+    out = df[mask] if filtros else df
+    return (out[list(colunas)] if colunas else out).reset_index(drop=True)
+
+
+def _necessarias(colunas, filtros):
+    """Colunas a ler para projetar `colunas` e avaliar `filtros` (None = todas)."""
+    if not colunas:
+        return None
+    extras = [c for coluna, _, valor in filtros for c in (coluna, valor) if c is coluna or isinstance(c, Col)]
+    return list(dict.fromkeys(list(colunas) + extras))
+
+
+def _letra(i):
+    s = ''
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def letras_da_planilha(gviz, timeout=15):
+    """{cabecalho: letra} via `select * limit 0` (cache por URL)."""
+    with _lock:
+        if gviz in _cabecalhos:
+            return _cabecalhos[gviz]
+    r = requests.get(gviz, params={'tq': 'select * limit 0', 'headers': 1}, timeout=timeout)
+    r.raise_for_status()
+    cab = pd.read_csv(BytesIO(r.content), nrows=0).columns
+    letras = {str(c).strip(): _letra(i) for i, c in enumerate(cab)}
+    with _lock:
+        _cabecalhos[gviz] = letras
+    return letras
+
+
+def esquecer_cabecalhos():
+    """Descarta o mapeamento cabeçalho -> letra (ex.: colunas reordenadas na planilha)."""
+    with _lock:
+        _cabecalhos.clear()
+        _sem_gviz.clear()
+
+
+def _desistir_da_gviz(url):
+    with _lock:
+        _sem_gviz.add(url)
+
+
+def ler_planilha(url, colunas=None, filtros=(), timeout=15):
+    """
+    Lê só `colunas` e as linhas que passam em `filtros` (lista de
+    (coluna, op, valor | Col)). Tenta a gviz; em caso de falha, export + pandas.
+    attrs: 'versao' (hash da resposta) e 'origem' ('gviz' | 'local').
+    """
+    colunas = list(colunas) if colunas else None
+    if (colunas or filtros) and url not in _sem_gviz:
+        try:
+            gviz = url_gviz(url)
+            letras = letras_da_planilha(gviz, timeout)
+            tq = montar_tq(letras, colunas, filtros)
+        except (KeyError, ValueError):
+            tq = None               # coluna ausente / filtro não expressável
+        except (requests.RequestException, pd.errors.ParserError):
+            _desistir_da_gviz(url)
+            tq = None
+        if tq:
+            try:
+                with span('fetch', 'gviz'):
+                    r = requests.get(gviz, params={'tq': tq, 'headers': 1}, timeout=timeout)
+                    r.raise_for_status()
+                with span('parse', 'gviz'):
+                    df = ler_csv(r.content)
+                df.columns = [str(c).strip() for c in df.columns]
+                if 'codigo' in df.columns and df['codigo'].isna().any():
+                    _desistir_da_gviz(url)      # códigos esvaziados pela inferência de tipo (ver acima)
+                elif colunas is None or list(df.columns) == colunas:
+                    df.attrs.update(versao=hashlib.sha1(r.content).hexdigest()[:16], origem='gviz')
+                    return df
+                else:
+                    esquecer_cabecalhos()
+            except (requests.RequestException, pd.errors.ParserError):
+                _desistir_da_gviz(url)
+
+    with span('fetch', 'sheets'):
+        r = requests.get(url_export(url), timeout=timeout)
+        r.raise_for_status()
+    with span('parse', 'sheets'):
+        df = aplicar_local(ler_csv(r.content, _necessarias(colunas, filtros)), colunas, filtros)
+    h = hashlib.sha1(r.content)
+    if colunas or filtros:
+        h.update(repr((colunas, list(filtros))).encode())   # versão = conteúdo entregue
+    df.attrs.update(versao=h.hexdigest()[:16], origem='local')
+    return df
@@ -0,0 +1,96 @@
+# empresas.py
+"""
+Empresas (tenants) servidas pelo mesmo deploy.
+
+empresas.json (ou ESTOQUE_EMPRESAS) lista as empresas:
+
+  [{"id": "silva", "nome": "Silva Holding",
+    "fontes": [{"deposito": "Principal", "url": "...", "webhook": "..."}],
+    "colaboradores": ["Pericles", "Maria"],
+    "historico_url": "...",
+    "pasta": "dados/silva"}]
+
+- fontes: a lista de depósitos (como em fontes.json) ou o caminho de um
+  JSON com ela;
+- colaboradores: opcional, a lista padrão;
+- historico_url: opcional, a aba historico_baixas da primeira fonte;
+- pasta: opcional, onde ficam aliases, registro de faturas aplicadas,
+  tarefas de baixa, linha do tempo e checkpoint do histórico da empresa
+  (padrão: dados/<id>).
+
+Sem arquivo, uma empresa só ('padrao') com as fontes de carregar_fontes()
+e os caminhos de sempre: um deploy de uma empresa não muda nada.
+"""
+import json
+import os
+from pathlib import Path
+
+import consulta
+import linha_do_tempo
+import razao
+import tarefas
+from estoque import ALIASES, REGISTRO_APLICADAS, carregar_fontes, normalizar_fontes
+
+EMPRESAS_ARQUIVO = os.environ.get('ESTOQUE_EMPRESAS', 'empresas.json')
+PADRAO = 'padrao'
+NOME_PADRAO = 'Silva Holding'
+COLABORADORES_PADRAO = ['Pericles', 'Maria', 'Camila', 'Cris VantiStella']
+ABA_HISTORICO = 'historico_baixas'
+PASTA_DADOS = 'dados'
+
+
+def carregar_empresas(caminho=EMPRESAS_ARQUIVO):
+    """
+    {id: empresa}, na ordem do arquivo. Cada empresa: id, nome, fontes,
+    colaboradores, historico_url, edicao_url e os caminhos aliases,
+    registro_aplicadas, tarefas, linha_do_tempo e razao.
+    """
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            lista = json.load(f)
+    except FileNotFoundError:
+        return {PADRAO: _completar({'id': PADRAO, 'nome': NOME_PADRAO}, carregar_fontes(), {
+            'aliases': ALIASES, 'registro_aplicadas': REGISTRO_APLICADAS,
+            'tarefas': tarefas.PASTA_PADRAO, 'linha_do_tempo': linha_do_tempo.PASTA_PADRAO,
+            'razao': razao.CHECKPOINT_PADRAO,
+        })}
+    ids = [e.get('id') for e in lista]
+    if not lista or not all(ids) or len(set(ids)) != len(ids):
+        raise ValueError(f"{caminho}: informe ao menos uma empresa, com ids únicos")
+
+    empresas = {}
+    for e in lista:
+        fontes = e.get('fontes')
+        if isinstance(fontes, str):
+            fontes = carregar_fontes(fontes) if Path(fontes).exists() else None
+        if not fontes:
+            raise ValueError(f"{caminho}: empresa {e['id']} sem fontes")
+        pasta = Path(e.get('pasta') or Path(PASTA_DADOS) / e['id'])
+        empresas[e['id']] = _completar(e, normalizar_fontes(fontes, f"{caminho} ({e['id']})"), {
+            'aliases': str(pasta / 'aliases_codigos.json'),
+            'registro_aplicadas': str(pasta / 'faturas_aplicadas.json'),
+            'tarefas': str(pasta / 'tarefas_baixa'),
+            'linha_do_tempo': str(pasta / 'linha_do_tempo'),
+            'razao': str(pasta / 'razao_historico.json'),
+        })
+    return empresas
+
+
+def _completar(e, fontes, caminhos):
+    historico = e.get('historico_url')
+    edicao = None
+    try:
+        historico = historico or consulta.url_aba(fontes[0]['url'], ABA_HISTORICO)
+        edicao = consulta.url_edicao(fontes[0]['url'])
+    except ValueError:
+        pass    # URL fora do Google Sheets: sem histórico/link de edição derivados
+    return {
+        'id': e['id'], 'nome': e.get('nome') or e['id'], 'fontes': fontes,
+        'colaboradores': list(e.get('colaboradores') or COLABORADORES_PADRAO),
+        'historico_url': historico, 'edicao_url': edicao, **caminhos,
+    }
+
+
+def escolher(empresas, pedida=None):
+    """A empresa de id `pedida` (p.ex. ?empresa= na URL do app) ou a primeira."""
+    return empresas.get(pedida) or next(iter(empresas.values()))
@@ -0,0 +1,823 @@
+# estoque.py
+"""
+Regras de negócio do estoque, sem dependência do Streamlit:
+carga da planilha, normalização de códigos, kits, faturamento,
+faltantes e aplicação de baixas. Usado pelos apps e pelos benchmarks.
+"""
+import pandas as pd
+import requests
+from datetime import datetime
+import math
+import contextvars
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import unicodedata
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlparse
+
+from cache_memoria import COMPARTILHADO
+from metricas import span
+
+# URLs (ajuste aqui se trocar de planilha / webhook; as variáveis de ambiente
+# apontam os apps para outro lugar, p.ex. o stand-in do teste de carga)
+SHEETS_URL = os.environ.get('ESTOQUE_SHEETS_URL', "https://docs.google.com/spreadsheets/d/1PpiMQingHf4llA03BiPIuPJPIZqul4grRU_emWDEK1o/export?format=csv")
+WEBHOOK_URL = os.environ.get('ESTOQUE_WEBHOOK_URL', "https://script.google.com/macros/s/AKfycbxTX9uUWnByw6sk6MtuJ5FbjV7zeBKYEoUPPlUlUDS738QqocfCd_NAlh9Eh25XhQywTw/exec")
+
+# ======================
+# HELPERS ROBUSTOS
+# ======================
+def safe_int(x, default=0):
+    """Converte qualquer coisa para int sem quebrar."""
+    try:
+        if x is None:
+            return default
+        if isinstance(x, float) and math.isnan(x):
+            return default
+        if isinstance(x, str) and x.strip().lower() in {"", "nan", "none", "null", "n/a"}:
+            return default
+        return int(float(str(x).replace(",", ".")))
+    except Exception:
+        return default
+
+def parse_int_list(value):
+    """'1,2, 3' -> [1,2,3]; ignora nulos/NaN/vazios."""
+    if value is None:
+        return []
+    if isinstance(value, float) and math.isnan(value):
+        return []
+    parts = [p.strip() for p in str(value).split(",")]
+    out = []
+    for p in parts:
+        if not p:
+            continue
+        v = safe_int(p, None)
+        if v is not None:
+            out.append(v)
+    return out
+
+def normalize_key(s: str) -> str:
+    """
+    Gera chave estável para matching:
+    - remove acentos (inclui ç->c)
+    - mantém letras, números e hífen
+    - upper e trim
+    """
+    if s is None:
+        return ""
+    s = str(s)
+    s = unicodedata.normalize('NFKD', s)
+    s = ''.join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.replace('ß', 'ss')
+    s = ''.join(ch for ch in s if ch.isalnum() or ch == '-')
+    return s.upper().strip()
+
+# ======================
+# CARREGAR PRODUTOS
+# ======================
+# colunas lidas da planilha e seus tipos (texto não passa por inferência)
+TIPOS_CATALOGO = {
+    'codigo': 'str', 'nome': 'str', 'categoria': 'str',
+    'estoque_atual': 'float64', 'estoque_min': 'float64', 'estoque_max': 'float64',
+    'custo_unitario': 'float64', 'eh_kit': 'str', 'componentes': 'str', 'quantidades': 'str',
+}
+COLUNAS_CATALOGO = list(TIPOS_CATALOGO)
+# motor do read_csv: pyarrow (multithread) se instalado; ESTOQUE_MOTOR_CSV=c força o padrão
+MOTOR_CSV = os.environ.get('ESTOQUE_MOTOR_CSV') or ('pyarrow' if importlib.util.find_spec('pyarrow') else 'c')
+
+def ler_csv(dados, colunas=None, motor=None):
+    """
+    CSV (bytes da resposta) -> DataFrame, lido direto de um BytesIO sobre
+    `dados` (sem decodificar para str nem copiar). Só `colunas` (None =
+    todas) e tipos explícitos para as colunas do catálogo; se uma coluna
+    numérica tiver texto, relê inferindo (o chamador aplica to_numeric).
+    """
+    motor = motor or MOTOR_CSV
+    cab = pd.read_csv(BytesIO(dados), nrows=0).columns
+    usar = [c for c in cab if colunas is None or c in colunas]
+    tipos = {c: TIPOS_CATALOGO[c] for c in usar if c in TIPOS_CATALOGO}
+    try:
+        return pd.read_csv(BytesIO(dados), usecols=usar, dtype=tipos, engine=motor)
+    except ValueError:
+        texto = {c: t for c, t in tipos.items() if t == 'str'}
+        try:
+            return pd.read_csv(BytesIO(dados), usecols=usar, dtype=texto, engine=motor)
+        except ValueError:
+            # o pyarrow com dtype parcial falha se uma coluna inteira fora dele
+            # tiver célula vazia (p.ex. estoque_anterior no histórico): motor c
+            if motor == 'c':
+                raise
+            return pd.read_csv(BytesIO(dados), usecols=usar, dtype=texto, engine='c')
+
+# (empresa, 'parse', url) -> (versao, df normalizado) no cache compartilhado,
+# ou ('parse', url) fora de uma empresa: pula o parse se nada mudou (e sai do
+# cache com o resto da empresa se ela ficar parada)
+PARSE = 'parse'
+
+def _chave_parse(url, empresa):
+    return (empresa, PARSE, url) if empresa else (PARSE, url)
+
+def ler_produtos(url=SHEETS_URL, timeout=15, empresa=None, recente=True):
+    """
+    Baixa e normaliza o catálogo. Levanta exceção em caso de falha.
+    recente=False (leituras de fundo, como o vigia de alertas): usa o parse
+    em cache sem marcá-lo como usado e não guarda um novo — não segura no
+    cache o catálogo de uma empresa que ninguém está olhando.
+    """
+    with span('fetch', 'sheets'):
+        r = requests.get(url, timeout=timeout)
+        r.raise_for_status()
+    # versão do snapshot: identifica o conteúdo para os caches derivados
+    versao = hashlib.sha1(r.content).hexdigest()[:16]
+    chave = _chave_parse(url, empresa)
+    anterior = COMPARTILHADO.pegar(chave, tocar=recente)
+    if anterior and anterior[0] == versao:
+        return anterior[1].copy()
+
+    with span('parse', 'sheets'):
+        df = ler_csv(r.content, COLUNAS_CATALOGO)
+    df.attrs['versao'] = versao
+
+    with span('normalize', 'sheets'):
+        # Colunas essenciais
+        req = ['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'estoque_max']
+        for c in req:
+            if c not in df.columns:
+                if c == 'estoque_max':
+                    df[c] = df.get('estoque_min', 0) * 2
+                else:
+                    df[c] = 0
+
+        # Numéricos
+        df['estoque_atual'] = pd.to_numeric(df['estoque_atual'], errors='coerce').fillna(0)
+        df['estoque_min']   = pd.to_numeric(df['estoque_min']  , errors='coerce').fillna(0)
+        df['estoque_max']   = pd.to_numeric(df['estoque_max']  , errors='coerce').fillna(0)
+
+        # Kits
+        for c in ['componentes', 'quantidades', 'eh_kit']:
+            if c not in df.columns:
+                df[c] = ''
+            else:
+                df[c] = df[c].astype(str).fillna('')
+
+        # 🔑 chave normalizada para matching insensível a acentos/ç
+        df['codigo_key'] = df['codigo'].astype(str).map(normalize_key)
+
+    if recente:
+        COMPARTILHADO.guardar(chave, (versao, df.copy()))
+    return df
+
+def esquecer_parseados(empresa=None):
+    """Descarta os catálogos já normalizados (da empresa, ou os sem empresa): o próximo ler_produtos refaz o parse."""
+    COMPARTILHADO.descartar((empresa, PARSE) if empresa else (PARSE,))
+
+# ======================
+# VÁRIOS DEPÓSITOS (uma planilha/aba por local)
+# ======================
+FONTES_ARQUIVO = os.environ.get('ESTOQUE_FONTES', 'fontes.json')
+FONTES_PADRAO = [{'deposito': 'Principal', 'url': SHEETS_URL, 'webhook': WEBHOOK_URL}]
+
+def carregar_fontes(caminho=FONTES_ARQUIVO):
+    """
+    Lista de fontes [{deposito, url, webhook}] do JSON em `caminho`
+    (webhook opcional: usa WEBHOOK_URL). Sem arquivo: só a planilha padrão.
+    """
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            fontes = json.load(f)
+    except FileNotFoundError:
+        return [dict(f) for f in FONTES_PADRAO]
+    return normalizar_fontes(fontes, caminho)
+
+def normalizar_fontes(fontes, origem):
+    """Valida a lista de fontes (nomes de depósito únicos) e completa o webhook."""
+    nomes = [f['deposito'] for f in fontes]
+    if not fontes or len(set(nomes)) != len(nomes):
+        raise ValueError(f"{origem}: informe ao menos uma fonte, com nomes de depósito únicos")
+    return [{'deposito': f['deposito'], 'url': f['url'], 'webhook': f.get('webhook', WEBHOOK_URL)} for f in fontes]
+
+def _ler_fonte_segura(fonte, timeout, empresa, recente):
+    try:
+        return fonte, ler_produtos(fonte['url'], timeout, empresa, recente), None
+    except Exception as e:
+        return fonte, None, str(e)
+
+def ler_depositos(fontes, max_workers=8, timeout=15, empresa=None, recente=True):
+    """
+    Busca as fontes em paralelo. Retorna [(fonte, df, erro)] na ordem de
+    `fontes`. `empresa`/`recente`: como em ler_produtos.
+    """
+    if len(fontes) <= 1:
+        return [_ler_fonte_segura(f, timeout, empresa, recente) for f in fontes]
+    # uma cópia do contexto de quem chamou por fonte: as threads do pool não o
+    # herdam, e sem ele os spans da sessão (painel de desempenho) se perdem
+    contextos = [contextvars.copy_context() for _ in fontes]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(fontes))) as pool:
+        return list(pool.map(lambda c, f: c.run(_ler_fonte_segura, f, timeout, empresa, recente),
+                             contextos, fontes))
+
+def unificar_depositos(lidos):
+    """
+    Junta os depósitos lidos numa visão com a coluna 'deposito'.
+    attrs: 'versao' (combinada) e 'versoes' {deposito: versao}. Com mais de
+    um depósito, 'chave_deposito' (deposito|codigo_key) identifica a linha.
+    """
+    partes = [(f['deposito'], df) for f, df, erro in lidos if df is not None]
+    if not partes:
+        return pd.DataFrame()
+    versoes = {dep: df.attrs.get('versao') for dep, df in partes}
+    df = pd.concat([d.assign(deposito=dep) for dep, d in partes], ignore_index=True)
+    if len(partes) > 1:
+        df['chave_deposito'] = df['deposito'] + '|' + df['codigo_key']
+    df.attrs['versoes'] = versoes
+    df.attrs['versao'] = hashlib.sha1(repr(sorted(versoes.items())).encode()).hexdigest()[:16]
+    return df
+
+# ======================
+# SEMÁFORO / STATUS
+# ======================
+LIMITE_BAIXO = 1.2   # até 20% acima do mínimo ainda é BAIXO
+
+def calcular_semaforo(estoque_atual, estoque_min, estoque_max):
+    if estoque_atual < estoque_min:
+        return "🔴", "CRÍTICO", "#ff4444"
+    elif estoque_atual <= estoque_min * LIMITE_BAIXO:
+        return "🟠", "BAIXO", "#ffaa00"
+    elif estoque_atual > estoque_max:
+        return "🔵", "EXCESSO", "#0088ff"
+    else:
+        return "🟢", "OK", "#00aa00"
+
+def status_estoque(df):
+    """Status de cada linha (mesma regra de calcular_semaforo), vetorizado."""
+    atual, minimo, maximo = (pd.to_numeric(df[c], errors='coerce').fillna(0)
+                             for c in ('estoque_atual', 'estoque_min', 'estoque_max'))
+    return (pd.Series('OK', index=df.index)
+            .mask(atual > maximo, 'EXCESSO')
+            .mask(atual <= minimo * LIMITE_BAIXO, 'BAIXO')
+            .mask(atual < minimo, 'CRÍTICO'))
+
+# ======================
+# MOVIMENTAÇÃO (WEBHOOK)
+# ======================
+def endpoint(url):
+    """Rótulo curto do endpoint para as métricas (host + caminho)."""
+    u = urlparse(url)
+    return f"{u.netloc}{u.path}"
+
+def movimentar_estoque(codigo, quantidade, tipo, colaborador, test_mode=False, webhook_url=WEBHOOK_URL):
+    """Se test_mode=True, só simula; senão, envia ao Apps Script."""
+    if test_mode:
+        return {'success': True, 'message': 'Simulado', 'novo_estoque': 'SIMULAÇÃO'}
+    try:
+        payload = {
+            'codigo': codigo,
+            'quantidade': safe_int(quantidade, 0),
+            'tipo': tipo,
+            'colaborador': colaborador
+        }
+        with span('webhook', endpoint(webhook_url)):
+            r = requests.post(webhook_url, json=payload, timeout=20)
+            return r.json()
+    except Exception as e:
+        return {'success': False, 'message': f'Erro: {str(e)}'}
+
+# ======================
+# EXPANDIR KITS (NORMALIZADO)
+# ======================
+def mapa_kits(produtos_df):
+    """{kit_key: [(comp_key, qtd), ...]} a partir de eh_kit/componentes/quantidades."""
+    kits = {}
+    for _, row in produtos_df.iterrows():
+        if str(row.get('eh_kit', '')).strip().lower() == 'sim':
+            kit_key = row['codigo_key']
+            comps = [normalize_key(c.strip()) for c in str(row.get('componentes', '')).split(',') if c.strip()]
+            quants = parse_int_list(row.get('quantidades', ''))
+            if comps and quants and len(comps) == len(quants):
+                kits[kit_key] = list(zip(comps, quants))
+    return kits
+
+def expandir_kits(df_fatura, produtos_df):
+    """
+    Expande kits usando matching por chave normalizada.
+    Retorna DF com:
+      codigo_key, quantidade, codigo_canonical, codigo (fallback)
+    """
+    key_to_code = dict(zip(produtos_df['codigo_key'], produtos_df['codigo'].astype(str)))
+
+    kits = mapa_kits(produtos_df)
+
+    if not kits:
+        df_f = df_fatura.copy()
+        df_f['codigo_key'] = df_f['codigo'].map(normalize_key)
+        df_f['codigo_canonical'] = df_f['codigo_key'].map(lambda k: key_to_code.get(k, ''))
+        df_f['codigo'] = df_f['codigo_canonical'].where(df_f['codigo_canonical'] != '', df_f['codigo'])
+        return df_f
+
+    linhas = []
+    for _, row in df_fatura.iterrows():
+        qty = safe_int(row.get('quantidade', 0), 0)
+        code_key = normalize_key(row['codigo'])
+        if code_key in kits:
+            for comp_key, comp_qty in kits[code_key]:
+                linhas.append({'codigo_key': comp_key, 'quantidade': qty * safe_int(comp_qty, 0)})
+        else:
+            linhas.append({'codigo_key': code_key, 'quantidade': qty})
+
+    df = pd.DataFrame(linhas)
+    df = df.groupby('codigo_key', as_index=False)['quantidade'].sum()
+
+    df['codigo_canonical'] = df['codigo_key'].map(lambda k: key_to_code.get(k, ''))
+    df['codigo'] = df['codigo_canonical'].where(df['codigo_canonical'] != '', df['codigo_key'])
+    return df
+
+# ======================
+# PROCESSAR FATURAMENTO (NORMALIZADO)
+# ======================
+def ler_fatura(arquivo_upload):
+    """
+    Lê CSV/XLS/XLSX e devolve (df['codigo','quantidade'] agrupado, erro).
+    `arquivo_upload` é qualquer arquivo binário com `.name`.
+    """
+    nome = arquivo_upload.name.lower()
+    if nome.endswith('.csv'):
+        df_fatura = None
+        for enc in ['utf-8', 'utf-8-sig', 'latin1', 'iso-8859-1', 'cp1252', 'windows-1252']:
+            try:
+                arquivo_upload.seek(0)
+                df_tmp = pd.read_csv(arquivo_upload, encoding=enc)
+                if df_tmp is not None and len(df_tmp.columns) > 0:
+                    df_fatura = df_tmp
+                    break
+            except:
+                continue
+        if df_fatura is None:
+            return None, "Não foi possível ler o CSV (tente salvar como UTF-8)."
+    elif nome.endswith('.xlsx'):
+        df_fatura = pd.read_excel(arquivo_upload, engine='openpyxl')
+    elif nome.endswith('.xls'):
+        df_fatura = pd.read_excel(arquivo_upload, engine='xlrd')
+    else:
+        return None, "Formato não suportado (use CSV/XLS/XLSX)."
+
+    # Normaliza cabeçalhos
+    def normcol(n):
+        n = unicodedata.normalize('NFKD', str(n)).encode('ASCII', 'ignore').decode('ASCII')
+        return n.lower().strip()
+    df_fatura.rename(columns={c: normcol(c) for c in df_fatura.columns}, inplace=True)
+
+    if 'codigo' not in df_fatura.columns:
+        return None, f"Arquivo sem coluna 'Código'. Colunas: {list(df_fatura.columns)}"
+    if 'quantidade' not in df_fatura.columns:
+        return None, f"Arquivo sem coluna 'Quantidade'. Colunas: {list(df_fatura.columns)}"
+
+    # Limpeza
+    df_fatura['codigo'] = df_fatura['codigo'].astype(str).str.strip()
+    df_fatura['quantidade'] = df_fatura['quantidade'].apply(lambda x: safe_int(x, 0)).astype(int)
+    df_fatura = df_fatura[(df_fatura['codigo'] != '') & (df_fatura['quantidade'] > 0)]
+    df_fatura = df_fatura.groupby('codigo', as_index=False)['quantidade'].sum().reset_index(drop=True)
+    return df_fatura, None
+
+def conciliar_fatura(df_fatura, produtos_df, aliases=None):
+    """
+    Resolve aliases ({chave externa: código do catálogo}, ver mapa_aliases),
+    expande kits e separa (encontrados enriquecidos, não encontrados).
+    """
+    df_fatura = resolver_aliases(df_fatura, aliases)
+    # Expande kits + chaves
+    df_fatura = expandir_kits(df_fatura, produtos_df)
+    if 'codigo_key' not in df_fatura.columns:
+        df_fatura['codigo_key'] = df_fatura['codigo'].map(normalize_key)
+
+    estoque_keys = set(produtos_df['codigo_key'])
+
+    df_fatura['encontrado'] = df_fatura['codigo_key'].isin(estoque_keys)
+
+    # Mapa para enriquecer
+    est_map = {}
+    for _, r in produtos_df.iterrows():
+        k = r['codigo_key']
+        est_map[k] = {
+            'nome': r.get('nome', 'N/A'),
+            'estoque_atual': pd.to_numeric(r.get('estoque_atual', 0), errors='coerce'),
+            'codigo_canonical': r.get('codigo', '')
+        }
+
+    prods_ok = df_fatura[df_fatura['encontrado']].copy().reset_index(drop=True)
+    if not prods_ok.empty:
+        prods_ok['nome'] = prods_ok['codigo_key'].map(lambda k: est_map[k]['nome'])
+        prods_ok['estoque_atual'] = prods_ok['codigo_key'].map(lambda k: est_map[k]['estoque_atual']).fillna(0)
+        prods_ok['codigo_canonical'] = prods_ok['codigo_key'].map(lambda k: est_map[k]['codigo_canonical']).fillna(prods_ok['codigo'])
+        prods_ok['estoque_atual'] = pd.to_numeric(prods_ok['estoque_atual'], errors='coerce').fillna(0)
+        prods_ok['quantidade'] = pd.to_numeric(prods_ok['quantidade'], errors='coerce').fillna(0)
+        prods_ok['estoque_final'] = prods_ok['estoque_atual'] - prods_ok['quantidade']
+
+    prods_nok = df_fatura[~df_fatura['encontrado']].copy().reset_index(drop=True)
+    if not prods_nok.empty:
+        prods_nok = prods_nok[['codigo', 'quantidade', 'codigo_key']]
+
+    return prods_ok, prods_nok
+
+def processar_faturamento(arquivo_upload, produtos_df, aliases=None):
+    """
+    Retorna (produtos_encontrados, produtos_nao_encontrados, erro)
+    Agora insensível a acentos/ç nos códigos e kits.
+    """
+    try:
+        df_fatura, erro = ler_fatura(arquivo_upload)
+        if erro:
+            return None, None, erro
+        prods_ok, prods_nok = conciliar_fatura(df_fatura, produtos_df, aliases)
+        return prods_ok, prods_nok, None
+
+    except Exception as e:
+        return None, None, f"Erro ao processar arquivo: {str(e)}"
+
+def montar_preview(ok):
+    """Tabela de preview da baixa (mesmas colunas da tela)."""
+    prev = ok[['codigo_canonical','nome','estoque_atual','quantidade','estoque_final']].copy()
+    prev.columns = ['Código','Produto','Estoque Atual','Qtd a Baixar','Estoque Final']
+    for c in ['Estoque Atual','Qtd a Baixar','Estoque Final']:
+        prev[c] = pd.to_numeric(prev[c], errors='coerce').fillna(0).astype(int)
+    prev['Status'] = prev['Estoque Final'].apply(lambda x: 'Negativo' if x < 0 else ('Zerado' if x == 0 else 'OK'))
+    return prev
+
+# ======================
+# VÁRIOS ARQUIVOS DE FATURAMENTO
+# ======================
+def mesclar_faturas(partes):
+    """
+    `partes`: lista de (nome_arquivo, df['codigo','quantidade']) já lidos.
+    Soma a demanda por chave normalizada. Retorna (df_fatura, proveniencia),
+    com proveniencia = arquivo, codigo, codigo_key, quantidade.
+    """
+    frames = [df.assign(arquivo=nome) for nome, df in partes if df is not None and not df.empty]
+    if not frames:
+        vazio = pd.DataFrame(columns=['codigo', 'quantidade'])
+        return vazio, pd.DataFrame(columns=['arquivo', 'codigo', 'codigo_key', 'quantidade'])
+    prov = pd.concat(frames, ignore_index=True)
+    prov['codigo_key'] = prov['codigo'].map(normalize_key)
+    prov = prov[['arquivo', 'codigo', 'codigo_key', 'quantidade']]
+    df = prov.groupby('codigo_key', as_index=False, sort=False).agg(codigo=('codigo', 'first'), quantidade=('quantidade', 'sum'))
+    return df[['codigo', 'quantidade']], prov
+
+def arquivos_por_chave(proveniencia, produtos_df, aliases=None):
+    """{codigo_key: 'a.csv; b.csv'} — componentes de kit herdam os arquivos do kit (e o alvo, os do alias)."""
+    kits = mapa_kits(produtos_df)
+    alvo = {k: normalize_key(c) for k, c in (aliases or {}).items()}
+    origem = {}
+    for arquivo, key in zip(proveniencia['arquivo'], proveniencia['codigo_key']):
+        key = alvo.get(key, key)
+        for k in ([c for c, _ in kits[key]] if key in kits else [key]):
+            origem.setdefault(k, set()).add(arquivo)
+    return {k: '; '.join(sorted(v)) for k, v in origem.items()}
+
+def expandir_uploads(arquivos):
+    """
+    Abre ZIPs: devolve lista de arquivos (BytesIO com `.name`) CSV/XLS/XLSX.
+    Entradas de um ZIP recebem o nome 'pacote.zip/arquivo.csv'.
+    """
+    saida = []
+    for arq in arquivos:
+        if arq.name.lower().endswith('.zip'):
+            arq.seek(0)
+            with zipfile.ZipFile(arq) as z:
+                for info in z.infolist():
+                    base = info.filename.rsplit('/', 1)[-1]
+                    if info.is_dir() or base.startswith('.') or not base.lower().endswith(('.csv', '.xls', '.xlsx')):
+                        continue
+                    buf = BytesIO(z.read(info))
+                    buf.name = f"{arq.name}/{info.filename}"
+                    saida.append(buf)
+        else:
+            saida.append(arq)
+    return saida
+
+def _ler_fatura_seguro(arquivo):
+    try:
+        df, erro = ler_fatura(arquivo)
+        return arquivo.name, df, erro
+    except Exception as e:
+        return arquivo.name, None, f"Erro ao processar arquivo: {str(e)}"
+
+def ler_faturas(arquivos, max_workers=8):
+    """Lê vários arquivos em threads. Retorna [(nome, df, erro)] na ordem de entrada."""
+    if len(arquivos) <= 1:
+        return [_ler_fatura_seguro(a) for a in arquivos]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(arquivos))) as pool:
+        return list(pool.map(_ler_fatura_seguro, arquivos))
+
+def consolidar_faturas(lidos, produtos_df, aliases=None):
+    """
+    `lidos`: [(nome, df, erro)] de ler_faturas. Soma a demanda de todos os
+    arquivos numa linha por codigo_key e concilia com o catálogo.
+    Retorna dict: ok, nok, preview, proveniencia, erros [(arquivo, mensagem)],
+    via_alias (chaves da fatura resolvidas por alias).
+    ok/nok/preview trazem a coluna de arquivos de origem.
+    """
+    erros = [(nome, erro) for nome, _, erro in lidos if erro]
+    partes = [(nome, df) for nome, df, erro in lidos if not erro]
+
+    df_fatura, prov = mesclar_faturas(partes)
+    if df_fatura.empty:
+        ok = nok = pd.DataFrame()
+    else:
+        ok, nok = conciliar_fatura(df_fatura, produtos_df, aliases)
+
+    origem = arquivos_por_chave(prov, produtos_df, aliases)
+    via_alias = sorted(set(prov['codigo_key']) & set(aliases or {}))
+    preview = pd.DataFrame()
+    if not ok.empty:
+        ok['arquivos'] = ok['codigo_key'].map(origem).fillna('')
+        preview = montar_preview(ok)
+        preview['Arquivos'] = ok['arquivos'].values
+    if not nok.empty:
+        nok = nok.assign(arquivos=nok['codigo_key'].map(origem).fillna(''))
+    return {'ok': ok, 'nok': nok, 'preview': preview, 'proveniencia': prov, 'erros': erros, 'via_alias': via_alias}
+
+# ======================
+# DIGEST DE UPLOADS / FATURAS JÁ APLICADAS
+# ======================
+REGISTRO_APLICADAS = os.environ.get('ESTOQUE_REGISTRO_APLICADAS', 'faturas_aplicadas.json')
+_lock_registro = threading.Lock()
+
+def digest_arquivo(arquivo):
+    """SHA-256 do conteúdo (UploadedFile/BytesIO/arquivo aberto em 'rb'); não depende do nome."""
+    if hasattr(arquivo, 'getvalue'):
+        dados = arquivo.getvalue()
+    else:
+        arquivo.seek(0)
+        dados = arquivo.read()
+        arquivo.seek(0)
+    return hashlib.sha256(dados).hexdigest()
+
+def _ler_json(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _gravar_json(dados, caminho):
+    """Grava num .tmp e troca de nome: quem lê nunca vê o arquivo pela metade."""
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)   # pasta da empresa (ver empresas.py) na primeira gravação
+    tmp = f"{caminho}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, caminho)
+
+def faturas_aplicadas(caminho=REGISTRO_APLICADAS):
+    """{digest: registro} das faturas já aplicadas (vazio se não houver registro)."""
+    return _ler_json(caminho)
+
+def ja_aplicadas(digests, caminho=REGISTRO_APLICADAS):
+    """{nome: registro} para os arquivos (`digests`: {nome: digest}) que já foram aplicados."""
+    reg = faturas_aplicadas(caminho)
+    return {nome: reg[d] for nome, d in digests.items() if d in reg}
+
+def registrar_aplicadas(digests, colaborador, caminho=REGISTRO_APLICADAS, tarefa=None):
+    """
+    Marca os arquivos como aplicados (gravação atômica). `tarefa`: id da
+    tarefa de baixa que ainda vai aplicá-los — a marca vale desde a fila,
+    para outra sessão ou o CLI não mandarem a mesma fatura enquanto ela roda.
+    """
+    quando = f"{datetime.now():%Y-%m-%d %H:%M:%S}"
+    with _lock_registro:
+        reg = faturas_aplicadas(caminho)
+        for nome, d in digests.items():
+            reg[d] = {'arquivo': nome, 'data_hora': quando, 'colaborador': colaborador}
+            if tarefa:
+                reg[d]['tarefa'] = tarefa
+        _gravar_json(reg, caminho)
+
+def remover_pendentes(digests, tarefa, caminho=REGISTRO_APLICADAS):
+    """Tira do registro as marcas da `tarefa` que ainda estão pendentes (terminou sem nenhuma baixa)."""
+    with _lock_registro:
+        reg = faturas_aplicadas(caminho)
+        for d in digests.values():
+            if reg.get(d, {}).get('tarefa') == tarefa:
+                del reg[d]
+        _gravar_json(reg, caminho)
+
+# ======================
+# ALIASES DE CÓDIGOS (código da fatura -> código do catálogo)
+# ======================
+ALIASES = os.environ.get('ESTOQUE_ALIASES', 'aliases_codigos.json')
+_lock_aliases = threading.Lock()
+
+def aliases_codigos(caminho=ALIASES):
+    """{chave do código externo: registro (codigo, data_hora, colaborador)}."""
+    return _ler_json(caminho)
+
+def mapa_aliases(caminho=ALIASES):
+    """{chave do código externo: código do catálogo} — o lookup usado na conciliação."""
+    return {k: r['codigo'] for k, r in aliases_codigos(caminho).items()}
+
+def registrar_aliases(pares, colaborador, caminho=ALIASES):
+    """`pares`: {código como veio na fatura: código do catálogo}. Sobrescreve aliases da mesma chave."""
+    quando = f"{datetime.now():%Y-%m-%d %H:%M:%S}"
+    with _lock_aliases:
+        reg = aliases_codigos(caminho)
+        for externo, codigo in pares.items():
+            chave = normalize_key(externo)
+            if chave and chave != normalize_key(codigo):
+                reg[chave] = {'codigo': str(codigo), 'data_hora': quando, 'colaborador': colaborador}
+        _gravar_json(reg, caminho)
+
+def remover_aliases(chaves, caminho=ALIASES):
+    with _lock_aliases:
+        reg = aliases_codigos(caminho)
+        for k in chaves:
+            reg.pop(k, None)
+        _gravar_json(reg, caminho)
+
+def resolver_aliases(df_fatura, aliases):
+    """Troca os códigos com alias pelo código do catálogo e soma as linhas que coincidirem."""
+    if not aliases or df_fatura.empty:
+        return df_fatura
+    alvo = df_fatura['codigo'].map(normalize_key).map(aliases)
+    if alvo.isna().all():
+        return df_fatura
+    df = df_fatura.assign(codigo=alvo.fillna(df_fatura['codigo']))
+    df['_chave'] = df['codigo'].map(normalize_key)
+    df = df.groupby('_chave', as_index=False, sort=False).agg(codigo=('codigo', 'first'), quantidade=('quantidade', 'sum'))
+    return df[['codigo', 'quantidade']]
+
+# ======================
+# RELATÓRIO DE FALTANTES (NORMALIZADO)
+# ======================
+def ler_vendas(arquivo):
+    """Lê o arquivo de vendas (CSV latin1 / XLSX / XLS) como na página de faltantes."""
+    nm = arquivo.name.lower()
+    if nm.endswith('.csv'):
+        return pd.read_csv(arquivo, encoding='latin1')
+    elif nm.endswith('.xlsx'):
+        return pd.read_excel(arquivo, engine='openpyxl')
+    return pd.read_excel(arquivo, engine='xlrd')
+
+def relatorio_faltantes(df_v, produtos_df):
+    """
+    Recebe vendas já com 'codigo'/'quantidade' (minúsculas).
+    Retorna (df_v expandido/normalizado, lista de faltantes).
+    """
+    df_v = df_v.copy()
+    df_v['codigo'] = df_v['codigo'].astype(str).str.strip()
+    df_v['quantidade'] = df_v['quantidade'].apply(lambda x: safe_int(x, 0)).astype(int)
+    df_v = df_v.groupby('codigo', as_index=False)['quantidade'].sum()
+
+    # Expande kits nas vendas e normaliza chaves
+    df_v = expandir_kits(df_v, produtos_df)
+    if 'codigo_key' not in df_v.columns:
+        df_v['codigo_key'] = df_v['codigo'].map(normalize_key)
+
+    falt = []
+    estoque_map = {row['codigo_key']: row for _, row in produtos_df.iterrows()}
+
+    for _, row in df_v.iterrows():
+        key = row['codigo_key']
+        q = safe_int(row['quantidade'], 0)
+        if key in estoque_map:
+            prod = estoque_map[key]
+            est = safe_int(prod.get('estoque_atual', 0), 0)
+            if est < q:
+                falt.append({
+                    'kit_original': '-',
+                    'codigo': prod.get('codigo', row['codigo']),
+                    'produto': prod.get('nome',''),
+                    'estoque_atual': est,
+                    'qtd_necessaria': q,
+                    'falta': q - est,
+                    'tipo': 'Produto/Componente'
+                })
+        else:
+            falt.append({
+                'kit_original': '-',
+                'codigo': row.get('codigo','(não cadastrado)'),
+                'produto': 'NÃO CADASTRADO',
+                'estoque_atual': 0,
+                'qtd_necessaria': q,
+                'falta': q,
+                'tipo': 'Não cadastrado'
+            })
+    return df_v, falt
+
+# ======================
+# APLICAR BAIXAS
+# ======================
+def baixar_linha(row, colaborador, test_mode=False, webhook_url=WEBHOOK_URL):
+    """
+    Envia a saída de uma linha de `ok` (Series ou dict) e devolve a linha do
+    relatório de baixas (status 'Sucesso' ou 'Erro: ...').
+    """
+    codigo = row.get('codigo_canonical', row['codigo'])
+    extra = {'arquivos': row['arquivos']} if 'arquivos' in row else {}
+    res = movimentar_estoque(codigo, row['quantidade'], 'saida', colaborador,
+                             test_mode=test_mode, webhook_url=webhook_url)
+    ok = bool(res.get('success'))
+    return {
+        'codigo': codigo,
+        'nome': row['nome'],
+        'qtd_baixada': row['quantidade'],
+        'estoque_anterior': row['estoque_atual'],
+        'estoque_final': res.get('novo_estoque','N/A') if ok else 'N/A',
+        'status': 'Sucesso' if ok else f"Erro: {res.get('message','desconhecido')}",
+        'data_hora': f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+        'colaborador': colaborador,
+        **extra
+    }
+
+def aplicar_baixas(ok, colaborador, test_mode=False, webhook_url=WEBHOOK_URL, progresso=None):
+    """
+    Envia uma saída por linha de `ok` (saída de processar_faturamento).
+    `progresso(i, total, codigo)` é chamado antes de cada linha, se informado.
+    Retorna (resultados, sucesso, erro).
+    """
+    resultados = []
+    total = len(ok)
+    for i, row in ok.iterrows():
+        if progresso:
+            progresso(i, total, row.get('codigo_canonical', row['codigo']))
+        resultados.append(baixar_linha(row, colaborador, test_mode=test_mode, webhook_url=webhook_url))
+    sucesso = sum(r['status'] == 'Sucesso' for r in resultados)
+    return resultados, sucesso, len(resultados) - sucesso
+
+# ======================
+# CARRINHO DE MOVIMENTAÇÕES
+# ======================
+COLUNAS_CARRINHO = ['codigo_key', 'codigo', 'nome', 'entradas', 'saidas', 'liquido',
+                    'estoque_atual', 'estoque_final', 'tipo', 'valido']
+
+def item_carrinho(codigo, quantidade, tipo):
+    """Item do carrinho da sessão (tipo 'entrada' | 'saida')."""
+    if tipo not in ('entrada', 'saida'):
+        raise ValueError(f"tipo inválido: {tipo}")
+    return {'codigo': str(codigo), 'codigo_key': normalize_key(codigo),
+            'quantidade': safe_int(quantidade, 0), 'tipo': tipo}
+
+def consolidar_carrinho(itens, produtos_df):
+    """
+    Uma linha por SKU com o líquido (entradas - saídas) e o estoque final
+    contra o estoque atual. tipo: 'entrada' | 'saida' | '' (líquido zero,
+    nada a enviar); valido: SKU no catálogo e estoque final >= 0.
+    """
+    if not itens:
+        return pd.DataFrame(columns=COLUNAS_CARRINHO)
+    mov = pd.DataFrame(itens)
+    mov['entradas'] = mov['quantidade'].where(mov['tipo'] == 'entrada', 0)
+    mov['saidas'] = mov['quantidade'].where(mov['tipo'] == 'saida', 0)
+    cons = mov.groupby('codigo_key', sort=False).agg(
+        codigo=('codigo', 'first'), entradas=('entradas', 'sum'), saidas=('saidas', 'sum')
+    ).reset_index()
+    cons['liquido'] = cons['entradas'] - cons['saidas']
+
+    cat = produtos_df.drop_duplicates('codigo_key').set_index('codigo_key')
+    no_catalogo = cons['codigo_key'].isin(cat.index)
+    # código canônico da planilha (o digitado fica para SKUs fora do catálogo)
+    cons['codigo'] = cons['codigo'].where(~no_catalogo, cat['codigo'].astype(str).reindex(cons['codigo_key']).to_numpy())
+    cons['nome'] = cat['nome'].reindex(cons['codigo_key']).fillna('(não encontrado)').to_numpy()
+    cons['estoque_atual'] = pd.to_numeric(cat['estoque_atual'], errors='coerce').reindex(cons['codigo_key']).fillna(0).astype(int).to_numpy()
+    cons['estoque_final'] = cons['estoque_atual'] + cons['liquido']
+    cons['tipo'] = ''
+    cons.loc[cons['liquido'] > 0, 'tipo'] = 'entrada'
+    cons.loc[cons['liquido'] < 0, 'tipo'] = 'saida'
+    cons['valido'] = no_catalogo.to_numpy() & (cons['estoque_final'] >= 0).to_numpy()
+    return cons[COLUNAS_CARRINHO]
+
+def aplicar_carrinho(consolidado, colaborador, test_mode=False, webhook_url=WEBHOOK_URL, progresso=None):
+    """
+    Envia uma movimentação por SKU com líquido diferente de zero
+    (saída de consolidar_carrinho). Recusa o lote inteiro se alguma linha
+    for inválida. Retorna (resultados, sucesso, erro).
+    """
+    if not consolidado['valido'].all():
+        invalidos = ', '.join(consolidado.loc[~consolidado['valido'], 'codigo'].astype(str))
+        raise ValueError(f"Carrinho com itens inválidos: {invalidos}")
+    enviar = consolidado[consolidado['liquido'] != 0].reset_index(drop=True)
+    sucesso, erro = 0, 0
+    resultados = []
+    for i, row in enviar.iterrows():
+        if progresso:
+            progresso(i, len(enviar), row['codigo'])
+        res = movimentar_estoque(row['codigo'], abs(int(row['liquido'])), row['tipo'], colaborador,
+                                 test_mode=test_mode, webhook_url=webhook_url)
+        ok = bool(res.get('success'))
+        sucesso += ok
+        erro += not ok
+        resultados.append({
+            'codigo': row['codigo'],
+            'nome': row['nome'],
+            'tipo': row['tipo'],
+            'quantidade': abs(int(row['liquido'])),
+            'estoque_anterior': row['estoque_atual'],
+            'estoque_final': res.get('novo_estoque', 'N/A') if ok else 'N/A',
+            'status': 'Sucesso' if ok else f"Erro: {res.get('message','desconhecido')}",
+            'data_hora': f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+            'colaborador': colaborador,
+        })
+    return resultados, sucesso, erro
@@ -0,0 +1,133 @@
+# exportar.py
+"""
+Exportações sob demanda (CSV, XLSX e Parquet).
+
+O arquivo só é gerado quando alguém clica no download: `botao_exportar`
+passa ao `st.download_button` uma função, não os bytes. A geração é
+feita em blocos de linhas e o arquivo fica no cache compartilhado
+(cache_memoria) por (empresa, chave do filtro, versão do snapshot,
+formato): conta no orçamento de ESTOQUE_CACHE_MB e sai por LRU com o resto
+da empresa. Sem empresa, o dono é 'export'.
+
+  - CSV: blocos de `to_csv` escritos direto no destino (BOM utf-8 p/ Excel)
+  - XLSX: openpyxl em modo write_only (linhas vão para disco, memória constante)
+  - Parquet: um row group por bloco (requer pyarrow)
+"""
+import importlib.util
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from cache_memoria import COMPARTILHADO
+from metricas import span
+
+BLOCO = 50_000
+EXPORT = 'export'
+LIMITE_MEMORIA = 16 * 2**20      # acima disso o arquivo em geração vai para disco
+
+FORMATOS = {
+    'CSV': ('.csv', 'text/csv'),
+    'XLSX': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+_REQUER = {'XLSX': 'openpyxl', 'Parquet': 'pyarrow'}
+
+
+def formatos_disponiveis():
+    """Formatos cujas dependências estão instaladas (CSV sempre)."""
+    return [f for f in FORMATOS if f not in _REQUER or importlib.util.find_spec(_REQUER[f])]
+
+
+def _blocos(df, bloco):
+    for i in range(0, len(df), bloco):
+        yield df.iloc[i:i + bloco]
+
+
+def escrever_csv(df, destino, bloco=BLOCO):
+    destino.write('\ufeff'.encode('utf-8'))
+    destino.write(df.iloc[:0].to_csv(index=False).encode('utf-8'))
+    for parte in _blocos(df, bloco):
+        destino.write(parte.to_csv(index=False, header=False).encode('utf-8'))
+
+
+def escrever_xlsx(df, destino, bloco=BLOCO):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('dados')
+    ws.append([str(c) for c in df.columns])
+    for parte in _blocos(df, bloco):
+        # None no lugar de NaN/NA (célula vazia)
+        valores = parte.astype(object).where(parte.notna(), None)
+        for linha in valores.itertuples(index=False, name=None):
+            ws.append(linha)
+    wb.save(destino)
+
+
+def escrever_parquet(df, destino, bloco=BLOCO):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df.iloc[:bloco], preserve_index=False)
+    with pq.ParquetWriter(destino, schema) as w:
+        for parte in _blocos(df, bloco):
+            w.write_table(pa.Table.from_pandas(parte, schema=schema, preserve_index=False))
+
+
+_ESCRITORES = {'CSV': escrever_csv, 'XLSX': escrever_xlsx, 'Parquet': escrever_parquet}
+
+
+def exportar(df, formato='CSV', bloco=BLOCO):
+    """Bytes do arquivo no `formato`; a geração passa por arquivo temporário se ficar grande."""
+    with tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA) as tmp:
+        _ESCRITORES[formato](df, tmp, bloco)
+        tmp.seek(0)
+        return tmp.read()
+
+
+def _gerar(empresa, chave, versao, formato, df):
+    def gerar():
+        with span('export', formato):
+            return exportar(df, formato)
+    dono = (empresa, EXPORT) if empresa else (EXPORT,)
+    return COMPARTILHADO.obter(dono + (chave, versao, formato), gerar)
+
+
+def botao_exportar(df, nome, chave=(), versao=None, rotulo="📥 Baixar", seletor=True, empresa=None, **kwargs):
+    """
+    Download que só gera o arquivo no clique. `empresa`: id da empresa dona
+    dos dados (entra na chave do cache); `chave`: parâmetros do filtro
+    que produziram `df`; `versao`: versão do snapshot (sem versão, o
+    conteúdo de `df` é hasheado a cada rerun — passe a versão sempre que
+    houver uma). `seletor=False` mostra um botão por formato
+    em vez do seletor — para telas em que um rerun esconderia o download.
+    """
+    if versao is None:
+        versao = int(pd.util.hash_pandas_object(df, index=False).sum())
+    chave = (nome,) + tuple(chave)
+    formatos = formatos_disponiveis()
+    if not seletor:
+        for formato, col in zip(formatos, st.columns(len(formatos))):
+            with col:
+                _botao(df, nome, empresa, chave, versao, formato, rotulo, kwargs)
+        return
+    if len(formatos) > 1:
+        formato = st.radio("Formato", formatos, horizontal=True, key=f"fmt_{nome}",
+                           label_visibility='collapsed')
+    else:
+        formato = formatos[0]
+    _botao(df, nome, empresa, chave, versao, formato, rotulo, kwargs)
+
+
+def _botao(df, nome, empresa, chave, versao, formato, rotulo, kwargs):
+    ext, mime = FORMATOS[formato]
+    st.download_button(
+        f"{rotulo} {formato}",
+        data=lambda: _gerar(empresa, chave, versao, formato, df),
+        file_name=f"{nome}_{datetime.now():%Y%m%d_%H%M%S}{ext}",
+        mime=mime,
+        key=f"dl_{nome}_{formato}",
+        **kwargs,
+    )
@@ -0,0 +1,72 @@
+# filtros.py
+"""
+Índice categoria × status por snapshot.
+
+Os apps filtram o catálogo a cada rerun; em vez de copiar o DataFrame e
+aplicar máscaras booleanas, as posições das linhas são indexadas uma vez
+por snapshot e os filtros viram lookups + `take`.
+"""
+import numpy as np
+
+TODAS = ('Todas', 'Todos', None, '')
+
+
+def construir_indice(df, col_categoria='categoria', col_status='status'):
+    """
+    Retorna dict com as posições (np.ndarray ordenado) de cada grupo:
+      {'categoria': {cat: pos}, 'status': {st: pos}, 'par': {(cat, st): pos}}
+    """
+    vazio = {'categoria': {}, 'status': {}, 'par': {}, 'n': 0}
+    if df is None or df.empty or col_categoria not in df.columns or col_status not in df.columns:
+        return vazio
+
+    par = df.groupby([col_categoria, col_status], sort=False, dropna=False).indices
+    por_cat, por_status = {}, {}
+    for (cat, st_), pos in par.items():
+        por_cat.setdefault(cat, []).append(pos)
+        por_status.setdefault(st_, []).append(pos)
+
+    def juntar(grupos):
+        return {k: np.sort(np.concatenate(v)) for k, v in grupos.items()}
+
+    return {
+        'categoria': juntar(por_cat),
+        'status': juntar(por_status),
+        'par': {k: np.asarray(v) for k, v in par.items()},
+        'n': len(df),
+    }
+
+
+def posicoes(indice, categoria=None, status=None):
+    """
+    Posições das linhas para o filtro; None = sem filtro (todas as linhas).
+    `status` aceita um valor ou uma lista de status.
+    """
+    if isinstance(status, (list, tuple, set)):
+        partes = [posicoes(indice, categoria, s) for s in status]
+        partes = [p if p is not None else np.arange(indice['n']) for p in partes]
+        if not partes:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(partes))
+
+    sem_cat = categoria in TODAS
+    sem_status = status in TODAS
+    if sem_cat and sem_status:
+        return None
+    if sem_status:
+        return indice['categoria'].get(categoria, np.empty(0, dtype=np.intp))
+    if sem_cat:
+        return indice['status'].get(status, np.empty(0, dtype=np.intp))
+    return indice['par'].get((categoria, status), np.empty(0, dtype=np.intp))
+
+
+def filtrar(df, indice, categoria=None, status=None):
+    """
+    Aplica os filtros via índice. Sem filtro devolve o próprio `df`
+    (nenhuma cópia); com filtro devolve `df.take(pos)`.
+    Trate o resultado como somente leitura.
+    """
+    pos = posicoes(indice, categoria, status)
+    if pos is None:
+        return df
+    return df.take(pos)
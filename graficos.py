@@ -0,0 +1,44 @@
+# graficos.py
+"""
+Specs dos gráficos Plotly dos dois apps.
+
+Os eixos de alta cardinalidade (categorias) são reduzidos a top-N + "Outros",
+limitando o payload enviado ao navegador; os apps guardam as figuras em
+cache por versão do snapshot + filtro.
+
+plotly é importado só quando um gráfico é montado: páginas sem gráficos
+(Movimentação, Histórico...) não pagam o import no cold start.
+"""
+import pandas as pd
+
+TOP_N = 15
+OUTROS = 'Outros'
+
+
+def _px():
+    import plotly.express as px
+    return px
+
+
+def top_n(serie, n=TOP_N, rotulo=OUTROS):
+    """Mantém os `n` maiores valores e soma o restante em `rotulo`."""
+    if serie is None or len(serie) <= n:
+        return serie
+    serie = serie.sort_values(ascending=False)
+    resto = serie.iloc[n:].sum()
+    return pd.concat([serie.iloc[:n], pd.Series({rotulo: resto})])
+
+
+def pizza_status(contagens, cores, **layout):
+    """Pizza de distribuição por status (`contagens`: Série status -> qtd)."""
+    fig = _px().pie(values=contagens.values, names=contagens.index,
+                    color=contagens.index, color_discrete_map=cores)
+    return fig.update_layout(**layout)
+
+
+def barras_categoria(serie, n=TOP_N, x='Categoria', y='Estoque Total', **layout):
+    """Barras por categoria com top-N + "Outros" (`serie`: Série categoria -> valor)."""
+    serie = top_n(serie, n)
+    dados = pd.DataFrame({x: serie.index.astype(str), y: serie.values})
+    fig = _px().bar(dados, x=x, y=y, color=y, color_continuous_scale='viridis')
+    return fig.update_layout(**layout)
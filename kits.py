@@ -0,0 +1,155 @@
+# kits.py
+"""
+Matriz de disponibilidade de kits: quantos kits dá para montar com o
+estoque atual dos componentes e qual componente é o gargalo.
+
+As definições (eh_kit / componentes / quantidades) viram uma matriz
+esparsa kit × componente em formato de arestas (kit, componente, qtd).
+Kits aninhados são achatados até os componentes finais multiplicando as
+quantidades, nível a nível. Montáveis = mínimo por kit de estoque // qtd,
+calculado de uma vez para o catálogo inteiro com numpy.
+"""
+import numpy as np
+import pandas as pd
+
+from estoque import normalize_key, parse_int_list
+
+MAX_NIVEIS = 10
+COLUNAS = ['codigo_key', 'codigo', 'nome', 'montaveis', 'gargalo', 'gargalo_estoque',
+           'gargalo_qtd', 'componentes', 'aninhado', 'ciclo']
+
+
+def arestas(produtos_df):
+    """
+    DataFrame (kit, comp, qtd) das definições de kit válidas (mesmo número
+    de componentes e quantidades — mesma regra de estoque.mapa_kits).
+    """
+    vazio = pd.DataFrame({'kit': pd.Series(dtype=object), 'comp': pd.Series(dtype=object),
+                          'qtd': pd.Series(dtype='int64')})
+    if produtos_df.empty or 'eh_kit' not in produtos_df.columns:
+        return vazio
+    kits = produtos_df[produtos_df['eh_kit'].astype(str).str.strip().str.lower() == 'sim']
+    if kits.empty:
+        return vazio
+
+    brutos = [[c.strip() for c in str(v).split(',') if c.strip()] for v in kits['componentes']]
+    chave = {c: normalize_key(c) for c in {c for cs in brutos for c in cs}}
+    comps = [[chave[c] for c in cs] for cs in brutos]
+    quants = [parse_int_list(v) for v in kits['quantidades']]
+    ok = [bool(c) and len(c) == len(q) for c, q in zip(comps, quants)]
+    chaves = kits['codigo_key'].to_numpy()
+    tamanhos = np.array([len(c) for c, v in zip(comps, ok) if v], dtype=np.intp)
+    if not len(tamanhos):
+        return vazio
+    return pd.DataFrame({
+        'kit': np.repeat(chaves[np.array(ok)], tamanhos),
+        'comp': [k for c, v in zip(comps, ok) if v for k in c],
+        'qtd': np.fromiter((x for q, v in zip(quants, ok) if v for x in q), dtype='int64'),
+    }).groupby(['kit', 'comp'], as_index=False, sort=False)['qtd'].sum()
+
+
+def achatar(ar, max_niveis=MAX_NIVEIS):
+    """
+    Substitui componentes que também são kits pelos componentes deles
+    (qtd multiplicada). Retorna (arestas finais, kits aninhados, kits em ciclo).
+    """
+    # ids inteiros + CSR por kit: a substituição é só repeat/take em numpy
+    ids, chaves = pd.factorize(pd.concat([ar['kit'], ar['comp']], ignore_index=True))
+    n, k = len(ar), len(chaves)
+    ek, ec, eq = ids[:n], ids[n:], ar['qtd'].to_numpy(dtype='int64')
+    ordem = np.argsort(ek, kind='stable')
+    ec_s, eq_s = ec[ordem], eq[ordem]
+    indptr = np.r_[0, np.cumsum(np.bincount(ek, minlength=k))]
+
+    eh_kit = np.zeros(k, dtype=bool)
+    eh_kit[ek] = True
+    aninhados = np.unique(ek[eh_kit[ec]])
+    if not len(aninhados):
+        return ar, set(), set()
+
+    # só as linhas dos kits aninhados passam pelas substituições
+    mask = np.isin(ek, aninhados)
+    pk, pc, pq = ek[mask], ec[mask], eq[mask]
+    for _ in range(max_niveis):
+        m = eh_kit[pc]
+        if not m.any():
+            break
+        sk, sc, sq = pk[m], pc[m], pq[m]
+        cont = indptr[sc + 1] - indptr[sc]
+        pos = np.repeat(indptr[sc], cont) + np.arange(cont.sum()) - np.repeat(np.cumsum(cont) - cont, cont)
+        pk = np.r_[pk[~m], np.repeat(sk, cont)]
+        pc = np.r_[pc[~m], ec_s[pos]]
+        pq = np.r_[pq[~m], np.repeat(sq, cont) * eq_s[pos]]
+        # soma arestas repetidas (mesmo kit e componente)
+        unicos, inv = np.unique(pk * k + pc, return_inverse=True)
+        pk, pc = unicos // k, unicos % k
+        pq = np.bincount(inv, weights=pq).astype('int64')
+
+    # ainda há kits dentro de kits depois de max_niveis: definição circular
+    # (ou aninhamento mais fundo que o limite) — esses kits ficam de fora
+    ciclo = np.unique(pk[eh_kit[pc]])
+    fica = ~np.isin(pk, ciclo)
+    chaves = np.asarray(chaves, dtype=object)
+    final = pd.DataFrame({
+        'kit': chaves[np.r_[ek[~mask], pk[fica]]],
+        'comp': chaves[np.r_[ec[~mask], pc[fica]]],
+        'qtd': np.r_[eq[~mask], pq[fica]],
+    })
+    return final, set(chaves[aninhados]), set(chaves[ciclo])
+
+
+def disponibilidade(produtos_df, max_niveis=MAX_NIVEIS):
+    """
+    Uma linha por kit: montaveis, gargalo (código do componente limitante),
+    gargalo_estoque, gargalo_qtd (por kit), nº de componentes finais,
+    aninhado e ciclo. Componentes fora do catálogo contam como estoque 0.
+    """
+    ar = arestas(produtos_df)
+    if ar.empty:
+        return pd.DataFrame(columns=COLUNAS)
+    ar, aninhados, ciclo = achatar(ar, max_niveis)
+
+    cat = produtos_df.drop_duplicates('codigo_key').set_index('codigo_key')
+    estoque = pd.to_numeric(cat['estoque_atual'], errors='coerce').fillna(0).clip(lower=0)
+
+    # matriz esparsa em COO: linha = kit, coluna = componente
+    kit_ids, kits_u = pd.factorize(ar['kit'])
+    est = estoque.reindex(ar['comp']).fillna(0).to_numpy(dtype='int64')
+    qtd = ar['qtd'].to_numpy(dtype='int64')
+    possivel = np.where(qtd > 0, est // np.maximum(qtd, 1), np.iinfo('int64').max)
+
+    # mínimo por linha: ordena por (kit, possível) e pega o primeiro de cada kit
+    ordem = np.lexsort((possivel, kit_ids))
+    primeiros = ordem[np.r_[True, kit_ids[ordem][1:] != kit_ids[ordem][:-1]]]
+    n_comp = np.bincount(kit_ids, minlength=len(kits_u))
+
+    codigos = cat['codigo'].astype(str)
+    comp_gargalo = ar['comp'].to_numpy()[primeiros]
+    montaveis = possivel[primeiros]
+    montaveis = np.where(montaveis == np.iinfo('int64').max, 0, montaveis)
+    gargalo = codigos.reindex(comp_gargalo).to_numpy()
+    gargalo = np.where(pd.isna(gargalo), comp_gargalo, gargalo)   # fora do catálogo: mostra a chave
+    out = pd.DataFrame({
+        'codigo_key': kits_u[kit_ids[primeiros]],
+        'montaveis': montaveis,
+        'gargalo': gargalo,
+        'gargalo_estoque': est[primeiros],
+        'gargalo_qtd': qtd[primeiros],
+        'componentes': n_comp[kit_ids[primeiros]],
+    })
+    out['codigo'] = codigos.reindex(out['codigo_key']).to_numpy()
+    out['nome'] = cat['nome'].reindex(out['codigo_key']).to_numpy()
+    out['aninhado'] = out['codigo_key'].isin(aninhados)
+    out['ciclo'] = False
+    if ciclo:
+        extra = pd.DataFrame({'codigo_key': sorted(ciclo), 'montaveis': 0, 'ciclo': True, 'aninhado': True})
+        extra['codigo'] = codigos.reindex(extra['codigo_key']).to_numpy()
+        extra['nome'] = cat['nome'].reindex(extra['codigo_key']).to_numpy()
+        out = pd.concat([out, extra], ignore_index=True)
+    return out[COLUNAS].sort_values(['montaveis', 'codigo'], kind='stable').reset_index(drop=True)
+
+
+def gargalos(disp, n=10):
+    """Componentes que mais limitam kits: Série código -> nº de kits travados por ele."""
+    limitados = disp[~disp['ciclo'].astype(bool)]
+    return limitados['gargalo'].value_counts().head(n)
@@ -0,0 +1,215 @@
+# linha_do_tempo.py
+"""
+Linha do tempo do catálogo: cada snapshot carregado é gravado como delta
+(Parquet) contra o anterior, com um checkpoint completo a cada N deltas.
+
+  <pasta>/<serie>/manifesto.json      [{seq, versao, em, tipo, arquivo, linhas[, removidos]}]
+  <pasta>/<serie>/000000.parquet      checkpoint: catálogo inteiro
+  <pasta>/<serie>/000001.parquet      delta: linhas novas/alteradas
+  <pasta>/<serie>/000001.removidos.parquet   delta: só as chaves removidas
+
+A pasta de cada série é o nome normalizado mais um hash curto do nome
+original ("Depósito/SP" e "Deposito SP" não dividem pasta). As remoções
+ficam num arquivo à parte para os tipos das colunas das linhas não
+mudarem (int não vira float por causa de linhas vazias).
+
+Reconstruir um instante lê o último checkpoint anterior a ele e no máximo
+N deltas; a consulta de um SKU lê só as linhas da chave (filtro do Parquet).
+As linhas são identificadas por `codigo_key` (chaves repetidas: fica a
+primeira). Requer pyarrow.
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from estoque import COLUNAS_CATALOGO, normalize_key
+from metricas import span
+import snapshots
+
+PASTA_PADRAO = os.environ.get('ESTOQUE_LINHA_DO_TEMPO', 'linha_do_tempo')
+CHECKPOINT_A_CADA = 20
+OP = '_op'
+
+
+def disponivel():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+class LinhaDoTempo:
+    """Store por série (depósito). Thread-safe dentro do processo."""
+
+    def __init__(self, pasta=PASTA_PADRAO, checkpoint_a_cada=CHECKPOINT_A_CADA, chave=snapshots.CHAVE):
+        self.pasta = Path(pasta)
+        self.checkpoint_a_cada = checkpoint_a_cada
+        self.chave = chave
+        self.colunas = COLUNAS_CATALOGO + [chave]
+        self._ultimo = {}     # serie -> (versao, hashes) do último snapshot gravado
+        self._lock = threading.Lock()
+        self._fila = ThreadPoolExecutor(max_workers=1, thread_name_prefix='linha-do-tempo')
+        self.erros = deque(maxlen=20)
+
+    # ---------- manifesto ----------
+    def _dir(self, serie):
+        h = hashlib.sha1(str(serie).encode('utf-8')).hexdigest()[:8]
+        return self.pasta / f"{normalize_key(serie).lower()}-{h}"
+
+    def manifesto(self, serie):
+        try:
+            with open(self._dir(serie) / 'manifesto.json', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _gravar_manifesto(self, serie, entradas):
+        caminho = self._dir(serie) / 'manifesto.json'
+        tmp = caminho.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entradas, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, caminho)
+
+    def instantes(self, serie):
+        """DataFrame do manifesto (seq, versao, em, tipo, arquivo, linhas)."""
+        m = pd.DataFrame(self.manifesto(serie), columns=['seq', 'versao', 'em', 'tipo', 'arquivo', 'linhas'])
+        m['em'] = pd.to_datetime(m['em'])
+        return m
+
+    # ---------- gravação ----------
+    def _normalizar(self, df):
+        df = df.drop_duplicates(self.chave)
+        return df.reindex(columns=self.colunas).reset_index(drop=True)
+
+    def registrar(self, serie, df, em=None):
+        """
+        Grava o snapshot `df` da série. Retorna a entrada do manifesto, ou
+        None se a versão for a mesma do último registro.
+        """
+        versao = df.attrs.get('versao')
+        with self._lock, span('linha_do_tempo', serie):
+            entradas = self.manifesto(serie)
+            if entradas and versao is not None and entradas[-1]['versao'] == versao:
+                return None
+            atual = self._normalizar(df)
+            hashes = snapshots.hash_linhas(atual, self.chave)
+
+            desde_checkpoint = next((i for i, e in enumerate(reversed(entradas)) if e['tipo'] == 'checkpoint'), None)
+            if desde_checkpoint is None or desde_checkpoint + 1 >= self.checkpoint_a_cada:
+                tipo, dados = 'checkpoint', atual
+            else:
+                ant = self._ultimo.get(serie)
+                if ant is None or ant[0] != entradas[-1]['versao']:
+                    # processo novo (ou outro escritor): hashes do último gravado
+                    ant = (entradas[-1]['versao'], snapshots.hash_linhas(self._montar(serie, entradas), self.chave))
+                mud = snapshots.diferencas(ant[1], hashes)
+                tocados = set(mud['adicionados']) | set(mud['alterados'])
+                tipo, dados = 'delta', atual[atual[self.chave].isin(tocados)]
+                removidos = pd.DataFrame({self.chave: pd.Series(mud['removidos'], dtype=atual[self.chave].dtype)})
+
+            seq = entradas[-1]['seq'] + 1 if entradas else 0
+            entrada = {'seq': seq, 'versao': versao, 'em': (em or datetime.now()).isoformat(timespec='seconds'),
+                       'tipo': tipo, 'arquivo': f"{seq:06d}.parquet", 'linhas': len(dados)}
+            self._dir(serie).mkdir(parents=True, exist_ok=True)
+            dados.to_parquet(self._dir(serie) / entrada['arquivo'], index=False, compression='zstd')
+            if tipo == 'delta' and len(removidos):
+                entrada['removidos'] = f"{seq:06d}.removidos.parquet"
+                entrada['linhas'] += len(removidos)
+                removidos.to_parquet(self._dir(serie) / entrada['removidos'], index=False, compression='zstd')
+            self._gravar_manifesto(serie, entradas + [entrada])
+            self._ultimo[serie] = (versao, hashes)
+            return entrada
+
+    def agendar(self, serie, df, em=None):
+        """`registrar` numa thread (uma por vez, em ordem): a carga não espera a gravação."""
+        em = em or datetime.now()
+        futuro = self._fila.submit(self.registrar, serie, df, em)
+        futuro.add_done_callback(self._anotar_erro)
+        return futuro
+
+    def _anotar_erro(self, futuro):
+        if futuro.exception():
+            self.erros.append(f"{datetime.now():%H:%M:%S} {futuro.exception()}")
+
+    # ---------- leitura ----------
+    def _cadeia(self, entradas, quando):
+        """Entradas do último checkpoint até o instante `quando` (None = último)."""
+        if quando is not None:
+            limite = pd.Timestamp(quando)
+            entradas = [e for e in entradas if pd.Timestamp(e['em']) <= limite]
+        inicio = max((i for i, e in enumerate(entradas) if e['tipo'] == 'checkpoint'), default=None)
+        return [] if inicio is None else entradas[inicio:]
+
+    def _ler(self, serie, entrada, filtros=None):
+        """(linhas, chaves removidas) de uma entrada do manifesto."""
+        dados = pd.read_parquet(self._dir(serie) / entrada['arquivo'], filters=filtros)
+        if entrada.get('removidos'):
+            removidos = pd.read_parquet(self._dir(serie) / entrada['removidos'], filters=filtros)
+        else:
+            removidos = dados[[self.chave]].iloc[:0]
+        return dados, removidos
+
+    def _montar(self, serie, cadeia):
+        cadeia = self._cadeia(cadeia, None)
+        if not cadeia:
+            return pd.DataFrame(columns=self.colunas)
+        estado, _ = self._ler(serie, cadeia[0])
+        if len(cadeia) == 1:
+            return estado
+        # deltas em ordem; por chave vale a última operação
+        partes = [self._ler(serie, e) for e in cadeia[1:]]
+        ops = pd.concat([pd.DataFrame({self.chave: p[self.chave], OP: op})
+                         for dados, removidos in partes for p, op in ((dados, 'U'), (removidos, 'D'))],
+                        ignore_index=True).drop_duplicates(self.chave, keep='last')
+        novos = pd.concat([dados for dados, _ in partes], ignore_index=True).drop_duplicates(self.chave, keep='last')
+        novos = novos[novos[self.chave].isin(ops.loc[ops[OP] == 'U', self.chave])]
+        estado = estado[~estado[self.chave].isin(ops[self.chave])]
+        return pd.concat([estado, novos], ignore_index=True)
+
+    def catalogo_em(self, serie, quando=None):
+        """Catálogo da série como estava em `quando` (None = último). attrs: seq, em."""
+        cadeia = self._cadeia(self.manifesto(serie), quando)
+        with span('linha_do_tempo', 'catalogo_em'):
+            df = self._montar(serie, cadeia)
+        if cadeia:
+            df.attrs.update(seq=cadeia[-1]['seq'], em=cadeia[-1]['em'], versao=cadeia[-1]['versao'])
+        return df
+
+    def sku_em(self, serie, codigo, quando=None):
+        """Linha (dict) do SKU em `quando`, ou None se não existia."""
+        k = normalize_key(codigo)
+        linha = None
+        for e in self._cadeia(self.manifesto(serie), quando):
+            dados, removidos = self._ler(serie, e, [(self.chave, '=', k)])
+            if e['tipo'] == 'checkpoint' or len(removidos):
+                linha = None
+            if len(dados):
+                linha = self._linha(dados)
+        return linha
+
+    def _linha(self, dados):
+        """Última linha de um recorte por chave -> dict."""
+        r = dados.iloc[-1]
+        return {c: (None if pd.isna(r[c]) else r[c]) for c in self.colunas}
+
+    def historico_sku(self, serie, codigo):
+        """Uma linha por registro em que o SKU mudou: em, seq + colunas (removido = vazio)."""
+        k = normalize_key(codigo)
+        linhas, ultimo = [], None
+        for e in self.manifesto(serie):
+            dados, removidos = self._ler(serie, e, [(self.chave, '=', k)])
+            if len(dados):
+                atual = self._linha(dados)
+            elif len(removidos) or e['tipo'] == 'checkpoint':
+                atual = None
+            else:
+                continue
+            if atual != ultimo:
+                linhas.append({'em': pd.Timestamp(e['em']), 'seq': e['seq'], **(atual or {'removido': True})})
+                ultimo = atual
+        return pd.DataFrame(linhas)
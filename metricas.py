@@ -0,0 +1,160 @@
+# metricas.py
+"""
+Spans de tempo por estágio (fetch, parse, normalize, derive, filter,
+render, webhook) com histogramas de latência por rótulo/endpoint.
+
+Desligado por padrão: `span()` devolve um context manager vazio e o custo
+é uma leitura de ContextVar. Ative por sessão com `ativar(True)` (painel de
+debug) ou no processo todo com ESTOQUE_METRICAS=1.
+Exporta em JSON e no formato texto do Prometheus.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+AMOSTRAS = 256          # últimas amostras por série (percentis)
+RECENTES = 200          # últimos spans (painel)
+
+PADRAO = os.environ.get('ESTOQUE_METRICAS') == '1'
+
+_ativo = ContextVar('metricas_ativo', default=PADRAO)
+_lock = threading.Lock()
+_series = {}
+_recentes = deque(maxlen=RECENTES)
+_NULO = nullcontext()
+
+
+def ativar(ligado=True):
+    """Liga/desliga a coleta no contexto atual (sessão do Streamlit)."""
+    _ativo.set(bool(ligado))
+
+
+def ativo():
+    return _ativo.get()
+
+
+def registrar(estagio, segundos, rotulo=''):
+    """Acumula uma medição na série (estagio, rotulo)."""
+    chave = (estagio, rotulo or '')
+    with _lock:
+        s = _series.get(chave)
+        if s is None:
+            s = _series[chave] = {
+                'contagem': 0, 'soma': 0.0, 'max': 0.0,
+                'buckets': [0] * len(BUCKETS), 'amostras': deque(maxlen=AMOSTRAS),
+            }
+        s['contagem'] += 1
+        s['soma'] += segundos
+        s['max'] = max(s['max'], segundos)
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                s['buckets'][i] += 1
+                break
+        s['amostras'].append(segundos)
+        _recentes.append((time.time(), estagio, chave[1], segundos))
+
+
+@contextmanager
+def _medir(estagio, rotulo):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(estagio, time.perf_counter() - t0, rotulo)
+
+
+def span(estagio, rotulo=''):
+    """`with span('fetch', url): ...` — no-op quando desligado."""
+    if not _ativo.get():
+        return _NULO
+    return _medir(estagio, rotulo)
+
+
+def medido(estagio, rotulo=''):
+    """Decorator: cada chamada da função vira um span (p.ex. fragmentos do Streamlit)."""
+    def decorar(fn):
+        @functools.wraps(fn)
+        def medida(*args, **kwargs):
+            with span(estagio, rotulo or fn.__name__):
+                return fn(*args, **kwargs)
+        return medida
+    return decorar
+
+
+def inicio():
+    """Marca de tempo para `fim()` (trechos que não cabem num `with`)."""
+    return time.perf_counter() if _ativo.get() else None
+
+
+def fim(estagio, t0, rotulo=''):
+    if t0 is not None:
+        registrar(estagio, time.perf_counter() - t0, rotulo)
+
+
+def resetar():
+    with _lock:
+        _series.clear()
+        _recentes.clear()
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    v = sorted(valores)
+    return v[min(len(v) - 1, int(round(p * (len(v) - 1))))]
+
+
+def resumo():
+    """Lista de dicts por série: estagio, rotulo, contagem, soma, media, p50, p95, max."""
+    with _lock:
+        itens = [(k, dict(s, amostras=list(s['amostras']), buckets=list(s['buckets'])))
+                 for k, s in _series.items()]
+    linhas = []
+    for (estagio, rotulo), s in sorted(itens):
+        linhas.append({
+            'estagio': estagio,
+            'rotulo': rotulo,
+            'contagem': s['contagem'],
+            'soma_s': s['soma'],
+            'media_ms': s['soma'] / s['contagem'] * 1000,
+            'p50_ms': _percentil(s['amostras'], 0.50) * 1000,
+            'p95_ms': _percentil(s['amostras'], 0.95) * 1000,
+            'max_ms': s['max'] * 1000,
+            'buckets': dict(zip(BUCKETS, s['buckets'])),
+        })
+    return linhas
+
+
+def recentes(n=50):
+    """Últimos `n` spans: (timestamp, estagio, rotulo, segundos)."""
+    with _lock:
+        return list(_recentes)[-n:]
+
+
+def exportar_json():
+    return json.dumps({'series': resumo(), 'buckets': list(BUCKETS)}, ensure_ascii=False, indent=2)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exportar_prometheus(prefixo='estoque_estagio_segundos'):
+    """Histogramas no formato de exposição texto do Prometheus."""
+    out = [f"# HELP {prefixo} Duração por estágio/rotulo.", f"# TYPE {prefixo} histogram"]
+    for s in resumo():
+        rot = f'estagio="{_escapar(s["estagio"])}",rotulo="{_escapar(s["rotulo"])}"'
+        acumulado = 0
+        for limite, qtd in s['buckets'].items():
+            acumulado += qtd
+            out.append(f'{prefixo}_bucket{{{rot},le="{limite}"}} {acumulado}')
+        out.append(f'{prefixo}_bucket{{{rot},le="+Inf"}} {s["contagem"]}')
+        out.append(f'{prefixo}_sum{{{rot}}} {s["soma_s"]:.6f}')
+        out.append(f'{prefixo}_count{{{rot}}} {s["contagem"]}')
+    return '\n'.join(out) + '\n'
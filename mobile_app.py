@@ -1,10 +1,18 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import time
 from datetime import datetime
-import requests
-from io import StringIO
+
+import consulta
+import empresas
+from cache_memoria import COMPARTILHADO
+from filtros import construir_indice, filtrar
+from exportar import botao_exportar
+import resumo
+import graficos
+import metricas
+from metricas import medido, span
+from painel_metricas import ligar_da_sessao, mostrar_painel
 
 # Configuração mobile-first
 st.set_page_config(
@@ -329,34 +337,43 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Funções auxiliares (mesmas do app principal)
-@st.cache_data(ttl=60)
-def carregar_planilha(url):
+COLUNAS = ['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'estoque_max', 'custo_unitario']
+
+# Lista de produtos: cartões em páginas de LIMITE_LISTA (um cartão por SKU do
+# catálogo inteiro deixava cada rerun da aba proporcional ao catálogo)
+LIMITE_LISTA = 50
+CHAVE_LIMITE = 'mobile_limite'
+
+def voltar_ao_inicio_da_lista():
+    st.session_state.pop(CHAVE_LIMITE, None)
+
+# Planilha e derivados ficam no cache compartilhado (cache_memoria.py), por
+# empresa: chave (empresa, tipo, ...), orçamento em ESTOQUE_CACHE_MB
+VALIDADE_PLANILHA = 60
+
+def carregar_planilha(empresa_id, url, filtros=()):
+    """Só as colunas usadas (e as linhas de `filtros`) via query gviz; ver consulta.py. Somente leitura."""
+    return COMPARTILHADO.obter((empresa_id, 'planilha', url, filtros), lambda: _carregar_planilha(url, filtros),
+                               validade=VALIDADE_PLANILHA)
+
+def _carregar_planilha(url, filtros):
     if not url:
         return pd.DataFrame()
     
     try:
-        if '/edit' in url:
-            csv_url = url.replace('/edit#gid=0', '/export?format=csv').replace('/edit', '/export?format=csv')
-        else:
-            csv_url = url
-        
-        response = requests.get(csv_url, timeout=10)
-        response.raise_for_status()
-        
-        df = pd.read_csv(StringIO(response.text))
-        
-        required_cols = ['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'estoque_max', 'custo_unitario']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        
-        if missing_cols:
-            st.error(f"❌ Colunas faltando: {missing_cols}")
+        try:
+            df = consulta.ler_planilha(url, COLUNAS, filtros, timeout=10)
+        except KeyError as e:
+            st.error(f"❌ Colunas faltando: {e}")
             return pd.DataFrame()
         
-        df = df.dropna(subset=['codigo', 'nome'])
-        df['estoque_atual'] = pd.to_numeric(df['estoque_atual'], errors='coerce').fillna(0)
-        df['estoque_min'] = pd.to_numeric(df['estoque_min'], errors='coerce').fillna(0)
-        df['estoque_max'] = pd.to_numeric(df['estoque_max'], errors='coerce').fillna(0)
-        df['custo_unitario'] = pd.to_numeric(df['custo_unitario'], errors='coerce').fillna(0)
+        with span('normalize', 'sheets'):
+            df = df.dropna(subset=['codigo', 'nome'])
+            df['codigo'] = df['codigo'].astype(str)
+            df['estoque_atual'] = pd.to_numeric(df['estoque_atual'], errors='coerce').fillna(0)
+            df['estoque_min'] = pd.to_numeric(df['estoque_min'], errors='coerce').fillna(0)
+            df['estoque_max'] = pd.to_numeric(df['estoque_max'], errors='coerce').fillna(0)
+            df['custo_unitario'] = pd.to_numeric(df['custo_unitario'], errors='coerce').fillna(0)
         
         return df
         
@@ -364,6 +381,18 @@ def carregar_planilha(url):
         st.error(f"❌ Erro ao carregar: {str(e)}")
         return pd.DataFrame()
 
+def filtros_da_url():
+    """
+    Filtros fixos pela URL do app (`?categoria=Casa`, `?criticos=1`): o
+    celular recebe da planilha só as linhas que vai mostrar.
+    """
+    filtros = []
+    if st.query_params.get('categoria'):
+        filtros.append(consulta.categoria_igual(st.query_params['categoria']))
+    if st.query_params.get('criticos') == '1':
+        filtros.append(consulta.ATE_O_MINIMO)
+    return tuple(filtros)
+
 def adicionar_status(df):
     if df.empty:
         return df
@@ -381,6 +410,43 @@ def adicionar_status(df):
     
     return df
 
+def preparar_planilha(empresa_id, versao, df):
+    """Status, índice e cubo categoria × status, uma vez por snapshot (somente leitura)."""
+    def preparar():
+        with span('derive', 'planilha'):
+            pronto = adicionar_status(df.copy())    # a planilha em cache é compartilhada
+            return pronto, construir_indice(pronto), resumo.construir_cubo(pronto)
+    return COMPARTILHADO.obter((empresa_id, 'preparado', versao), preparar)
+
+@st.cache_resource(max_entries=8)
+def figuras_mobile(versao, _cubo):
+    """Gráficos da aba Gráficos, uma vez por snapshot."""
+    with span('render', 'graficos'):
+        return _figuras_mobile(_cubo)
+
+def _figuras_mobile(cubo):
+    fig_pie = graficos.pizza_status(
+        resumo.por_status(cubo),
+        {'OK': '#28a745', 'ATENÇÃO': '#ffc107', 'CRÍTICO': '#dc3545'},
+        title="📊 Distribuição por Status",
+        height=300,
+        showlegend=False,
+        font=dict(size=12),
+        title_x=0.5
+    )
+    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+    fig_bar = graficos.barras_categoria(
+        resumo.por_categoria(cubo),
+        title="📦 Estoque por Categoria",
+        height=300,
+        title_x=0.5,
+        font=dict(size=12)
+    )
+    return fig_pie, fig_bar
+
+# Métricas por estágio (opt-in no painel de desempenho da sidebar)
+ligar_da_sessao()
+
 # Header Mobile
 st.markdown("""
 <div class="mobile-header fade-in">
@@ -389,22 +455,25 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# URL do Google Sheets (FIXO)
-sheets_url = "https://docs.google.com/spreadsheets/d/1PpiMQingHf4llA03BiPIuPJPIZqul4grRU_emWDEK1o/export?format=csv"
+# Empresa (empresas.json / ESTOQUE_EMPRESAS, ver empresas.py; ?empresa=<id> na
+# URL fixa a escolha) e a planilha do seu primeiro depósito
+EMPRESAS = empresas.carregar_empresas()
+EMPRESA = empresas.escolher(EMPRESAS, st.query_params.get('empresa'))
+if len(EMPRESAS) > 1 and not st.query_params.get('empresa'):
+    ids = list(EMPRESAS)
+    EMPRESA = EMPRESAS[st.selectbox("🏢 Empresa", ids, format_func=lambda i: EMPRESAS[i]['nome'])]
+sheets_url = EMPRESA['fontes'][0]['url']
 
 # Mostrar configuração
-st.success("✅ Planilha configurada automaticamente!")
-st.markdown("🔗 [Editar planilha no Google Sheets](https://docs.google.com/spreadsheets/d/1PpiMQingHf4llA03BiPIuPJPIZqul4grRU_emWDEK1o/edit?usp=sharing)")
-
-if sheets_url != st.session_state.get('sheets_url', ''):
-    st.session_state['sheets_url'] = sheets_url
-    st.cache_data.clear()
+st.success(f"✅ Planilha de {EMPRESA['nome']} configurada automaticamente!")
+if EMPRESA['edicao_url']:
+    st.markdown(f"🔗 [Editar planilha no Google Sheets]({EMPRESA['edicao_url']})")
 
 # Botões de controle
 col_ctrl1, col_ctrl2 = st.columns(2)
 with col_ctrl1:
     if st.button("🔄 Atualizar", use_container_width=True):
-        st.cache_data.clear()
+        COMPARTILHADO.descartar((EMPRESA['id'], 'planilha'))
         st.rerun()
 
 with col_ctrl2:
@@ -451,22 +520,28 @@ if not sheets_url:
 
 # Carregar dados
 with st.spinner("📊 Carregando dados..."):
-    produtos_df = carregar_planilha(sheets_url)
+    filtros_fixos = filtros_da_url()
+    produtos_df = carregar_planilha(EMPRESA['id'], sheets_url, filtros_fixos)
 
+if produtos_df.empty and filtros_fixos and 'versao' in produtos_df.attrs:
+    st.success("✅ Nenhum produto no filtro fixo da URL.")
+    st.stop()
 if produtos_df.empty:
     st.error("❌ Não foi possível carregar dados. Verifique a URL e permissões.")
     st.stop()
 
-produtos_df = adicionar_status(produtos_df)
+produtos_df, indice_produtos, cubo_produtos = preparar_planilha(EMPRESA['id'], produtos_df.attrs.get('versao'), produtos_df)
 
 # Status da conexão
 st.success(f"✅ {len(produtos_df)} produtos carregados • {datetime.now().strftime('%H:%M:%S')}")
+if filtros_fixos:
+    st.caption("📌 Filtro fixo pela URL: " + " e ".join(f"{c} {op} {v}" for c, op, v in filtros_fixos))
 
 # Métricas principais (mobile grid)
 total_produtos = len(produtos_df)
-produtos_ok = len(produtos_df[produtos_df['status'] == 'OK'])
-produtos_atencao = len(produtos_df[produtos_df['status'] == 'ATENÇÃO'])
-produtos_criticos = len(produtos_df[produtos_df['status'] == 'CRÍTICO'])
+produtos_ok = resumo.contar_status(cubo_produtos, 'OK')
+produtos_atencao = resumo.contar_status(cubo_produtos, 'ATENÇÃO')
+produtos_criticos = resumo.contar_status(cubo_produtos, 'CRÍTICO')
 
 st.markdown(f"""
 <div class="metric-grid fade-in">
@@ -489,98 +564,87 @@ st.markdown(f"""
 </div>
 """, unsafe_allow_html=True)
 
-# Navegação por abas mobile
+# Navegação por abas mobile. Produtos e Relatórios são fragmentos: filtro,
+# busca e botões de relatório reexecutam só a aba, não a carga nem o resto
+t_render = metricas.inicio()
 tab1, tab2, tab3 = st.tabs(["📦 Produtos", "📊 Gráficos", "📋 Relatórios"])
 
 with tab1:
-    # Filtros mobile
-    st.markdown('<div class="mobile-filters">', unsafe_allow_html=True)
-    
-    col_f1, col_f2 = st.columns(2)
-    with col_f1:
-        categoria_filter = st.selectbox(
-            "📂 Categoria:",
-            ['Todas'] + sorted(produtos_df['categoria'].unique().tolist()),
-            key="mobile_cat"
-        )
-    
-    with col_f2:
-        status_filter = st.selectbox(
-            "🚦 Status:",
-            ['Todos', 'CRÍTICO', 'ATENÇÃO', 'OK'],
-            key="mobile_status"
-        )
-    
-    busca_produto = st.text_input("🔍 Buscar:", placeholder="Nome ou código...", key="mobile_search")
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Aplicar filtros
-    df_filtrado = produtos_df.copy()
+    @st.fragment
+    @medido('fragment', 'produtos')
+    def aba_produtos():
+        # Filtros mobile
+        st.markdown('<div class="mobile-filters">', unsafe_allow_html=True)
+    
+        col_f1, col_f2 = st.columns(2)
+        with col_f1:
+            categoria_filter = st.selectbox(
+                "📂 Categoria:",
+                ['Todas'] + sorted(indice_produtos['categoria']),
+                key="mobile_cat", on_change=voltar_ao_inicio_da_lista
+            )
     
-    if categoria_filter != 'Todas':
-        df_filtrado = df_filtrado[df_filtrado['categoria'] == categoria_filter]
+        with col_f2:
+            status_filter = st.selectbox(
+                "🚦 Status:",
+                ['Todos', 'CRÍTICO', 'ATENÇÃO', 'OK'],
+                key="mobile_status", on_change=voltar_ao_inicio_da_lista
+            )
     
-    if status_filter != 'Todos':
-        df_filtrado = df_filtrado[df_filtrado['status'] == status_filter]
+        busca_produto = st.text_input("🔍 Buscar:", placeholder="Nome ou código...", key="mobile_search",
+                                       on_change=voltar_ao_inicio_da_lista)
     
-    if busca_produto:
-        mask = (df_filtrado['nome'].str.contains(busca_produto, case=False, na=False) | 
-                df_filtrado['codigo'].str.contains(busca_produto, case=False, na=False))
-        df_filtrado = df_filtrado[mask]
+        st.markdown('</div>', unsafe_allow_html=True)
     
-    # Lista de produtos mobile
-    if len(df_filtrado) > 0:
-        st.markdown('<div class="product-list fade-in">', unsafe_allow_html=True)
+        # Aplicar filtros (lookup no índice, sem copiar o catálogo)
+        with span('filter', 'produtos'):
+            df_filtrado = filtrar(produtos_df, indice_produtos, categoria_filter, status_filter)
         
-        for _, produto in df_filtrado.iterrows():
-            status_class = {
-                'OK': 'status-ok',
-                'ATENÇÃO': 'status-warning', 
-                'CRÍTICO': 'status-danger'
-            }.get(produto['status'], 'status-ok')
+            if busca_produto:
+                mask = (df_filtrado['nome'].str.contains(busca_produto, case=False, na=False) | 
+                        df_filtrado['codigo'].str.contains(busca_produto, case=False, na=False))
+                df_filtrado = df_filtrado[mask]
+    
+        # Lista de produtos mobile
+        if len(df_filtrado) > 0:
+            st.markdown('<div class="product-list fade-in">', unsafe_allow_html=True)
+        
+            limite = st.session_state.get(CHAVE_LIMITE, LIMITE_LISTA)
+            for _, produto in df_filtrado.head(limite).iterrows():
+                status_class = {
+                    'OK': 'status-ok',
+                    'ATENÇÃO': 'status-warning', 
+                    'CRÍTICO': 'status-danger'
+                }.get(produto['status'], 'status-ok')
             
-            st.markdown(f"""
-            <div class="product-item">
-                <div class="product-info">
-                    <div class="product-name">{produto['semaforo']} {produto['nome']}</div>
-                    <div class="product-details">{produto['codigo']} • {produto['categoria']} • Estoque: {produto['estoque_atual']}/{produto['estoque_min']}</div>
-                </div>
-                <div class="product-status">
-                    <span class="status-badge {status_class}">{produto['status']}</span>
+                st.markdown(f"""
+                <div class="product-item">
+                    <div class="product-info">
+                        <div class="product-name">{produto['semaforo']} {produto['nome']}</div>
+                        <div class="product-details">{produto['codigo']} • {produto['categoria']} • Estoque: {produto['estoque_atual']}/{produto['estoque_min']}</div>
+                    </div>
+                    <div class="product-status">
+                        <span class="status-badge {status_class}">{produto['status']}</span>
+                    </div>
                 </div>
-            </div>
-            """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
         
-        st.markdown('</div>', unsafe_allow_html=True)
-        st.caption(f"📊 Mostrando {len(df_filtrado)} de {len(produtos_df)} produtos")
-    else:
-        st.info("🔍 Nenhum produto encontrado com os filtros aplicados")
+            st.markdown('</div>', unsafe_allow_html=True)
+            st.caption(f"📊 Mostrando {min(limite, len(df_filtrado))} de {len(df_filtrado)} filtrados "
+                       f"({len(produtos_df)} produtos)")
+            if len(df_filtrado) > limite:
+                st.button(f"⬇️ Mostrar mais {LIMITE_LISTA}", use_container_width=True, key="mobile_mais",
+                          on_click=st.session_state.__setitem__, args=(CHAVE_LIMITE, limite + LIMITE_LISTA))
+        else:
+            st.info("🔍 Nenhum produto encontrado com os filtros aplicados")
+
+    aba_produtos()
 
 with tab2:
     # Gráfico de distribuição mobile
     st.markdown('<div class="chart-container-mobile fade-in">', unsafe_allow_html=True)
     
-    status_counts = produtos_df['status'].value_counts()
-    
-    fig_pie = px.pie(
-        values=status_counts.values,
-        names=status_counts.index,
-        color=status_counts.index,
-        color_discrete_map={
-            'OK': '#28a745',
-            'ATENÇÃO': '#ffc107',
-            'CRÍTICO': '#dc3545'
-        },
-        title="📊 Distribuição por Status"
-    )
-    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-    fig_pie.update_layout(
-        height=300, 
-        showlegend=False,
-        font=dict(size=12),
-        title_x=0.5
-    )
+    fig_pie, fig_bar = figuras_mobile(produtos_df.attrs.get('versao'), cubo_produtos)
     st.plotly_chart(fig_pie, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -588,111 +652,94 @@ with tab2:
     # Gráfico por categoria mobile
     st.markdown('<div class="chart-container-mobile fade-in">', unsafe_allow_html=True)
     
-    categoria_stats = produtos_df.groupby('categoria').agg({
-        'estoque_atual': 'sum',
-        'codigo': 'count'
-    }).reset_index()
-    categoria_stats.columns = ['Categoria', 'Estoque Total', 'Qtd Produtos']
-    
-    fig_bar = px.bar(
-        categoria_stats,
-        x='Categoria',
-        y='Estoque Total',
-        title="📦 Estoque por Categoria",
-        color='Estoque Total',
-        color_continuous_scale='viridis'
-    )
-    fig_bar.update_layout(
-        height=300,
-        title_x=0.5,
-        font=dict(size=12)
-    )
     st.plotly_chart(fig_bar, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
 with tab3:
-    # Seção de relatórios mobile
-    st.markdown('<div class="report-section-mobile fade-in">', unsafe_allow_html=True)
-    st.markdown("### 📋 Relatórios para Impressão")
-    
-    # Relatório de produtos críticos
-    if st.button("🔴 Produtos Críticos", use_container_width=True, key="rel1"):
-        produtos_criticos = produtos_df[produtos_df['status'] == 'CRÍTICO'].copy()
+    @st.fragment
+    @medido('fragment', 'relatorios')
+    def aba_relatorios():
+        # Seção de relatórios mobile
+        st.markdown('<div class="report-section-mobile fade-in">', unsafe_allow_html=True)
+        st.markdown("### 📋 Relatórios para Impressão")
+    
+        # Relatório de produtos críticos
+        if st.button("🔴 Produtos Críticos", use_container_width=True, key="rel1"):
+            produtos_criticos = filtrar(produtos_df, indice_produtos, status='CRÍTICO')
         
-        if len(produtos_criticos) > 0:
-            produtos_criticos['qtd_faltante'] = produtos_criticos['estoque_min'] - produtos_criticos['estoque_atual']
-            produtos_criticos['valor_reposicao'] = produtos_criticos['qtd_faltante'] * produtos_criticos['custo_unitario']
+            if len(produtos_criticos) > 0:
+                produtos_criticos['qtd_faltante'] = produtos_criticos['estoque_min'] - produtos_criticos['estoque_atual']
+                produtos_criticos['valor_reposicao'] = produtos_criticos['qtd_faltante'] * produtos_criticos['custo_unitario']
             
-            relatorio = produtos_criticos[['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'qtd_faltante', 'valor_reposicao']].copy()
-            relatorio.columns = ['Código', 'Produto', 'Categoria', 'Atual', 'Mín', 'Faltante', 'Valor']
+                relatorio = produtos_criticos[['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'qtd_faltante', 'valor_reposicao']]
+                relatorio.columns = ['Código', 'Produto', 'Categoria', 'Atual', 'Mín', 'Faltante', 'Valor']
             
-            st.markdown("#### 🔴 PRODUTOS CRÍTICOS")
-            st.markdown(f"**📅 {datetime.now().strftime('%d/%m/%Y %H:%M')}**")
-            st.markdown(f"**📊 Total:** {len(produtos_criticos)} produtos")
-            st.markdown(f"**💰 Valor reposição:** R$ {relatorio['Valor'].sum():,.2f}")
+                st.markdown("#### 🔴 PRODUTOS CRÍTICOS")
+                st.markdown(f"**📅 {datetime.now().strftime('%d/%m/%Y %H:%M')}**")
+                st.markdown(f"**📊 Total:** {len(produtos_criticos)} produtos")
+                st.markdown(f"**💰 Valor reposição:** R$ {relatorio['Valor'].sum():,.2f}")
             
-            st.dataframe(relatorio, use_container_width=True)
+                st.dataframe(relatorio, use_container_width=True)
             
-            csv_data = relatorio.to_csv(index=False)
-            st.download_button(
-                label="💾 Baixar CSV",
-                data=csv_data,
-                file_name=f"criticos_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-                mime="text/csv",
-                use_container_width=True
+                botao_exportar(relatorio, "criticos", versao=produtos_df.attrs.get('versao'),
+                               chave=filtros_fixos, rotulo="💾", seletor=False, empresa=EMPRESA['id'],
+                               use_container_width=True)
+            else:
+                st.success("✅ Nenhum produto crítico!")
+    
+        # Relatório geral
+        if st.button("📊 Relatório Geral", use_container_width=True, key="rel2"):
+            relatorio_final = produtos_df[['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'status']].assign(
+                valor_estoque=produtos_df['estoque_atual'] * produtos_df['custo_unitario']
             )
-        else:
-            st.success("✅ Nenhum produto crítico!")
-    
-    # Relatório geral
-    if st.button("📊 Relatório Geral", use_container_width=True, key="rel2"):
-        relatorio_geral = produtos_df.copy()
-        relatorio_geral['valor_estoque'] = relatorio_geral['estoque_atual'] * relatorio_geral['custo_unitario']
+            relatorio_final.columns = ['Código', 'Produto', 'Categoria', 'Atual', 'Mín', 'Status', 'Valor']
+            tot_geral = resumo.totais(cubo_produtos)
         
-        relatorio_final = relatorio_geral[['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'status', 'valor_estoque']].copy()
-        relatorio_final.columns = ['Código', 'Produto', 'Categoria', 'Atual', 'Mín', 'Status', 'Valor']
-        
-        st.markdown("#### 📊 RELATÓRIO GERAL")
-        st.markdown(f"**📅 {datetime.now().strftime('%d/%m/%Y %H:%M')}**")
+            st.markdown("#### 📊 RELATÓRIO GERAL")
+            st.markdown(f"**📅 {datetime.now().strftime('%d/%m/%Y %H:%M')}**")
         
-        col_res1, col_res2 = st.columns(2)
-        with col_res1:
-            st.metric("Produtos", len(produtos_df))
-            st.metric("Valor Total", f"R$ {relatorio_final['Valor'].sum():,.2f}")
-        with col_res2:
-            st.metric("Unidades", f"{relatorio_final['Atual'].sum():,.0f}")
-            ocupacao = (produtos_df['estoque_atual'] / produtos_df['estoque_max'] * 100).mean()
-            st.metric("Ocupação", f"{ocupacao:.1f}%")
+            col_res1, col_res2 = st.columns(2)
+            with col_res1:
+                st.metric("Produtos", tot_geral['qtd'])
+                st.metric("Valor Total", f"R$ {tot_geral['valor']:,.2f}")
+            with col_res2:
+                st.metric("Unidades", f"{tot_geral['unidades']:,.0f}")
+                st.metric("Ocupação", f"{tot_geral['ocupacao']:.1f}%")
         
-        st.dataframe(relatorio_final, use_container_width=True)
+            st.dataframe(relatorio_final, use_container_width=True)
         
-        csv_data = relatorio_final.to_csv(index=False)
-        st.download_button(
-            label="💾 Baixar CSV",
-            data=csv_data,
-            file_name=f"geral_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-            mime="text/csv",
-            use_container_width=True
-        )
+            botao_exportar(relatorio_final, "geral", versao=produtos_df.attrs.get('versao'),
+                           chave=filtros_fixos, rotulo="💾", seletor=False, empresa=EMPRESA['id'],
+                           use_container_width=True)
     
-    st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    aba_relatorios()
+
+metricas.fim('render', t_render, 'abas')
 
 # Alertas críticos (sempre visível)
-produtos_criticos_lista = produtos_df[produtos_df['status'] == 'CRÍTICO']
-if len(produtos_criticos_lista) > 0:
+n_criticos = resumo.contar_status(cubo_produtos, 'CRÍTICO')
+if n_criticos > 0:
     st.markdown(f"""
     <div class="alert-danger-mobile fade-in">
-        <strong>🚨 {len(produtos_criticos_lista)} produto(s) crítico(s)!</strong><br>
+        <strong>🚨 {n_criticos} produto(s) crítico(s)!</strong><br>
         Necessária reposição urgente de estoque.
     </div>
     """, unsafe_allow_html=True)
 
-# Auto-refresh
+mostrar_painel()
+
+# Auto-refresh: fragmento com run_every dispara o rerun do app a cada 30 s
+# sem prender o script (um time.sleep aqui travava as interações e os fragmentos)
 if auto_refresh:
-    import time
-    time.sleep(30)
-    st.rerun()
+    @st.fragment(run_every=30)
+    def auto_atualizar(carregado_em):
+        if time.monotonic() - carregado_em >= 29:
+            st.rerun()
+
+    auto_atualizar(time.monotonic())
 
 # Footer mobile
 st.markdown("""
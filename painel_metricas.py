@@ -0,0 +1,57 @@
+# painel_metricas.py
+"""Painel de debug (sidebar) com os spans de metricas.py — usado pelos dois apps."""
+import pandas as pd
+import streamlit as st
+
+import metricas
+from cache_memoria import COMPARTILHADO
+
+CHAVE = 'debug_metricas'
+
+
+def ligar_da_sessao():
+    """Chamar no topo do script: liga a coleta se o painel estiver marcado."""
+    metricas.ativar(st.session_state.get(CHAVE, False) or metricas.PADRAO)
+
+
+def mostrar_painel():
+    """Checkbox opt-in + tabela por estágio + exports JSON/Prometheus."""
+    ligado = st.sidebar.checkbox("🐞 Painel de desempenho", key=CHAVE)
+    if not ligado:
+        return
+    mostrar_cache()
+    with st.sidebar.expander("⏱️ Tempos por estágio", expanded=True):
+        linhas = metricas.resumo()
+        if not linhas:
+            st.caption("Sem medições ainda — interaja com o app.")
+            return
+        tbl = pd.DataFrame(linhas)[['estagio', 'rotulo', 'contagem', 'p50_ms', 'p95_ms', 'max_ms']]
+        st.dataframe(tbl.round(1), use_container_width=True, hide_index=True)
+
+        ult = metricas.recentes(15)
+        st.caption("Últimos spans: " + " · ".join(f"{e}/{r or '-'} {s*1000:.0f}ms" for _, e, r, s in ult))
+
+        c1, c2 = st.columns(2)
+        with c1:
+            st.download_button("JSON", metricas.exportar_json(), file_name="metricas.json",
+                               mime="application/json", use_container_width=True)
+        with c2:
+            st.download_button("Prometheus", metricas.exportar_prometheus(), file_name="metricas.prom",
+                               mime="text/plain", use_container_width=True)
+        if st.button("Zerar métricas", use_container_width=True):
+            metricas.resetar()
+
+
+def mostrar_cache():
+    """Ocupação do cache compartilhado (cache_memoria.py) por empresa."""
+    est = COMPARTILHADO.estatisticas()
+    mb = 2**20
+    with st.sidebar.expander(f"🧠 Cache: {est['bytes'] / mb:.0f} / {est['orcamento'] / mb:.0f} MB"):
+        if not est['donos']:
+            st.caption("Cache vazio.")
+            return
+        tbl = pd.DataFrame([{'dono': d, 'MB': v['bytes'] / mb, **{k: v[k] for k in ('itens', 'acertos', 'faltas', 'despejos')}}
+                            for d, v in est['donos'].items()]).sort_values('MB', ascending=False)
+        st.dataframe(tbl.round(1), use_container_width=True, hide_index=True)
+        if est['recusados']:
+            st.caption(f"{est['recusados']} item(ns) maior(es) que o orçamento ficaram fora do cache (ESTOQUE_CACHE_MB).")
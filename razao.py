@@ -0,0 +1,330 @@
+# razao.py
+"""
+Conciliação do estoque da planilha com o histórico de movimentos
+(aba historico_baixas).
+
+O histórico é um razão: cada linha é uma entrada (+) ou saída (−) de um
+SKU. Reproduzido a partir de um saldo inicial, dá o estoque esperado de
+cada SKU, comparado com o estoque_atual da planilha — diferença é
+movimento que não passou pelo app/webhook (edição manual, linha apagada)
+ou registro errado.
+
+Saldo inicial de cada SKU, nesta ordem: o do checkpoint (ver Razao), o
+estoque_anterior do primeiro movimento (quando o Apps Script grava
+antes/depois) ou zero. Com estoque_anterior/estoque_novo no histórico,
+cada linha também é conferida: novo = anterior ± quantidade, e o
+anterior de um movimento bate com o novo do movimento anterior do SKU.
+
+Tudo vetorizado: saldos por SKU saem de um groupby().cumsum() dos deltas
+na ordem da aba, sem loop por linha. A Razao guarda um checkpoint (linhas
+já lidas, hash delas e saldos por SKU): se a aba só cresceu, só as linhas
+novas são reproduzidas sobre os saldos guardados; se algo antes mudou, o
+histórico é reproduzido de novo a partir da base aceita (ou do início).
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from estoque import normalize_key
+from metricas import span
+
+CHECKPOINT_PADRAO = os.environ.get('ESTOQUE_RAZAO', 'razao_historico.json')
+SINAIS = {'ENTRADA': 1, 'SAIDA': -1}
+LINHA_CABECALHO = 2     # linha da planilha = posição no histórico + 2 (cabeçalho na linha 1)
+COLUNAS_SALDO = ['codigo_key', 'codigo', 'saldo_inicial', 'origem', 'entradas', 'saidas',
+                 'movimentos', 'esperado', 'ultimo_registrado']
+COLUNAS_OCORRENCIA = ['linha', 'codigo', 'codigo_key', 'tipo', 'detalhe']
+COLUNAS_BASE = ['codigo_key', 'codigo', 'saldo']       # estoque aceito em Razao.rebasear
+SITUACOES = ('divergente', 'fora_do_catalogo', 'ok')
+
+
+def movimentos(hist, inicio=0, chaves_conhecidas=None):
+    """
+    Histórico (como lido da aba) -> (movimentos, inválidos).
+    movimentos: linha, codigo, codigo_key, delta, anterior, novo — na ordem da aba.
+    `inicio`: posição da primeira linha de `hist` no histórico inteiro;
+    `chaves_conhecidas`: {codigo: codigo_key} já calculadas (normalize_key só
+    para o resto).
+    """
+    h = hist.rename(columns=lambda c: str(c).strip().lower())
+    for c in ('codigo', 'tipo', 'quantidade'):
+        if c not in h.columns:
+            raise KeyError(f"historico_baixas sem a coluna '{c}'")
+    codigo = h['codigo'].astype(str).str.strip()
+    unicos = codigo.unique()
+    conhecidas = chaves_conhecidas or {}
+    chaves = pd.Series([conhecidas.get(c) or normalize_key(c) for c in unicos], index=unicos)
+    tipos = h['tipo'].astype(str).unique()
+    sinais = pd.Series([SINAIS.get(normalize_key(t)) for t in tipos], index=tipos, dtype='float64')
+
+    mov = pd.DataFrame({
+        'linha': np.arange(inicio, inicio + len(h)) + LINHA_CABECALHO,
+        'codigo': codigo.to_numpy(),
+        'codigo_key': chaves[codigo.to_numpy()].to_numpy(),
+        'delta': sinais[h['tipo'].astype(str).to_numpy()].to_numpy() * pd.to_numeric(h['quantidade'], errors='coerce').to_numpy(),
+        'anterior': pd.to_numeric(h['estoque_anterior'], errors='coerce').to_numpy() if 'estoque_anterior' in h else np.nan,
+        'novo': pd.to_numeric(h['estoque_novo'], errors='coerce').to_numpy() if 'estoque_novo' in h else np.nan,
+    })
+    ruins = mov['delta'].isna() | (mov['codigo_key'] == '')
+    invalidos = mov.loc[ruins, ['linha', 'codigo', 'codigo_key']].assign(
+        tipo='movimento_invalido',
+        detalhe=('tipo ' + h.loc[ruins.to_numpy(), 'tipo'].astype(str).to_numpy() + ', quantidade '
+                 + h.loc[ruins.to_numpy(), 'quantidade'].astype(str).to_numpy()),
+    )
+    return mov[~ruins].reset_index(drop=True), invalidos.reset_index(drop=True)
+
+
+def reproduzir(mov, base=None):
+    """
+    Reproduz os movimentos sobre `base` (Series codigo_key -> saldo; SKUs
+    fora dela partem do estoque_anterior do 1º movimento, ou de zero).
+    Retorna (saldos por SKU em COLUNAS_SALDO, ocorrências por linha).
+    """
+    if mov.empty:
+        return pd.DataFrame(columns=COLUNAS_SALDO), pd.DataFrame(columns=COLUNAS_OCORRENCIA)
+    chave = mov['codigo_key']
+    g = mov.groupby('codigo_key', sort=False)
+    primeiro = g.head(1).set_index('codigo_key')
+
+    inicial = pd.Series(np.nan, index=primeiro.index)
+    origem = pd.Series('zero', index=primeiro.index, dtype=object)
+    tem_anterior = primeiro['anterior'].notna()
+    inicial[tem_anterior] = primeiro.loc[tem_anterior, 'anterior']
+    origem[tem_anterior] = 'historico'
+    if base is not None and len(base):
+        # isin em object: o de strings arrow converte o conjunto elemento a elemento
+        da_base = pd.Series(inicial.index, dtype=object).isin(base.index.to_numpy(dtype=object)).to_numpy()
+        inicial[da_base] = base.reindex(inicial.index[da_base]).to_numpy()
+        origem[da_base] = 'checkpoint'
+    inicial = inicial.fillna(0)
+
+    # saldo antes de cada linha: inicial do SKU + deltas acumulados até a anterior
+    antes = inicial.reindex(chave).to_numpy() + g['delta'].cumsum().to_numpy() - mov['delta'].to_numpy()
+    ocorrencias = _conferir_linhas(mov, g, antes, origem)
+
+    saldos = pd.DataFrame({
+        'codigo': g['codigo'].last(),
+        'saldo_inicial': inicial,
+        'origem': origem,
+        'entradas': mov['delta'].clip(lower=0).groupby(chave, sort=False).sum(),
+        'saidas': (-mov['delta']).clip(lower=0).groupby(chave, sort=False).sum(),
+        'movimentos': g.size(),
+        'ultimo_registrado': g['novo'].last(),
+    })
+    saldos['esperado'] = saldos['saldo_inicial'] + saldos['entradas'] - saldos['saidas']
+    return saldos.rename_axis('codigo_key').reset_index()[COLUNAS_SALDO], ocorrencias
+
+
+def _conferir_linhas(mov, g, antes, origem):
+    """Linhas com antes/depois gravados que não fecham (só quando a aba tem essas colunas)."""
+    partes = []
+    tem = mov['anterior'].notna() & mov['novo'].notna()
+    if not tem.any():
+        return pd.DataFrame(columns=COLUNAS_OCORRENCIA)
+    fmt = lambda s: s.map('{:g}'.format)
+
+    erro = tem & (mov['novo'] != mov['anterior'] + mov['delta'])
+    if erro.any():
+        m = mov[erro]
+        partes.append(m[['linha', 'codigo', 'codigo_key']].assign(
+            tipo='registro_inconsistente',
+            detalhe='anterior ' + fmt(m['anterior']) + ' ' + np.where(m['delta'] >= 0, '+', '−')
+                    + ' ' + fmt(m['delta'].abs()) + ' ≠ novo ' + fmt(m['novo'])))
+
+    # o anterior gravado deve ser o novo do movimento anterior do SKU (no 1º
+    # movimento, o saldo do checkpoint): diferença = mexeram na planilha por fora
+    previsto = g['novo'].shift()
+    primeira = ~mov['codigo_key'].duplicated()
+    do_checkpoint = primeira & (origem.reindex(mov['codigo_key']).to_numpy() == 'checkpoint')
+    previsto[do_checkpoint] = antes[do_checkpoint.to_numpy()]
+    salto = mov['anterior'].notna() & previsto.notna() & (mov['anterior'] != previsto)
+    if salto.any():
+        m, p = mov[salto], previsto[salto]
+        partes.append(m[['linha', 'codigo', 'codigo_key']].assign(
+            tipo='salto', detalhe='anterior ' + fmt(m['anterior']) + ', esperado ' + fmt(p)))
+    if not partes:
+        return pd.DataFrame(columns=COLUNAS_OCORRENCIA)
+    return pd.concat(partes).sort_values('linha', kind='stable').reset_index(drop=True)[COLUNAS_OCORRENCIA]
+
+
+def juntar(anteriores, novos):
+    """Saldos do checkpoint + saldos das linhas novas (reproduzidas com base nos anteriores)."""
+    if anteriores.empty:
+        return novos
+    if novos.empty:
+        return anteriores
+    return pd.concat([anteriores, novos], ignore_index=True).groupby('codigo_key', sort=False).agg(
+        codigo=('codigo', 'last'), saldo_inicial=('saldo_inicial', 'first'), origem=('origem', 'first'),
+        entradas=('entradas', 'sum'), saidas=('saidas', 'sum'), movimentos=('movimentos', 'sum'),
+        esperado=('esperado', 'last'), ultimo_registrado=('ultimo_registrado', 'last'),
+    ).reset_index()[COLUNAS_SALDO]
+
+
+def conciliar(saldos, catalogo, tolerancia=0):
+    """
+    Saldos esperados × estoque_atual do catálogo, um SKU por linha (os do
+    razão: com movimento ou vindos de rebasear). situacao: divergente,
+    fora_do_catalogo ou ok — nessa ordem, maiores diferenças primeiro.
+    """
+    cat = catalogo.drop_duplicates('codigo_key')[['codigo_key', 'nome', 'estoque_atual']]
+    df = saldos.merge(cat, on='codigo_key', how='left')
+    df['estoque_planilha'] = pd.to_numeric(df['estoque_atual'], errors='coerce')
+    df['diferenca'] = df['estoque_planilha'] - df['esperado']
+    df['situacao'] = np.select(
+        [df['estoque_planilha'].isna(), df['diferenca'].abs() > tolerancia],
+        ['fora_do_catalogo', 'divergente'], 'ok')
+    ordem = df['situacao'].map({s: i for i, s in enumerate(SITUACOES)})
+    return df.assign(_o=ordem, _d=-df['diferenca'].abs()).sort_values(['_o', '_d', 'codigo_key'], kind='stable')[
+        ['codigo', 'codigo_key', 'nome', 'situacao', 'estoque_planilha', 'esperado', 'diferenca',
+         'saldo_inicial', 'origem', 'entradas', 'saidas', 'movimentos', 'ultimo_registrado']
+    ].reset_index(drop=True)
+
+
+def _hashes(hist):
+    return pd.util.hash_pandas_object(hist, index=False).to_numpy()
+
+
+def _digest(h, n):
+    """Digest das `n` primeiras linhas, na ordem: trocar duas linhas de lugar muda o digest."""
+    return hashlib.sha1(h[:n].tobytes()).hexdigest()
+
+
+class Razao:
+    """
+    Reprodução incremental do histórico com checkpoint em JSON (`caminho`;
+    None = só em memória). Thread-safe dentro do processo.
+
+    Dois pontos no checkpoint: o cursor (linhas já lidas + hash + saldos),
+    que avança a cada atualização, e a base aceita em `rebasear` (posição,
+    hash das linhas até ali e estoque aceito), que só muda em `rebasear`.
+    Se uma linha já lida mudar, o histórico é reproduzido a partir da base,
+    não do zero; se a mudança for antes da base, ela é mantida e o
+    resultado traz base_alterada=True.
+    """
+
+    def __init__(self, caminho=CHECKPOINT_PADRAO):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self.checkpoint = self._carregar()
+
+    @staticmethod
+    def _vazio():
+        return {'linhas': 0, 'hash': '0', 'saldos': pd.DataFrame(columns=COLUNAS_SALDO),
+                'ocorrencias': pd.DataFrame(columns=COLUNAS_OCORRENCIA), 'base': None, 'base_alterada': False}
+
+    def _carregar(self):
+        try:
+            with open(self.caminho, encoding='utf-8') as f:
+                d = json.load(f)
+        except (FileNotFoundError, TypeError, ValueError):
+            return self._vazio()
+        base = d.get('base')
+        if base is not None:
+            base = {**base, 'saldos': pd.DataFrame(base['saldos'], columns=COLUNAS_BASE)}
+        return {'linhas': d['linhas'], 'hash': d['hash'],
+                'saldos': pd.DataFrame(d['saldos'], columns=COLUNAS_SALDO),
+                'ocorrencias': pd.DataFrame(d['ocorrencias'], columns=COLUNAS_OCORRENCIA),
+                'base': base, 'base_alterada': d.get('base_alterada', False)}
+
+    def _gravar(self):
+        """
+        Como estoque._gravar_json (.tmp + troca de nome), mas colunas como
+        listas, json.dumps e sem indent: json.dump e indent caem no encoder em
+        Python, lento para dezenas de milhares de SKUs.
+        """
+        if not self.caminho:
+            return
+        cp = self.checkpoint
+        base = cp['base']
+        if base is not None:
+            base = {**base, 'saldos': {c: base['saldos'][c].tolist() for c in COLUNAS_BASE}}
+        pasta = os.path.dirname(self.caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        tmp = f"{self.caminho}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'linhas': cp['linhas'], 'hash': cp['hash'],
+                                'saldos': {c: cp['saldos'][c].tolist() for c in COLUNAS_SALDO},
+                                'ocorrencias': {c: cp['ocorrencias'][c].tolist() for c in COLUNAS_OCORRENCIA},
+                                'base': base, 'base_alterada': cp['base_alterada']},
+                               ensure_ascii=False))
+        os.replace(tmp, self.caminho)
+
+    def _recomecar(self, h):
+        """Cursor na base aceita (ou no zero, sem base) para reproduzir de novo."""
+        base = self.checkpoint['base']
+        if base is None:
+            return self._vazio()
+        n = min(base['linhas'], len(h))
+        alterada = n < base['linhas'] or _digest(h, n) != base['hash']
+        return {**self._vazio(), 'linhas': n, 'saldos': _saldos_da_base(base['saldos']),
+                'base': base, 'base_alterada': alterada}
+
+    def atualizar(self, hist):
+        """
+        Reproduz o que faltar do histórico. dict: saldos, ocorrencias,
+        linhas (total), novas (reproduzidas agora), incremental (bool: do
+        cursor, sem reproduzir de novo), com_base (há base aceita),
+        base_aceita_em (quando a base foi aceita; identifica a base) e
+        base_alterada (linhas antes da base mudaram).
+        """
+        with self._lock, span('derive', 'razao'):
+            cp = self.checkpoint
+            h = _hashes(hist)
+            n = cp['linhas']
+            incremental = 0 < n <= len(hist) and _digest(h, n) == cp['hash']
+            if not incremental:
+                cp = self._recomecar(h)
+                n = cp['linhas']
+            if n < len(hist) or not incremental:
+                conhecidas = dict(zip(cp['saldos']['codigo'].tolist(), cp['saldos']['codigo_key'].tolist()))
+                mov, invalidos = movimentos(hist.iloc[n:], inicio=n, chaves_conhecidas=conhecidas)
+                base = cp['saldos'].set_index('codigo_key')['esperado'] if not cp['saldos'].empty else None
+                novos, ocorrencias = reproduzir(mov, base)
+                partes = [o for o in (cp['ocorrencias'], invalidos, ocorrencias) if not o.empty]
+                self.checkpoint = {
+                    **cp, 'linhas': len(hist), 'hash': _digest(h, len(h)),
+                    'saldos': juntar(cp['saldos'], novos),
+                    'ocorrencias': pd.concat(partes, ignore_index=True) if partes else cp['ocorrencias'],
+                }
+                self._gravar()
+            cp = self.checkpoint
+            return {'saldos': cp['saldos'], 'ocorrencias': cp['ocorrencias'], 'linhas': cp['linhas'],
+                    'novas': cp['linhas'] - n, 'incremental': incremental,
+                    'com_base': cp['base'] is not None, 'base_aceita_em': (cp['base'] or {}).get('aceita_em'),
+                    'base_alterada': cp['base_alterada']}
+
+    def rebasear(self, catalogo):
+        """
+        Aceita o estoque atual da planilha como saldo inicial de todos os SKUs
+        na posição atual do histórico: as próximas divergências são só das
+        linhas que vierem depois (ocorrências antigas são descartadas).
+        """
+        with self._lock:
+            cat = catalogo.drop_duplicates('codigo_key')
+            aceito = pd.DataFrame({
+                'codigo_key': cat['codigo_key'].to_numpy(), 'codigo': cat['codigo'].astype(str).to_numpy(),
+                'saldo': pd.to_numeric(cat['estoque_atual'], errors='coerce').fillna(0).to_numpy(),
+            })
+            cp = self.checkpoint
+            self.checkpoint = {**cp, 'saldos': _saldos_da_base(aceito),
+                               'ocorrencias': pd.DataFrame(columns=COLUNAS_OCORRENCIA),
+                               'base': {'linhas': cp['linhas'], 'hash': cp['hash'], 'saldos': aceito,
+                                        'aceita_em': datetime.now().isoformat(timespec='microseconds')},
+                               'base_alterada': False}
+            self._gravar()
+
+
+def _saldos_da_base(aceito):
+    """Estoque aceito em rebasear -> saldos sem movimento, partindo dele."""
+    return pd.DataFrame({
+        'codigo_key': aceito['codigo_key'].to_numpy(), 'codigo': aceito['codigo'].to_numpy(),
+        'saldo_inicial': aceito['saldo'].to_numpy(dtype=float), 'origem': 'checkpoint', 'entradas': 0.0,
+        'saidas': 0.0, 'movimentos': 0, 'esperado': aceito['saldo'].to_numpy(dtype=float),
+        'ultimo_registrado': np.nan,
+    })[COLUNAS_SALDO]
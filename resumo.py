@@ -0,0 +1,83 @@
+# resumo.py
+"""
+Cubo de resumo categoria × status por snapshot.
+
+Métricas e gráficos do dashboard leem deste cubo (poucas linhas) em vez de
+varrer o catálogo a cada rerun, para qualquer combinação de filtros.
+"""
+import numpy as np
+import pandas as pd
+
+from filtros import TODAS
+
+MEDIDAS = ['qtd', 'unidades', 'valor', 'soma_ocupacao', 'n_ocupacao']
+
+
+def construir_cubo(df, col_categoria='categoria', col_status='status'):
+    """
+    Agrega o snapshot por (categoria, status):
+      qtd, unidades (estoque_atual), valor (estoque × custo_unitario),
+      soma_ocupacao / n_ocupacao (estoque_atual / estoque_max, só finitos)
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=[col_categoria, col_status] + MEDIDAS)
+
+    atual = pd.to_numeric(df['estoque_atual'], errors='coerce').fillna(0)
+    if 'custo_unitario' in df.columns:
+        custo = pd.to_numeric(df['custo_unitario'], errors='coerce').fillna(0)
+    else:
+        custo = 0
+    maximo = pd.to_numeric(df.get('estoque_max', np.nan), errors='coerce')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ocup = atual / maximo * 100
+    ocup_ok = np.isfinite(ocup)
+
+    base = pd.DataFrame({
+        col_categoria: df[col_categoria].to_numpy(),
+        col_status: df[col_status].to_numpy(),
+        'qtd': 1,
+        'unidades': atual.to_numpy(),
+        'valor': (atual * custo).to_numpy(),
+        'soma_ocupacao': ocup.where(ocup_ok, 0).to_numpy(),
+        'n_ocupacao': ocup_ok.astype(int).to_numpy(),
+    })
+    return base.groupby([col_categoria, col_status], sort=False, dropna=False, as_index=False)[MEDIDAS].sum()
+
+
+def fatia(cubo, categoria=None, status=None, col_categoria='categoria', col_status='status'):
+    """Linhas do cubo para o filtro. `status` aceita um valor ou uma lista."""
+    f = cubo
+    if categoria not in TODAS:
+        f = f[f[col_categoria] == categoria]
+    if isinstance(status, (list, tuple, set)):
+        f = f[f[col_status].isin(list(status))]
+    elif status not in TODAS:
+        f = f[f[col_status] == status]
+    return f
+
+
+def totais(f):
+    """Totais de uma fatia: qtd, unidades, valor e ocupação média (%)."""
+    n_ocup = f['n_ocupacao'].sum()
+    return {
+        'qtd': int(f['qtd'].sum()),
+        'unidades': float(f['unidades'].sum()),
+        'valor': float(f['valor'].sum()),
+        'ocupacao': float(f['soma_ocupacao'].sum() / n_ocup) if n_ocup else 0.0,
+    }
+
+
+def contar_status(f, status, col_status='status'):
+    """Quantidade de produtos com o status na fatia."""
+    return int(f.loc[f[col_status] == status, 'qtd'].sum())
+
+
+def por_status(f, medida='qtd', col_status='status'):
+    """Série status -> medida (ordem decrescente, como value_counts)."""
+    s = f.groupby(col_status, sort=False)[medida].sum()
+    return s[s > 0].sort_values(ascending=False)
+
+
+def por_categoria(f, medida='unidades', col_categoria='categoria'):
+    """Série categoria -> medida (ordem decrescente)."""
+    return f.groupby(col_categoria, sort=False)[medida].sum().sort_values(ascending=False)
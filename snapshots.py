@@ -0,0 +1,148 @@
+# snapshots.py
+"""
+Diferenças linha a linha entre snapshots consecutivos do catálogo.
+
+Cada linha é resumida num hash (por `codigo_key`); comparando os hashes de
+dois snapshots saem os conjuntos adicionados / removidos / alterados. Com
+eles, os campos derivados, o índice categoria × status e o cubo de resumo
+são atualizados só para o delta, em vez de recalculados do zero.
+"""
+import numpy as np
+import pandas as pd
+
+from filtros import construir_indice
+import resumo
+
+CHAVE = 'codigo_key'
+
+
+def hash_linhas(df, chave=CHAVE):
+    """Série chave -> hash (uint64) do conteúdo da linha (colunas em ordem alfabética)."""
+    cols = sorted(df.columns)
+    h = pd.util.hash_pandas_object(df[cols], index=False)
+    return pd.Series(h.to_numpy(), index=df[chave].to_numpy())
+
+
+def diferencas(h_anterior, h_atual):
+    """
+    Compara dois `hash_linhas`. Retorna dict de listas de chaves:
+      adicionados, removidos, alterados
+    """
+    ant = h_anterior[~h_anterior.index.duplicated()]
+    atu = h_atual[~h_atual.index.duplicated()]
+    comuns = atu.index.intersection(ant.index)
+    alterados = comuns[atu.loc[comuns].to_numpy() != ant.loc[comuns].to_numpy()]
+    return {
+        'adicionados': atu.index.difference(ant.index).tolist(),
+        'removidos': ant.index.difference(atu.index).tolist(),
+        'alterados': alterados.tolist(),
+    }
+
+
+def total_mudancas(mudancas):
+    return sum(len(v) for v in mudancas.values())
+
+
+def atualizar(anterior, novo, mudancas, derivar, chave=CHAVE):
+    """
+    Prepara `novo` reaproveitando `anterior` (já derivado, com índice e cubo).
+
+    `anterior`: (df, indice, cubo) do snapshot anterior.
+    `derivar(df)`: adiciona os campos derivados linha a linha (in place).
+    Retorna (df, indice, cubo) equivalentes a derivar + indexar + resumir `novo`.
+    Chaves repetidas em qualquer lado → recalcula tudo.
+    """
+    df_ant, indice_ant, cubo_ant = anterior
+    if not (df_ant[chave].is_unique and novo[chave].is_unique):
+        derivar(novo)
+        return novo, construir_indice(novo), resumo.construir_cubo(novo)
+
+    tocados = set(mudancas['adicionados']) | set(mudancas['alterados'])
+    derivadas = [c for c in df_ant.columns if c not in novo.columns]
+
+    # campos derivados: copia das linhas intactas, recalcula só as tocadas
+    base = df_ant.set_index(chave)[derivadas].reindex(novo[chave].to_numpy())
+    for c in derivadas:
+        novo[c] = base[c].to_numpy()
+    mask = novo[chave].isin(tocados).to_numpy()
+    if mask.any():
+        parte = novo.loc[mask].copy()
+        derivar(parte)
+        for c in derivadas:
+            novo.loc[mask, c] = parte[c].to_numpy()
+
+    # cubo: soma as versões novas e subtrai as antigas das linhas mudadas
+    saiu = df_ant[df_ant[chave].isin(set(mudancas['removidos']) | set(mudancas['alterados']))]
+    entrou = novo.loc[mask]
+    cubo = _somar_cubos(cubo_ant, resumo.construir_cubo(entrou), resumo.construir_cubo(saiu))
+
+    # índice: mesmas chaves na mesma ordem → só reposiciona as linhas alteradas
+    if np.array_equal(df_ant[chave].to_numpy(), novo[chave].to_numpy()):
+        indice = _reindexar(indice_ant, df_ant, novo, np.flatnonzero(mask))
+    else:
+        indice = construir_indice(novo)
+    return novo, indice, cubo
+
+
+def _somar_cubos(cubo, mais, menos, dims=('categoria', 'status')):
+    dims = list(dims)
+    if mais.empty and menos.empty:
+        return cubo
+    partes = [cubo, mais, menos.assign(**{m: -menos[m] for m in resumo.MEDIDAS})]
+    partes = [p for p in partes if not p.empty]
+    total = pd.concat(partes, ignore_index=True).groupby(dims, sort=False, dropna=False, as_index=False)[resumo.MEDIDAS].sum()
+    return total[total['qtd'] > 0].reset_index(drop=True)
+
+
+def _reindexar(indice, df_ant, novo, posicoes, col_categoria='categoria', col_status='status'):
+    """Move as `posicoes` (mesma ordem de linhas) para os grupos novos."""
+    ant = list(zip(df_ant[col_categoria].to_numpy()[posicoes], df_ant[col_status].to_numpy()[posicoes]))
+    atu = list(zip(novo[col_categoria].to_numpy()[posicoes], novo[col_status].to_numpy()[posicoes]))
+    movidos = [(p, a, b) for p, a, b in zip(posicoes, ant, atu) if a != b]
+    if not movidos:
+        return indice
+
+    grupos = {'categoria': dict(indice['categoria']), 'status': dict(indice['status']), 'par': dict(indice['par'])}
+    saem, entram = {}, {}
+    for p, (ca, sa), (cb, sb) in movidos:
+        for nivel, de, para in (('categoria', ca, cb), ('status', sa, sb), ('par', (ca, sa), (cb, sb))):
+            if de != para:
+                saem.setdefault((nivel, de), []).append(p)
+                entram.setdefault((nivel, para), []).append(p)
+    vazio = np.empty(0, dtype=np.intp)
+    for (nivel, k), ps in saem.items():
+        restante = np.setdiff1d(grupos[nivel].get(k, vazio), ps)
+        if len(restante):
+            grupos[nivel][k] = restante
+        else:
+            grupos[nivel].pop(k, None)
+    for (nivel, k), ps in entram.items():
+        grupos[nivel][k] = np.union1d(grupos[nivel].get(k, vazio), ps).astype(np.intp)
+    return {**grupos, 'n': indice['n']}
+
+
+def feed(df_ant, novo, mudancas, colunas, chave=CHAVE):
+    """
+    Tabela "mudou desde a última atualização": uma linha por SKU com
+    codigo, nome, tipo (Novo/Removido/Alterado) e o resumo dos campos
+    alterados ("estoque_atual: 5 → 3").
+    """
+    linhas = []
+    ant = df_ant.drop_duplicates(chave).set_index(chave)
+    atu = novo.drop_duplicates(chave).set_index(chave)
+    for k in mudancas['adicionados']:
+        linhas.append({'codigo': atu.at[k, 'codigo'], 'nome': atu.at[k, 'nome'], 'tipo': 'Novo', 'mudancas': ''})
+    for k in mudancas['removidos']:
+        linhas.append({'codigo': ant.at[k, 'codigo'], 'nome': ant.at[k, 'nome'], 'tipo': 'Removido', 'mudancas': ''})
+    cols = [c for c in colunas if c in ant.columns and c in atu.columns]
+    for k in mudancas['alterados']:
+        a, b = ant.loc[k, cols], atu.loc[k, cols]
+        difs = [f"{c}: {_fmt(a[c])} → {_fmt(b[c])}" for c in cols if _fmt(a[c]) != _fmt(b[c])]
+        linhas.append({'codigo': atu.at[k, 'codigo'], 'nome': atu.at[k, 'nome'], 'tipo': 'Alterado', 'mudancas': '; '.join(difs)})
+    return pd.DataFrame(linhas, columns=['codigo', 'nome', 'tipo', 'mudancas'])
+
+
+def _fmt(v):
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
@@ -2,273 +2,133 @@
 import streamlit as st
 import pandas as pd
 import requests
-from io import StringIO
+import threading
+import hashlib
+import html
 from datetime import datetime
-import plotly.express as px
-import math
-import unicodedata
+
+from estoque import (
+    ler_depositos, ler_csv, calcular_semaforo, unificar_depositos,
+    item_carrinho, consolidar_carrinho, aplicar_carrinho, expandir_uploads, ler_faturas, consolidar_faturas,
+    ler_vendas, relatorio_faltantes,
+    digest_arquivo, ja_aplicadas,
+    aliases_codigos, mapa_aliases, registrar_aliases, remover_aliases
+)
+from filtros import construir_indice, filtrar
+from exportar import botao_exportar
+import metricas
+from metricas import medido, span
+from painel_metricas import ligar_da_sessao, mostrar_painel
+import resumo
+import graficos
+import snapshots
+import kits
+import alertas
+import linha_do_tempo as ltempo
+import conciliacao
+import tarefas
+import validacao
+import razao
+import empresas
+from cache_memoria import COMPARTILHADO
 
 # ======================
 # CONFIGURAÇÃO
 # ======================
 st.set_page_config(
-    page_title="Estoque Cockpit - Silva Holding",
+    page_title="Estoque Cockpit",
     page_icon="🧭",
     layout="wide",
     initial_sidebar_state="expanded"
 )
 
-# URLs (ajuste aqui se trocar de planilha / webhook)
-SHEETS_URL = "https://docs.google.com/spreadsheets/d/1PpiMQingHf4llA03BiPIuPJPIZqul4grRU_emWDEK1o/export?format=csv"
-WEBHOOK_URL = "https://script.google.com/macros/s/AKfycbxTX9uUWnByw6sk6MtuJ5FbjV7zeBKYEoUPPlUlUDS738QqocfCd_NAlh9Eh25XhQywTw/exec"
-
-# ======================
-# HELPERS ROBUSTOS
-# ======================
-def safe_int(x, default=0):
-    """Converte qualquer coisa para int sem quebrar."""
-    try:
-        if x is None:
-            return default
-        if isinstance(x, float) and math.isnan(x):
-            return default
-        if isinstance(x, str) and x.strip().lower() in {"", "nan", "none", "null", "n/a"}:
-            return default
-        return int(float(str(x).replace(",", ".")))
-    except Exception:
-        return default
-
-def parse_int_list(value):
-    """'1,2, 3' -> [1,2,3]; ignora nulos/NaN/vazios."""
-    if value is None:
-        return []
-    if isinstance(value, float) and math.isnan(value):
-        return []
-    parts = [p.strip() for p in str(value).split(",")]
-    out = []
-    for p in parts:
-        if not p:
-            continue
-        v = safe_int(p, None)
-        if v is not None:
-            out.append(v)
-    return out
+# Empresas: empresas.json ou ESTOQUE_EMPRESAS (ver empresas.py); sem arquivo,
+# uma empresa com as fontes de fontes.json / ESTOQUE_FONTES ou a planilha
+# padrão (SHEETS_URL / WEBHOOK_URL em estoque.py). ?empresa=<id> na URL fixa a escolha.
+EMPRESAS = empresas.carregar_empresas()
+EMPRESA = empresas.escolher(EMPRESAS, st.query_params.get('empresa'))
+if len(EMPRESAS) > 1:
+    ids = list(EMPRESAS)
+    EMPRESA = EMPRESAS[st.sidebar.selectbox("🏢 Empresa", ids, index=ids.index(EMPRESA['id']),
+                                            format_func=lambda i: EMPRESAS[i]['nome'])]
+    st.query_params['empresa'] = EMPRESA['id']
+FONTES = EMPRESA['fontes']
+TODOS_DEPOSITOS = 'Todos'
 
-def normalize_key(s: str) -> str:
-    """
-    Gera chave estável para matching:
-    - remove acentos (inclui ç->c)
-    - mantém letras, números e hífen
-    - upper e trim
-    """
-    if s is None:
-        return ""
-    s = str(s)
-    s = unicodedata.normalize('NFKD', s)
-    s = ''.join(ch for ch in s if not unicodedata.combining(ch))
-    s = s.replace('ß', 'ss')
-    s = ''.join(ch for ch in s if ch.isalnum() or ch == '-')
-    return s.upper().strip()
+# Métricas por estágio (opt-in no painel de desempenho da sidebar)
+ligar_da_sessao()
 
 # ======================
-# CARREGAR PRODUTOS
+# ALERTAS DE STATUS
 # ======================
-@st.cache_data(ttl=30)
-def carregar_produtos():
-    try:
-        r = requests.get(SHEETS_URL, timeout=15)
-        r.raise_for_status()
-        df = pd.read_csv(StringIO(r.text))
-
-        # Colunas essenciais
-        req = ['codigo', 'nome', 'categoria', 'estoque_atual', 'estoque_min', 'estoque_max']
-        for c in req:
-            if c not in df.columns:
-                if c == 'estoque_max':
-                    df[c] = df.get('estoque_min', 0) * 2
-                else:
-                    df[c] = 0
-
-        # Numéricos
-        df['estoque_atual'] = pd.to_numeric(df['estoque_atual'], errors='coerce').fillna(0)
-        df['estoque_min']   = pd.to_numeric(df['estoque_min']  , errors='coerce').fillna(0)
-        df['estoque_max']   = pd.to_numeric(df['estoque_max']  , errors='coerce').fillna(0)
-
-        # Kits
-        for c in ['componentes', 'quantidades', 'eh_kit']:
-            if c not in df.columns:
-                df[c] = ''
-            else:
-                df[c] = df[c].astype(str).fillna('')
-
-        # 🔑 chave normalizada para matching insensível a acentos/ç
-        df['codigo_key'] = df['codigo'].astype(str).map(normalize_key)
-
-        return df
+@st.cache_resource
+def vigia_alertas(empresa_id):
+    """Vigia da empresa em background (ESTOQUE_ALERTAS=tipo:destino; ver alertas.py) ou None."""
+    sink = alertas.sink_de_config(alertas.CONFIG_PADRAO)
+    if sink is None:
+        return None
+    return alertas.Vigia(alertas.MotorAlertas(sink), fontes_alerta(EMPRESAS[empresa_id]), intervalo=30,
+                         empresa=empresa_id).iniciar()
 
-    except Exception as e:
-        st.error(f"Erro ao carregar dados da planilha: {e}")
-        return pd.DataFrame()
+def fontes_alerta(empresa):
+    """Com várias empresas no deploy, a série do alerta leva o nome da empresa."""
+    if len(EMPRESAS) == 1:
+        return empresa['fontes']
+    return [{**f, 'deposito': f"{empresa['nome']} · {f['deposito']}"} for f in empresa['fontes']]
 
 # ======================
-# SEMÁFORO
+# LINHA DO TEMPO (SNAPSHOTS EM DELTA)
 # ======================
-def calcular_semaforo(estoque_atual, estoque_min, estoque_max):
-    if estoque_atual < estoque_min:
-        return "🔴", "CRÍTICO", "#ff4444"
-    elif estoque_atual <= estoque_min * 1.2:
-        return "🟠", "BAIXO", "#ffaa00"
-    elif estoque_atual > estoque_max:
-        return "🔵", "EXCESSO", "#0088ff"
-    else:
-        return "🟢", "OK", "#00aa00"
+@st.cache_resource
+def fila_tarefas(empresa_id):
+    """Baixas em lote em background (ver tarefas.py): seguem rodando sem a sessão que as criou."""
+    e = EMPRESAS[empresa_id]
+    return tarefas.Tarefas(e['tarefas'], registro_aplicadas=e['registro_aplicadas'])
 
-# ======================
-# MOVIMENTAÇÃO (WEBHOOK)
-# ======================
-def movimentar_estoque(codigo, quantidade, tipo, colaborador, test_mode=False):
-    """Se test_mode=True, só simula; senão, envia ao Apps Script."""
-    if test_mode:
-        return {'success': True, 'message': 'Simulado', 'novo_estoque': 'SIMULAÇÃO'}
-    try:
-        payload = {
-            'codigo': codigo,
-            'quantidade': safe_int(quantidade, 0),
-            'tipo': tipo,
-            'colaborador': colaborador
-        }
-        r = requests.post(WEBHOOK_URL, json=payload, timeout=20)
-        return r.json()
-    except Exception as e:
-        return {'success': False, 'message': f'Erro: {str(e)}'}
+@st.cache_resource
+def linha_do_tempo(empresa_id):
+    """Store de snapshots da empresa (ver linha_do_tempo.py) ou None sem pyarrow."""
+    return ltempo.LinhaDoTempo(EMPRESAS[empresa_id]['linha_do_tempo']) if ltempo.disponivel() else None
+
+def catalogo_no_instante(serie, seq, em):
+    """Catálogo reconstruído do registro `seq` (em = instante do registro)."""
+    return COMPARTILHADO.obter((EMPRESA['id'], 'instante', serie, seq),
+                               lambda: linha_do_tempo(EMPRESA['id']).catalogo_em(serie, em))
 
 # ======================
-# EXPANDIR KITS (NORMALIZADO)
+# CARREGAR PRODUTOS
 # ======================
-def expandir_kits(df_fatura, produtos_df):
-    """
-    Expande kits usando matching por chave normalizada.
-    Retorna DF com:
-      codigo_key, quantidade, codigo_canonical, codigo (fallback)
-    """
-    key_to_code = dict(zip(produtos_df['codigo_key'], produtos_df['codigo'].astype(str)))
-
-    kits = {}
-    for _, row in produtos_df.iterrows():
-        if str(row.get('eh_kit', '')).strip().lower() == 'sim':
-            kit_key = row['codigo_key']
-            comps = [normalize_key(c.strip()) for c in str(row.get('componentes', '')).split(',') if c.strip()]
-            quants = parse_int_list(row.get('quantidades', ''))
-            if comps and quants and len(comps) == len(quants):
-                kits[kit_key] = list(zip(comps, quants))
-
-    if not kits:
-        df_f = df_fatura.copy()
-        df_f['codigo_key'] = df_f['codigo'].map(normalize_key)
-        df_f['codigo_canonical'] = df_f['codigo_key'].map(lambda k: key_to_code.get(k, ''))
-        df_f['codigo'] = df_f['codigo_canonical'].where(df_f['codigo_canonical'] != '', df_f['codigo'])
-        return df_f
-
-    linhas = []
-    for _, row in df_fatura.iterrows():
-        qty = safe_int(row.get('quantidade', 0), 0)
-        code_key = normalize_key(row['codigo'])
-        if code_key in kits:
-            for comp_key, comp_qty in kits[code_key]:
-                linhas.append({'codigo_key': comp_key, 'quantidade': qty * safe_int(comp_qty, 0)})
-        else:
-            linhas.append({'codigo_key': code_key, 'quantidade': qty})
+# Catálogo, derivados, índices e cubos de cada empresa ficam no cache
+# compartilhado do processo (cache_memoria.py): chave (empresa, tipo, ...),
+# orçamento total em ESTOQUE_CACHE_MB e LRU entre as empresas.
+VALIDADE_CATALOGO = 30
 
-    df = pd.DataFrame(linhas)
-    df = df.groupby('codigo_key', as_index=False)['quantidade'].sum()
+def carregar_produtos():
+    """Todas as fontes da empresa em paralelo, unificadas com a coluna 'deposito' (somente leitura)."""
+    return COMPARTILHADO.obter((EMPRESA['id'], 'catalogo'), lambda: _carregar_produtos(EMPRESA),
+                               validade=VALIDADE_CATALOGO)
+
+def _carregar_produtos(empresa):
+    lidos = ler_depositos(empresa['fontes'], empresa=empresa['id'])
+    vigia = vigia_alertas(empresa['id'])
+    ldt = linha_do_tempo(empresa['id'])
+    for (fonte, df, erro), serie in zip(lidos, fontes_alerta(empresa)):
+        if erro:
+            st.error(f"Erro ao carregar dados da planilha ({fonte['deposito']}): {erro}")
+            continue
+        if vigia:
+            vigia.motor.avaliar(serie['deposito'], df)   # alerta já nesta carga, sem esperar o vigia
+        if ldt:
+            ldt.agendar(fonte['deposito'], df)           # delta gravado em background
+    return unificar_depositos(lidos)
 
-    df['codigo_canonical'] = df['codigo_key'].map(lambda k: key_to_code.get(k, ''))
-    df['codigo'] = df['codigo_canonical'].where(df['codigo_canonical'] != '', df['codigo_key'])
-    return df
+def recarregar_catalogo():
+    """A planilha mudou (baixa aplicada, botão Atualizar): a próxima carga busca de novo."""
+    COMPARTILHADO.descartar((EMPRESA['id'], 'catalogo'))
 
-# ======================
-# PROCESSAR FATURAMENTO (NORMALIZADO)
-# ======================
-def processar_faturamento(arquivo_upload, produtos_df):
-    """
-    Retorna (produtos_encontrados, produtos_nao_encontrados, erro)
-    Agora insensível a acentos/ç nos códigos e kits.
-    """
-    try:
-        nome = arquivo_upload.name.lower()
-        if nome.endswith('.csv'):
-            df_fatura = None
-            for enc in ['utf-8', 'utf-8-sig', 'latin1', 'iso-8859-1', 'cp1252', 'windows-1252']:
-                try:
-                    arquivo_upload.seek(0)
-                    df_tmp = pd.read_csv(arquivo_upload, encoding=enc)
-                    if df_tmp is not None and len(df_tmp.columns) > 0:
-                        df_fatura = df_tmp
-                        break
-                except:
-                    continue
-            if df_fatura is None:
-                return None, None, "Não foi possível ler o CSV (tente salvar como UTF-8)."
-        elif nome.endswith('.xlsx'):
-            df_fatura = pd.read_excel(arquivo_upload, engine='openpyxl')
-        elif nome.endswith('.xls'):
-            df_fatura = pd.read_excel(arquivo_upload, engine='xlrd')
-        else:
-            return None, None, "Formato não suportado (use CSV/XLS/XLSX)."
-
-        # Normaliza cabeçalhos
-        def normcol(n):
-            n = unicodedata.normalize('NFKD', str(n)).encode('ASCII', 'ignore').decode('ASCII')
-            return n.lower().strip()
-        df_fatura.rename(columns={c: normcol(c) for c in df_fatura.columns}, inplace=True)
-
-        if 'codigo' not in df_fatura.columns:
-            return None, None, f"Arquivo sem coluna 'Código'. Colunas: {list(df_fatura.columns)}"
-        if 'quantidade' not in df_fatura.columns:
-            return None, None, f"Arquivo sem coluna 'Quantidade'. Colunas: {list(df_fatura.columns)}"
-
-        # Limpeza
-        df_fatura['codigo'] = df_fatura['codigo'].astype(str).str.strip()
-        df_fatura['quantidade'] = df_fatura['quantidade'].apply(lambda x: safe_int(x, 0)).astype(int)
-        df_fatura = df_fatura[(df_fatura['codigo'] != '') & (df_fatura['quantidade'] > 0)]
-        df_fatura = df_fatura.groupby('codigo', as_index=False)['quantidade'].sum().reset_index(drop=True)
-
-        # Expande kits + chaves
-        df_fatura = expandir_kits(df_fatura, produtos_df)
-        if 'codigo_key' not in df_fatura.columns:
-            df_fatura['codigo_key'] = df_fatura['codigo'].map(normalize_key)
-
-        estoque_keys = set(produtos_df['codigo_key'])
-
-        df_fatura['encontrado'] = df_fatura['codigo_key'].isin(estoque_keys)
-
-        # Mapa para enriquecer
-        est_map = {}
-        for _, r in produtos_df.iterrows():
-            k = r['codigo_key']
-            est_map[k] = {
-                'nome': r.get('nome', 'N/A'),
-                'estoque_atual': pd.to_numeric(r.get('estoque_atual', 0), errors='coerce'),
-                'codigo_canonical': r.get('codigo', '')
-            }
-
-        prods_ok = df_fatura[df_fatura['encontrado']].copy().reset_index(drop=True)
-        if not prods_ok.empty:
-            prods_ok['nome'] = prods_ok['codigo_key'].map(lambda k: est_map[k]['nome'])
-            prods_ok['estoque_atual'] = prods_ok['codigo_key'].map(lambda k: est_map[k]['estoque_atual']).fillna(0)
-            prods_ok['codigo_canonical'] = prods_ok['codigo_key'].map(lambda k: est_map[k]['codigo_canonical']).fillna(prods_ok['codigo'])
-            prods_ok['estoque_atual'] = pd.to_numeric(prods_ok['estoque_atual'], errors='coerce').fillna(0)
-            prods_ok['quantidade'] = pd.to_numeric(prods_ok['quantidade'], errors='coerce').fillna(0)
-            prods_ok['estoque_final'] = prods_ok['estoque_atual'] - prods_ok['quantidade']
-
-        prods_nok = df_fatura[~df_fatura['encontrado']].copy().reset_index(drop=True)
-        if not prods_nok.empty:
-            prods_nok = prods_nok[['codigo', 'quantidade', 'codigo_key']]
-
-        return prods_ok, prods_nok, None
-
-    except Exception as e:
-        return None, None, f"Erro ao processar arquivo: {str(e)}"
+def derivado(tipo, versao, fabricar):
+    """Dado derivado do snapshot, no cache compartilhado (chave: empresa, tipo, versão)."""
+    return COMPARTILHADO.obter((EMPRESA['id'], tipo, versao), fabricar)
 
 # ======================
 # ESTILO
@@ -291,9 +151,9 @@ st.markdown("""
 # ======================
 # HEADER
 # ======================
-st.markdown("""
+st.markdown(f"""
 <div class="cockpit-header">
-  <h1>COCKPIT DE CONTROLE — SILVA HOLDING</h1>
+  <h1>COCKPIT DE CONTROLE — {html.escape(EMPRESA['nome'].upper())}</h1>
   <p>"Se parar para sentir o perfume das rosas, vem um caminhão e te atropela."</p>
 </div>
 """, unsafe_allow_html=True)
@@ -306,14 +166,88 @@ if produtos_df.empty:
     st.error("Não foi possível carregar os dados.")
     st.stop()
 
-# Campos derivados
-produtos_df['semaforo'], produtos_df['status'], produtos_df['cor'] = zip(*produtos_df.apply(
-    lambda r: calcular_semaforo(r['estoque_atual'], r['estoque_min'], r['estoque_max']), axis=1
-))
-produtos_df['falta_para_min']   = (produtos_df['estoque_min'] - produtos_df['estoque_atual']).clip(lower=0)
-produtos_df['falta_para_max']   = (produtos_df['estoque_max'] - produtos_df['estoque_atual']).clip(lower=0)
-produtos_df['excesso_sobre_max']= (produtos_df['estoque_atual'] - produtos_df['estoque_max']).clip(lower=0)
-produtos_df['diferenca_min_max']= produtos_df['estoque_max'] - produtos_df['estoque_min']
+# Campos derivados + índice categoria × status (uma vez por snapshot)
+def _ultimo_snapshot(serie):
+    """
+    Último snapshot preparado da série (depósito ou consolidado) da empresa,
+    para o diff da próxima carga. Fica no cache compartilhado: se for
+    despejado, a próxima preparação recalcula tudo.
+    """
+    return COMPARTILHADO.obter((EMPRESA['id'], 'snapshot', serie), lambda: {'lock': threading.Lock(), 'versao': None})
+
+def preparar_produtos(versao, deposito, df):
+    """
+    Deriva campos, indexa e resume o snapshot (do depósito ou consolidado).
+    Resultado compartilhado: somente leitura. Se houver um snapshot anterior,
+    só as linhas adicionadas/alteradas são recalculadas (ver snapshots.py) e
+    o feed de mudanças é atualizado.
+    """
+    estado = _ultimo_snapshot(deposito)
+    with estado['lock']:
+        if estado['versao'] == versao:
+            return estado['preparado']
+        # o catálogo em cache é compartilhado: deriva numa cópia
+        df = df[df['deposito'] == deposito].reset_index(drop=True) if deposito != TODOS_DEPOSITOS else df.copy()
+        df.attrs['versao'] = versao
+        chave = 'chave_deposito' if 'chave_deposito' in df.columns else snapshots.CHAVE
+        with span('derive', 'produtos'):
+            hashes = snapshots.hash_linhas(df, chave)
+            if estado['versao'] is None:
+                preparado = _preparar_produtos(df)
+            else:
+                mudancas = snapshots.diferencas(estado['hashes'], hashes)
+                preparado = snapshots.atualizar(estado['preparado'], df, mudancas, _derivar, chave)
+                if snapshots.total_mudancas(mudancas):
+                    estado['feed'] = snapshots.feed(estado['preparado'][0], preparado[0], mudancas, COLUNAS_FEED, chave)
+                    estado['feed_em'] = datetime.now()
+            estado.update(versao=versao, hashes=hashes, preparado=preparado)
+    COMPARTILHADO.remedir((EMPRESA['id'], 'snapshot', deposito))
+    return preparado
+
+def verificar_catalogo(versao, df):
+    """Problemas de integridade do catálogo inteiro (ver validacao.py), uma vez por snapshot."""
+    def validar():
+        with span('derive', 'validacao'):
+            return validacao.validar(df)
+    return derivado('validacao', versao, validar)
+
+def mostrar_integridade(problemas, versao, deposito=None):
+    """Expander com os problemas do catálogo (do depósito, se informado); nada se estiver íntegro."""
+    if deposito is not None:
+        problemas = problemas[problemas['deposito'] == deposito]
+    if problemas.empty:
+        return
+    erros = int((problemas['gravidade'] == 'erro').sum())
+    with st.expander(f"🩺 Integridade do catálogo — {erros} erro(s), {len(problemas) - erros} aviso(s)", expanded=bool(erros)):
+        st.caption(" · ".join(f"{validacao.ROTULOS[t]}: {n}" for t, n in validacao.resumo(problemas).items()))
+        tbl = problemas.assign(tipo=problemas['tipo'].map(validacao.ROTULOS))
+        if tbl['deposito'].nunique() == 1:
+            tbl = tbl.drop(columns='deposito')
+        tbl = tbl.rename(columns={'tipo':'Problema','gravidade':'Gravidade','deposito':'Depósito','codigo':'Código',
+                                  'codigo_key':'Chave Normalizada','detalhe':'Detalhe'})
+        st.dataframe(tbl, use_container_width=True, hide_index=True, height=min(35 * len(tbl) + 40, 320))
+        botao_exportar(tbl, "integridade_catalogo", versao=versao, chave=(deposito,),
+                       rotulo="📥 Baixar problemas", empresa=EMPRESA['id'])
+
+def cubo_por_deposito(versao, df):
+    """Cubo depósito × status da visão consolidada."""
+    return derivado('cubo_deposito', versao, lambda: resumo.construir_cubo(df, col_categoria='deposito'))
+
+COLUNAS_FEED = ['nome', 'categoria', 'estoque_atual', 'estoque_min', 'estoque_max', 'status']
+
+def _derivar(df):
+    df['semaforo'], df['status'], df['cor'] = zip(*df.apply(
+        lambda r: calcular_semaforo(r['estoque_atual'], r['estoque_min'], r['estoque_max']), axis=1
+    ))
+    df['falta_para_min']   = (df['estoque_min'] - df['estoque_atual']).clip(lower=0)
+    df['falta_para_max']   = (df['estoque_max'] - df['estoque_atual']).clip(lower=0)
+    df['excesso_sobre_max']= (df['estoque_atual'] - df['estoque_max']).clip(lower=0)
+    df['diferenca_min_max']= df['estoque_max'] - df['estoque_min']
+
+def _preparar_produtos(df):
+    _derivar(df)
+    return df, construir_indice(df), resumo.construir_cubo(df)
+
 
 # ======================
 # SIDEBAR / CONTROLES
@@ -323,7 +257,34 @@ test_mode = st.sidebar.checkbox("✏️ Modo Teste (simulação, não altera pla
 
 st.sidebar.info("Todas as operações serão simuladas quando o Modo Teste estiver ativo.")
 
-categorias = ['Todas'] + sorted(produtos_df['categoria'].unique().tolist())
+if vigia_alertas(EMPRESA['id']):
+    motor_alertas = vigia_alertas(EMPRESA['id']).motor
+    with st.sidebar.expander(f"🔔 Alertas enviados ({motor_alertas.enviados})"):
+        recentes = list(motor_alertas.historico)[-10:][::-1]
+        if not recentes:
+            st.caption("Nenhuma mudança de status desde o início do vigia.")
+        for a in recentes:
+            st.caption(f"{a['em'][11:16]} · {alertas.formatar(a)}")
+        for e in list(motor_alertas.erros)[-3:]:
+            st.warning(f"Falha no envio: {e}")
+
+# Depósito: cada um é um snapshot próprio; "Todos" é a visão consolidada
+depositos = list(produtos_df.attrs.get('versoes', {}))
+deposito_filtro = TODOS_DEPOSITOS
+if len(FONTES) > 1:
+    deposito_filtro = st.sidebar.selectbox("🏭 Depósito", [TODOS_DEPOSITOS] + depositos)
+fonte_atual = next((f for f in FONTES if f['deposito'] == deposito_filtro), FONTES[0])
+multi_deposito = len(depositos) > 1 and deposito_filtro == TODOS_DEPOSITOS
+# escrita (movimentação, baixa) vai para o webhook de uma fonte: com várias
+# fontes, "Todos" não diz qual — mesmo que só um depósito tenha carregado
+escrita_sem_deposito = deposito_filtro == TODOS_DEPOSITOS and len(FONTES) > 1
+
+versao_atual = produtos_df.attrs['versoes'][deposito_filtro] if deposito_filtro != TODOS_DEPOSITOS else produtos_df.attrs['versao']
+problemas_catalogo = verificar_catalogo(produtos_df.attrs['versao'], produtos_df)
+mostrar_integridade(problemas_catalogo, produtos_df.attrs['versao'], None if deposito_filtro == TODOS_DEPOSITOS else deposito_filtro)
+produtos_df, indice_produtos, cubo_produtos = preparar_produtos(versao_atual, deposito_filtro, produtos_df)
+
+categorias = ['Todas'] + sorted(indice_produtos['categoria'])
 categoria_filtro = st.sidebar.selectbox("📂 Categoria", categorias)
 
 status_opcoes = ['Todos', 'CRÍTICO', 'BAIXO', 'OK', 'EXCESSO']
@@ -331,54 +292,130 @@ status_filtro = st.sidebar.selectbox("🚦 Status", status_opcoes)
 
 tipo_analise = st.sidebar.radio(
     "Tipo de Análise",
-    ["Visão Geral", "Análise Mín/Máx", "Movimentação", "Baixa por Faturamento", "Histórico de Baixas", "Relatório de Faltantes"]
+    ["Visão Geral", "Análise Mín/Máx", "Kits", "Movimentação", "Baixa por Faturamento", "Histórico de Baixas", "Linha do Tempo", "Relatório de Faltantes"]
 )
 
-df_filtrado = produtos_df.copy()
-if categoria_filtro != 'Todas':
-    df_filtrado = df_filtrado[df_filtrado['categoria'] == categoria_filtro]
-if status_filtro != 'Todos':
-    df_filtrado = df_filtrado[df_filtrado['status'] == status_filtro]
+with span('filter', 'sidebar'):
+    df_filtrado = filtrar(produtos_df, indice_produtos, categoria_filtro, status_filtro)
+
+@st.cache_resource(max_entries=64)
+def figuras_visao_geral(versao, categoria, status, _cubo):
+    """Pizza por status + barras por categoria (top-N) para o snapshot/filtro."""
+    with span('render', 'graficos'):
+        return _figuras_visao_geral(_cubo, categoria, status)
+
+def _figuras_visao_geral(cubo, categoria, status):
+    f = resumo.fatia(cubo, categoria, status)
+    fig_status = graficos.pizza_status(
+        resumo.por_status(f),
+        {'CRÍTICO':'#ff4444','BAIXO':'#ffaa00','OK':'#00aa00','EXCESSO':'#0088ff'},
+        height=320
+    )
+    fig_cat = graficos.barras_categoria(resumo.por_categoria(f), height=320, showlegend=False)
+    return fig_status, fig_cat
+
+def disponibilidade_kits(versao, df):
+    """Kits montáveis + gargalo para o snapshot (ver kits.py)."""
+    def calcular():
+        with span('derive', 'kits'):
+            return kits.disponibilidade(df)
+    return derivado('kits', versao, calcular)
+
+# ======================
+# UPLOADS (cache por conteúdo + versão do snapshot)
+# ======================
+# Os reruns (trocar colaborador, marcar modo teste...) reenviam o mesmo
+# arquivo: a chave é o SHA-256 dos bytes + a versão do catálogo, então o
+# parse/expansão de kits só roda de novo se o arquivo ou a planilha mudarem.
+# Os aliases entram na chave: salvar um alias reprocessa o lote.
+@st.cache_data(max_entries=16, show_spinner=False)
+def processar_faturas(chave, versao, aliases, _arquivos, _produtos_df):
+    lidos = ler_faturas(expandir_uploads(_arquivos))
+    lote = consolidar_faturas(lidos, _produtos_df, aliases)
+    lote['lidos'] = len(lidos)
+    return lote
+
+def indice_codigos(versao, df):
+    """Índice de trigramas dos códigos do snapshot (ver conciliacao.py)."""
+    def construir():
+        with span('derive', 'indice_codigos'):
+            return conciliacao.construir_indice(df)
+    return derivado('indice_codigos', versao, construir)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def sugestoes_codigos(codigos, empresa_id, versao, _df):
+    with span('derive', 'sugestoes'):
+        return conciliacao.sugerir(indice_codigos(versao, _df), codigos)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def processar_vendas(chave, versao, _arq, _produtos_df):
+    df_v = ler_vendas(_arq)
+    df_v.columns = df_v.columns.str.lower().str.strip()
+    if 'codigo' not in df_v.columns or 'quantidade' not in df_v.columns:
+        return None, None, f"Arquivo precisa de colunas 'codigo' e 'quantidade'. Colunas: {list(df_v.columns)}"
+    df_v, falt = relatorio_faltantes(df_v, _produtos_df)
+    return df_v, falt, None
 
 # ======================
 # VISÃO GERAL
 # ======================
-if tipo_analise == "Visão Geral":
+t_render = metricas.inicio()
+if (multi_deposito and tipo_analise in ("Kits", "Movimentação", "Baixa por Faturamento", "Linha do Tempo", "Relatório de Faltantes")
+        or escrita_sem_deposito and tipo_analise in ("Movimentação", "Baixa por Faturamento")):
+    st.info("🏭 Selecione um depósito na barra lateral: kits, movimentações, baixas, linha do tempo e faltantes são por local.")
+
+elif tipo_analise == "Visão Geral":
+    cubo_f = resumo.fatia(cubo_produtos, categoria_filtro, status_filtro)
+    tot = resumo.totais(cubo_f)
     col1, col2, col3, col4, col5 = st.columns(5)
 
     with col1:
-        st.markdown(f"""<div class="metric-card"><h3>PRODUTOS</h3><h2>{len(df_filtrado)}</h2></div>""", unsafe_allow_html=True)
+        st.markdown(f"""<div class="metric-card"><h3>PRODUTOS</h3><h2>{tot['qtd']}</h2></div>""", unsafe_allow_html=True)
     with col2:
-        st.markdown(f"""<div class="metric-card"><h3>ESTOQUE TOTAL</h3><h2>{int(df_filtrado['estoque_atual'].sum()):,}</h2></div>""", unsafe_allow_html=True)
+        st.markdown(f"""<div class="metric-card"><h3>ESTOQUE TOTAL</h3><h2>{int(tot['unidades']):,}</h2></div>""", unsafe_allow_html=True)
     with col3:
-        st.markdown(f"""<div class="metric-card"><h3>CRÍTICOS</h3><h2>{len(df_filtrado[df_filtrado['status']=='CRÍTICO'])}</h2></div>""", unsafe_allow_html=True)
+        st.markdown(f"""<div class="metric-card"><h3>CRÍTICOS</h3><h2>{resumo.contar_status(cubo_f, 'CRÍTICO')}</h2></div>""", unsafe_allow_html=True)
     with col4:
-        st.markdown(f"""<div class="metric-card"><h3>BAIXOS</h3><h2>{len(df_filtrado[df_filtrado['status']=='BAIXO'])}</h2></div>""", unsafe_allow_html=True)
+        st.markdown(f"""<div class="metric-card"><h3>BAIXOS</h3><h2>{resumo.contar_status(cubo_f, 'BAIXO')}</h2></div>""", unsafe_allow_html=True)
     with col5:
-        st.markdown(f"""<div class="metric-card"><h3>OK</h3><h2>{len(df_filtrado[df_filtrado['status']=='OK'])}</h2></div>""", unsafe_allow_html=True)
-
+        st.markdown(f"""<div class="metric-card"><h3>OK</h3><h2>{resumo.contar_status(cubo_f, 'OK')}</h2></div>""", unsafe_allow_html=True)
+
+    if multi_deposito:
+        cubo_dep = cubo_por_deposito(versao_atual, produtos_df)
+        linhas = []
+        for dep in depositos:
+            f = resumo.fatia(cubo_dep, dep, col_categoria='deposito')
+            t = resumo.totais(f)
+            linhas.append({'Depósito': dep, 'Produtos': t['qtd'], 'Estoque Total': int(t['unidades']),
+                           'Críticos': resumo.contar_status(f, 'CRÍTICO'),
+                           'Valor (R$)': round(t['valor'], 2)})
+        st.subheader("🏭 Por depósito")
+        st.dataframe(pd.DataFrame(linhas), use_container_width=True, hide_index=True)
+
+    estado_snapshot = _ultimo_snapshot(deposito_filtro)
+    mudancas = estado_snapshot.get('feed')
+    if mudancas is not None and not mudancas.empty:
+        with st.expander(f"🆕 Mudanças desde a última atualização ({len(mudancas)}) — "
+                         f"{estado_snapshot['feed_em']:%H:%M:%S}"):
+            st.dataframe(mudancas.rename(columns={'codigo':'Código','nome':'Produto','tipo':'Tipo','mudancas':'Mudanças'}),
+                         use_container_width=True, hide_index=True, height=min(35 * len(mudancas) + 40, 320))
+
+    fig_status, fig_cat = figuras_visao_geral(produtos_df.attrs.get('versao'), categoria_filtro, status_filtro, cubo_produtos)
     c1, c2 = st.columns(2)
     with c1:
         st.subheader("Distribuição por Status")
-        vc = df_filtrado['status'].value_counts()
-        st.plotly_chart(px.pie(values=vc.values, names=vc.index,
-                               color=vc.index,
-                               color_discrete_map={'CRÍTICO':'#ff4444','BAIXO':'#ffaa00','OK':'#00aa00','EXCESSO':'#0088ff'}
-                               ).update_layout(height=320),
-                        use_container_width=True)
+        st.plotly_chart(fig_status, use_container_width=True)
     with c2:
         st.subheader("Estoque por Categoria")
-        cat = df_filtrado.groupby('categoria')['estoque_atual'].sum().sort_values(ascending=False)
-        st.plotly_chart(px.bar(x=cat.index, y=cat.values, color=cat.values, color_continuous_scale='viridis')
-                        .update_layout(height=320, showlegend=False),
-                        use_container_width=True)
+        st.plotly_chart(fig_cat, use_container_width=True)
 
     st.subheader("🚨 Produtos em situação crítica")
-    crit = df_filtrado[df_filtrado['status'].isin(['CRÍTICO', 'BAIXO'])].sort_values('estoque_atual')
+    status_crit = [s_ for s_ in ['CRÍTICO', 'BAIXO'] if status_filtro in ('Todos', s_)]
+    crit = filtrar(produtos_df, indice_produtos, categoria_filtro, status_crit).nsmallest(10, 'estoque_atual')
     if crit.empty:
         st.success("Nenhum produto crítico.")
     else:
-        for _, p in crit.head(10).iterrows():
+        for _, p in crit.iterrows():
             cls = p['status'].lower()
             st.markdown(
                 f"""<div class="status-card {cls}">
@@ -391,130 +428,299 @@ if tipo_analise == "Visão Geral":
 # ======================
 # ANÁLISE MÍN/MÁX
 # ======================
+# As páginas com widgets próprios rodam como fragmento: mexer neles
+# reexecuta só a página (sem header, carga, derivação nem sidebar). Um
+# st.rerun() dentro delas continua recarregando o app inteiro.
 elif tipo_analise == "Análise Mín/Máx":
-    st.subheader("Análise Estoque Mínimo/Máximo")
-    c1, c2 = st.columns(2)
-    with c1:
-        analise_tipo = st.selectbox("Tipo de Análise", ["Falta para Mínimo", "Falta para Máximo", "Excesso sobre Máximo", "Diferença Mín-Máx"])
-    with c2:
-        only_diff = st.checkbox("Mostrar apenas com diferença > 0", value=True)
-
-    df_ = df_filtrado.copy()
-    if analise_tipo == "Falta para Mínimo":
-        col = 'falta_para_min'; titulo = 'Falta p/ Mín'
-        if only_diff: df_ = df_[df_['falta_para_min'] > 0]
-    elif analise_tipo == "Falta para Máximo":
-        col = 'falta_para_max'; titulo = 'Falta p/ Máx'
-        if only_diff: df_ = df_[df_['falta_para_max'] > 0]
-    elif analise_tipo == "Excesso sobre Máximo":
-        col = 'excesso_sobre_max'; titulo = 'Excesso s/ Máx'
-        if only_diff: df_ = df_[df_['excesso_sobre_max'] > 0]
-    else:
-        col = 'diferenca_min_max'; titulo = 'Diferença Mín-Máx'
-        if only_diff: df_ = df_[df_['diferenca_min_max'] > 0]
+    @st.fragment
+    @medido('fragment', "Análise Mín/Máx")
+    def pagina_min_max():
+        st.subheader("Análise Estoque Mínimo/Máximo")
+        c1, c2 = st.columns(2)
+        with c1:
+            analise_tipo = st.selectbox("Tipo de Análise", ["Falta para Mínimo", "Falta para Máximo", "Excesso sobre Máximo", "Diferença Mín-Máx"])
+        with c2:
+            only_diff = st.checkbox("Mostrar apenas com diferença > 0", value=True)
+
+        df_ = df_filtrado
+        if analise_tipo == "Falta para Mínimo":
+            col = 'falta_para_min'; titulo = 'Falta p/ Mín'
+            if only_diff: df_ = df_[df_['falta_para_min'] > 0]
+        elif analise_tipo == "Falta para Máximo":
+            col = 'falta_para_max'; titulo = 'Falta p/ Máx'
+            if only_diff: df_ = df_[df_['falta_para_max'] > 0]
+        elif analise_tipo == "Excesso sobre Máximo":
+            col = 'excesso_sobre_max'; titulo = 'Excesso s/ Máx'
+            if only_diff: df_ = df_[df_['excesso_sobre_max'] > 0]
+        else:
+            col = 'diferenca_min_max'; titulo = 'Diferença Mín-Máx'
+            if only_diff: df_ = df_[df_['diferenca_min_max'] > 0]
 
-    if df_.empty:
-        st.info("Sem resultados para os filtros.")
-    else:
-        tbl = df_[['codigo','nome','categoria','estoque_atual','estoque_min','estoque_max',col,'status']].rename(
-            columns={'estoque_atual':'Atual','estoque_min':'Mínimo','estoque_max':'Máximo', col:titulo, 'status':'Status', 'codigo':'Código','nome':'Produto','categoria':'Categoria'}
-        )
-        for c in ['Atual','Mínimo','Máximo',titulo]:
-            tbl[c] = pd.to_numeric(tbl[c], errors='coerce').fillna(0).astype(int)
-        st.dataframe(tbl.sort_values(titulo, ascending=False), use_container_width=True, height=420)
+        if df_.empty:
+            st.info("Sem resultados para os filtros.")
+        else:
+            cols_tbl = (['deposito'] if multi_deposito else []) + ['codigo','nome','categoria','estoque_atual','estoque_min','estoque_max',col,'status']
+            tbl = df_[cols_tbl].rename(
+                columns={'estoque_atual':'Atual','estoque_min':'Mínimo','estoque_max':'Máximo', col:titulo, 'status':'Status', 'codigo':'Código','nome':'Produto','categoria':'Categoria','deposito':'Depósito'}
+            )
+            for c in ['Atual','Mínimo','Máximo',titulo]:
+                tbl[c] = pd.to_numeric(tbl[c], errors='coerce').fillna(0).astype(int)
+            st.dataframe(tbl.sort_values(titulo, ascending=False), use_container_width=True, height=420)
+
+            botao_exportar(tbl, f"analise_{analise_tipo.lower().replace(' ','_')}", versao=versao_atual,
+                           chave=(deposito_filtro, categoria_filtro, status_filtro, only_diff), empresa=EMPRESA['id'])
 
-        st.download_button("📥 Baixar CSV", tbl.to_csv(index=False, encoding='utf-8-sig'),
-                           file_name=f"analise_{analise_tipo.lower().replace(' ','_')}_{datetime.now():%Y%m%d_%H%M%S}.csv",
-                           mime="text/csv")
+    pagina_min_max()
+
+# ======================
+# KITS MONTÁVEIS
+# ======================
+elif tipo_analise == "Kits":
+    @st.fragment
+    @medido('fragment', "Kits")
+    def pagina_kits():
+        st.subheader("Kits montáveis com o estoque atual")
+        disp = disponibilidade_kits(versao_atual, produtos_df)
+        if disp.empty:
+            st.info("Nenhum kit cadastrado (eh_kit = Sim com componentes/quantidades).")
+        else:
+            c1, c2, c3, c4 = st.columns(4)
+            with c1: st.metric("Kits", len(disp))
+            with c2: st.metric("Sem montagem possível", int((disp['montaveis'] == 0).sum()))
+            with c3: st.metric("Kits aninhados", int(disp['aninhado'].sum()))
+            with c4: st.metric("Definição circular", int(disp['ciclo'].sum()))
+
+            so_zerados = st.checkbox("Mostrar apenas kits sem montagem possível", value=False)
+            tbl = disp[disp['montaveis'] == 0] if so_zerados else disp
+            tbl = tbl[['codigo','nome','montaveis','gargalo','gargalo_estoque','gargalo_qtd','componentes','aninhado']].rename(columns={
+                'codigo':'Kit','nome':'Produto','montaveis':'Montáveis','gargalo':'Gargalo',
+                'gargalo_estoque':'Estoque Gargalo','gargalo_qtd':'Qtd por Kit','componentes':'Componentes','aninhado':'Aninhado'
+            })
+            st.dataframe(tbl, use_container_width=True, height=420, hide_index=True)
+            botao_exportar(tbl, "kits_montaveis", versao=versao_atual, chave=(so_zerados,), empresa=EMPRESA['id'])
+
+            st.markdown("**Componentes que mais travam kits**")
+            gg = kits.gargalos(disp).rename_axis('Componente').reset_index(name='Kits limitados')
+            st.dataframe(gg, use_container_width=True, hide_index=True)
+
+    pagina_kits()
 
 # ======================
 # MOVIMENTAÇÃO MANUAL
 # ======================
 elif tipo_analise == "Movimentação":
-    st.subheader("Movimentação de Estoque")
-    colaborador = st.selectbox("👤 Colaborador", ['Pericles','Maria','Camila','Cris VantiStella'])
-    busca = st.text_input("🔍 Buscar", placeholder="Código ou nome...")
-
-    if not busca:
-        st.info("Digite pelo menos 2 caracteres para buscar.")
-    elif len(busca) < 2:
-        st.warning("Digite mais caracteres.")
-    else:
-        found = df_filtrado[
-            df_filtrado['codigo'].str.contains(busca, case=False, na=False) |
-            df_filtrado['nome'].str.contains(busca, case=False, na=False)
-        ]
-        if found.empty:
-            st.warning("Nada encontrado.")
+    @st.fragment
+    @medido('fragment', "Movimentação")
+    def pagina_movimentacao():
+        st.subheader("Movimentação de Estoque")
+        colaborador = st.selectbox("👤 Colaborador", EMPRESA['colaboradores'])
+        # carrinho da sessão, por depósito: entradas/saídas somadas por SKU e enviadas juntas
+        chave_carrinho = f"carrinho_{EMPRESA['id']}_{fonte_atual['deposito']}"
+        carrinho = st.session_state.setdefault(chave_carrinho, [])
+
+        ultimo = st.session_state.pop('carrinho_resultado', None)
+        if ultimo:
+            resultados, sucesso, erro = ultimo
+            (st.success if not erro else st.warning)(f"Carrinho enviado: {sucesso} SKU(s) com sucesso, {erro} com erro.")
+            st.dataframe(pd.DataFrame(resultados), use_container_width=True, hide_index=True)
+
+        busca = st.text_input("🔍 Buscar", placeholder="Código ou nome...")
+
+        if not busca:
+            st.info("Digite pelo menos 2 caracteres para buscar.")
+        elif len(busca) < 2:
+            st.warning("Digite mais caracteres.")
         else:
-            st.write(f"**{len(found)}** produto(s) encontrados.")
-            for _, p in found.head(8).iterrows():
-                with st.expander(f"{p['semaforo']} {p['codigo']} — {p['nome']}"):
-                    c1, c2, c3 = st.columns(3)
-                    with c1:
-                        st.metric("Atual", f"{int(p['estoque_atual'])}")
-                        st.metric("Mín", f"{int(p['estoque_min'])}")
-                        st.metric("Máx", f"{int(p['estoque_max'])}")
-                    with c2:
-                        qtd_e = st.number_input("Quantidade (Entrada)", min_value=1, value=1, key=f"ent_{p['codigo']}")
-                        if st.button("+ Entrada", key=f"btn_ent_{p['codigo']}"):
-                            r = movimentar_estoque(p['codigo'], qtd_e, 'entrada', colaborador, test_mode=test_mode)
-                            st.success(f"Entrada: {r.get('message','OK')} | Novo estoque: {r.get('novo_estoque')}")
-                            if not test_mode and r.get('success'):
-                                st.cache_data.clear(); st.rerun()
-                    with c3:
-                        max_s = max(1, int(p['estoque_atual']))
-                        qtd_s = st.number_input("Quantidade (Saída)", min_value=1, max_value=max_s, value=1, key=f"sai_{p['codigo']}")
-                        if st.button("- Saída", key=f"btn_sai_{p['codigo']}"):
-                            r = movimentar_estoque(p['codigo'], qtd_s, 'saida', colaborador, test_mode=test_mode)
-                            st.success(f"Saída: {r.get('message','OK')} | Novo estoque: {r.get('novo_estoque')}")
-                            if not test_mode and r.get('success'):
-                                st.cache_data.clear(); st.rerun()
+            found = df_filtrado[
+                df_filtrado['codigo'].str.contains(busca, case=False, na=False) |
+                df_filtrado['nome'].str.contains(busca, case=False, na=False)
+            ]
+            if found.empty:
+                st.warning("Nada encontrado.")
+            else:
+                st.write(f"**{len(found)}** produto(s) encontrados.")
+                for _, p in found.head(8).iterrows():
+                    with st.expander(f"{p['semaforo']} {p['codigo']} — {p['nome']}"):
+                        c1, c2, c3 = st.columns(3)
+                        with c1:
+                            st.metric("Atual", f"{int(p['estoque_atual'])}")
+                            st.metric("Mín", f"{int(p['estoque_min'])}")
+                            st.metric("Máx", f"{int(p['estoque_max'])}")
+                        with c2:
+                            qtd_e = st.number_input("Quantidade (Entrada)", min_value=1, value=1, key=f"ent_{p['codigo']}")
+                            if st.button("+ Entrada", key=f"btn_ent_{p['codigo']}"):
+                                carrinho.append(item_carrinho(p['codigo'], qtd_e, 'entrada'))
+                                st.toast(f"Entrada de {qtd_e} × {p['codigo']} no carrinho")
+                        with c3:
+                            qtd_s = st.number_input("Quantidade (Saída)", min_value=1, value=1, key=f"sai_{p['codigo']}")
+                            if st.button("- Saída", key=f"btn_sai_{p['codigo']}"):
+                                carrinho.append(item_carrinho(p['codigo'], qtd_s, 'saida'))
+                                st.toast(f"Saída de {qtd_s} × {p['codigo']} no carrinho")
+
+        st.markdown("---")
+        st.subheader(f"🛒 Carrinho ({len(carrinho)} lançamento(s))")
+        if not carrinho:
+            st.caption("Entradas e saídas adicionadas acima ficam aqui até a confirmação.")
+        else:
+            cons = consolidar_carrinho(carrinho, produtos_df)
+            tbl = cons[['codigo','nome','entradas','saidas','liquido','estoque_atual','estoque_final','valido']].rename(columns={
+                'codigo':'Código','nome':'Produto','entradas':'Entradas','saidas':'Saídas','liquido':'Líquido',
+                'estoque_atual':'Atual','estoque_final':'Final','valido':'OK'
+            })
+            st.dataframe(tbl, use_container_width=True, hide_index=True)
+            invalidos = cons[~cons['valido']]
+            n_envios = int((cons['liquido'] != 0).sum())
+            if not invalidos.empty:
+                st.error("Ajuste antes de confirmar — estoque final negativo ou código fora da planilha: "
+                         + ", ".join(invalidos['codigo'].astype(str)))
+            c1, c2 = st.columns(2)
+            with c1:
+                label_btn = "🧪 SIMULAR carrinho" if test_mode else f"✅ CONFIRMAR {n_envios} movimentação(ões)"
+                if st.button(label_btn, type="primary", use_container_width=True, disabled=not invalidos.empty or not n_envios):
+                    prog = st.progress(0); txt = st.empty()
+
+                    def progresso(i, total, codigo):
+                        txt.text(f"Enviando {i+1}/{total}: {codigo}")
+                        prog.progress((i+1)/total)
+
+                    resultados, sucesso, erro = aplicar_carrinho(
+                        cons, colaborador, test_mode=test_mode, webhook_url=fonte_atual['webhook'], progresso=progresso
+                    )
+                    st.session_state['carrinho_resultado'] = (resultados, sucesso, erro)
+                    if not test_mode:
+                        # fica no carrinho só o que falhou, para reenviar; um único refresh no fim
+                        falhas = {r['codigo'] for r in resultados if r['status'] != 'Sucesso'}
+                        manter = set(cons.loc[cons['codigo'].isin(falhas), 'codigo_key'])
+                        st.session_state[chave_carrinho] = [it for it in carrinho if it['codigo_key'] in manter]
+                        if sucesso:
+                            recarregar_catalogo()
+                    st.rerun()
+            with c2:
+                st.button("🗑️ Esvaziar carrinho", use_container_width=True,
+                          on_click=st.session_state.__setitem__, args=(chave_carrinho, []))
+
+    pagina_movimentacao()
 
 # ======================
 # BAIXA POR FATURAMENTO (NORMALIZADO)
 # ======================
 elif tipo_analise == "Baixa por Faturamento":
+    # sem fragmento: depois de aplicar, o cache é limpo e o relatório fica na
+    # tela; a próxima interação precisa recarregar o catálogo (script todo)
     st.subheader("Baixa por Faturamento")
+    CHAVE_TAREFA = f"tarefa_baixa_{EMPRESA['id']}"   # tarefa acompanhada na sessão, por empresa
     st.markdown("""
     <div class="success-box">
       <strong>Fluxo:</strong><br>
-      1) Faça upload do arquivo (CSV/XLS/XLSX com <em>Código</em> e <em>Quantidade</em>)<br>
-      2) Preview (encontrados x não encontrados + estoques finais)<br>
-      3) Clique para <b>simular</b> (Modo Teste) ou <b>aplicar</b> (altera planilha)
+      1) Faça upload dos arquivos (CSV/XLS/XLSX com <em>Código</em> e <em>Quantidade</em>, ou um ZIP com vários)<br>
+      2) Preview consolidado (demanda somada por código, encontrados x não encontrados + estoques finais)<br>
+      3) Clique para <b>simular</b> (Modo Teste) ou <b>aplicar</b> (altera planilha) — uma única rodada para todos os arquivos
     </div>
     """, unsafe_allow_html=True)
 
     st.info("Modo Teste está **{}**.".format("ATIVO (simulação)" if test_mode else "DESATIVADO (vai alterar planilha)"))
 
-    colaborador_fatura = st.selectbox("👤 Colaborador responsável", ['Pericles','Maria','Camila','Cris VantiStella'], key="colab_fatura")
-    arquivo = st.file_uploader("📁 Arquivo de faturamento", type=['csv','xls','xlsx'])
-
-    if arquivo:
-        with st.spinner("Processando arquivo..."):
-            ok, nok, err = processar_faturamento(arquivo, produtos_df)
+    colaborador_fatura = st.selectbox("👤 Colaborador responsável", EMPRESA['colaboradores'], key="colab_fatura")
+    arquivos = st.file_uploader("📁 Arquivos de faturamento", type=['csv','xls','xlsx','zip'], accept_multiple_files=True)
+
+    reg_aliases = aliases_codigos(EMPRESA['aliases'])
+    if reg_aliases:
+        with st.expander(f"🔗 Aliases de códigos ({len(reg_aliases)})"):
+            tbl_alias = pd.DataFrame([{'Chave na Fatura': k, **r} for k, r in reg_aliases.items()]).rename(columns={
+                'codigo':'Código no Catálogo','data_hora':'Data/Hora','colaborador':'Colaborador'
+            })
+            st.dataframe(tbl_alias, use_container_width=True, hide_index=True, height=200)
+            remover = st.multiselect("Remover aliases", list(reg_aliases), key="aliases_remover")
+
+            def remover_selecionados():
+                remover_aliases(st.session_state.pop("aliases_remover"), EMPRESA['aliases'])
+
+            st.button("🗑️ Remover selecionados", disabled=not remover, on_click=remover_selecionados)
+
+    if arquivos:
+        lote, err = None, None
+        with st.spinner("Processando arquivos..."):
+            try:
+                chave = tuple((a.name, digest_arquivo(a)) for a in arquivos)
+                aliases = mapa_aliases(EMPRESA['aliases'])
+                lote = processar_faturas(chave, produtos_df.attrs.get('versao'), aliases, arquivos, produtos_df)
+                # exports do lote: mudam com os arquivos, o catálogo e os aliases (salvar um tira o código de `nok`)
+                chave_export = chave + (hashlib.sha1(repr(sorted(aliases.items())).encode()).hexdigest()[:12],)
+            except Exception as e:
+                err = f"Erro ao processar arquivo: {str(e)}"
+        if lote:
+            for nome_arq, msg in lote['erros']:
+                st.warning(f"**{nome_arq}**: {msg}")
+            if len(lote['erros']) == lote['lidos']:
+                err = "Nenhum arquivo pôde ser lido."
         if err:
             st.error(err)
         else:
-            c1, c2, c3 = st.columns(3)
-            with c1: st.metric("Total de Linhas", len(ok)+len(nok))
-            with c2: st.metric("Produtos Encontrados", len(ok))
-            with c3: st.metric("Não Encontrados", len(nok))
+            com_erro = {nome_arq for nome_arq, _ in lote['erros']}
+            digests = {n: d for n, d in chave if n not in com_erro}
+            for nome_arq, reg in ja_aplicadas(digests, EMPRESA['registro_aplicadas']).items():
+                if reg.get('tarefa'):
+                    st.warning(f"⚠️ **{nome_arq}** está na tarefa de baixa `{reg['tarefa']}`, criada em "
+                               f"{reg['data_hora']} por {reg['colaborador']} e ainda não concluída. "
+                               "Acompanhe-a em 🧵 Tarefas de baixa recentes antes de aplicar de novo.")
+                else:
+                    st.warning(f"⚠️ **{nome_arq}** já foi aplicado em {reg['data_hora']} por {reg['colaborador']} "
+                               f"(como '{reg['arquivo']}'). Confira antes de aplicar de novo.")
+            ok, nok = lote['ok'], lote['nok']
+            ambiguas = validacao.chaves_em_colisao(problemas_catalogo, fonte_atual['deposito']) & set(ok['codigo_key'])
+            if ambiguas:
+                st.error(f"🩺 {len(ambiguas)} código(s) da fatura caem numa chave usada por mais de um SKU do catálogo "
+                         f"({', '.join(sorted(ambiguas)[:10])}): a baixa iria para um só deles. "
+                         "Corrija os códigos na planilha antes de aplicar.")
+            c1, c2, c3, c4 = st.columns(4)
+            with c1: st.metric("Arquivos", lote['lidos'] - len(lote['erros']))
+            with c2: st.metric("Total de Linhas", len(ok)+len(nok))
+            with c3: st.metric("Produtos Encontrados", len(ok))
+            with c4: st.metric("Não Encontrados", len(nok))
+            if lote['via_alias']:
+                st.caption(f"🔗 {len(lote['via_alias'])} código(s) da fatura resolvido(s) por alias.")
 
             if not nok.empty:
                 st.markdown("""<div class="error-box"><b>ATENÇÃO:</b> Códigos não encontrados na planilha.</div>""", unsafe_allow_html=True)
-                tbl_nok = nok[['codigo','quantidade','codigo_key']].rename(columns={'codigo':'Código','quantidade':'Quantidade','codigo_key':'Chave Normalizada'})
+                tbl_nok = nok[['codigo','quantidade','codigo_key','arquivos']].rename(columns={'codigo':'Código','quantidade':'Quantidade','codigo_key':'Chave Normalizada','arquivos':'Arquivos'})
                 st.dataframe(tbl_nok, use_container_width=True, height=220)
-                st.download_button("📥 Baixar faltantes (CSV)", tbl_nok.to_csv(index=False, encoding='utf-8-sig'),
-                                   file_name=f"codigos_faltantes_{datetime.now():%Y%m%d_%H%M%S}.csv", mime="text/csv")
+                botao_exportar(tbl_nok, "codigos_faltantes", versao=produtos_df.attrs.get('versao'), chave=chave_export,
+                               rotulo="📥 Baixar faltantes", empresa=EMPRESA['id'])
+
+                with st.expander("🔎 Sugestões de códigos parecidos", expanded=True):
+                    sug = sugestoes_codigos(tuple(nok['codigo']), EMPRESA['id'], produtos_df.attrs.get('versao'), produtos_df)
+                    if sug.empty:
+                        st.info("Nenhum código parecido no catálogo.")
+                    else:
+                        st.caption("Marque a sugestão certa: vira um alias e as próximas faturas com esse código são baixadas direto.")
+                        tbl_sug = sug[['codigo','sugestao','nome','similaridade']].assign(aceitar=False).rename(columns={
+                            'codigo':'Código da Fatura','sugestao':'Sugestão','nome':'Produto','similaridade':'Similaridade','aceitar':'Aceitar'
+                        })
+                        chave_editor = f"sugestoes_{hashlib.sha1(repr(chave).encode()).hexdigest()[:12]}"
+                        editado = st.data_editor(tbl_sug, use_container_width=True, hide_index=True, height=260,
+                                                 disabled=['Código da Fatura','Sugestão','Produto','Similaridade'],
+                                                 key=chave_editor)
+                        # mais de uma marcada para o mesmo código: vale a de maior similaridade
+                        aceitos = editado[editado['Aceitar']].drop_duplicates('Código da Fatura')
+
+                        def salvar_aliases(pares):
+                            registrar_aliases(pares, colaborador_fatura, EMPRESA['aliases'])
+                            # a tabela de sugestões muda: as marcações antigas apontariam para outras linhas
+                            st.session_state.pop(chave_editor, None)
+
+                        st.button(f"🔗 Salvar {len(aceitos)} alias(es)", disabled=aceitos.empty, on_click=salvar_aliases,
+                                  args=(dict(zip(aceitos['Código da Fatura'], aceitos['Sugestão'])),))
+
+            with st.expander("🗂️ Proveniência por arquivo"):
+                prov = lote['proveniencia']
+                st.dataframe(prov.groupby('arquivo').agg(linhas=('codigo', 'size'), quantidade=('quantidade', 'sum')),
+                             use_container_width=True)
+                botao_exportar(prov, "proveniencia", versao=produtos_df.attrs.get('versao'), chave=chave_export,
+                               rotulo="📥 Baixar proveniência", empresa=EMPRESA['id'])
 
             if not ok.empty:
                 st.markdown("---"); st.subheader("Preview da Baixa")
-                prev = ok[['codigo_canonical','nome','estoque_atual','quantidade','estoque_final']].copy()
-                prev.columns = ['Código','Produto','Estoque Atual','Qtd a Baixar','Estoque Final']
-                for c in ['Estoque Atual','Qtd a Baixar','Estoque Final']:
-                    prev[c] = pd.to_numeric(prev[c], errors='coerce').fillna(0).astype(int)
-                prev['Status'] = prev['Estoque Final'].apply(lambda x: 'Negativo' if x < 0 else ('Zerado' if x == 0 else 'OK'))
+                prev = lote['preview']
                 st.dataframe(prev, use_container_width=True, height=420)
 
                 c1, c2, c3 = st.columns(3)
@@ -524,164 +730,270 @@ elif tipo_analise == "Baixa por Faturamento":
 
                 st.markdown("---")
                 label_btn = "🧪 SIMULAR baixas (modo teste)" if test_mode else "✅ APLICAR baixas (alterar planilha)"
-                if st.button(label_btn, type="primary", use_container_width=True):
-                    sucesso, erro = 0, 0
-                    resultados = []
-                    prog = st.progress(0); txt = st.empty()
-                    total = len(ok)
-                    for i, row in ok.iterrows():
-                        txt.text(f"Processando {i+1}/{total}: {row.get('codigo_canonical', row['codigo'])}")
-                        res = movimentar_estoque(
-                            row.get('codigo_canonical', row['codigo']),
-                            row['quantidade'],
-                            'saida',
-                            colaborador_fatura,
-                            test_mode=test_mode
-                        )
-                        if res.get('success'):
-                            sucesso += 1
-                            resultados.append({
-                                'codigo': row.get('codigo_canonical', row['codigo']),
-                                'nome': row['nome'],
-                                'qtd_baixada': row['quantidade'],
-                                'estoque_anterior': row['estoque_atual'],
-                                'estoque_final': res.get('novo_estoque','N/A'),
-                                'status': 'Sucesso',
-                                'data_hora': f"{datetime.now():%Y-%m-%d %H:%M:%S}",
-                                'colaborador': colaborador_fatura
-                            })
-                        else:
-                            erro += 1
-                            resultados.append({
-                                'codigo': row.get('codigo_canonical', row['codigo']),
-                                'nome': row['nome'],
-                                'qtd_baixada': row['quantidade'],
-                                'estoque_anterior': row['estoque_atual'],
-                                'estoque_final': 'N/A',
-                                'status': f"Erro: {res.get('message','desconhecido')}",
-                                'data_hora': f"{datetime.now():%Y-%m-%d %H:%M:%S}",
-                                'colaborador': colaborador_fatura
-                            })
-                        prog.progress((i+1)/total)
-                    prog.empty(); txt.empty()
-
-                    st.markdown("---"); st.subheader("📄 Relatório de Baixas")
-                    c1, c2, c3 = st.columns(3)
-                    with c1: st.metric("✅ Sucessos", sucesso)
-                    with c2: st.metric("❌ Erros", erro)
-                    with c3: st.metric("📊 Total", sucesso+erro)
-
-                    df_res = pd.DataFrame(resultados)
-                    show = df_res[['codigo','nome','qtd_baixada','estoque_anterior','estoque_final','status']].rename(
-                        columns={'codigo':'Código','nome':'Produto','qtd_baixada':'Qtd Baixada','estoque_anterior':'Estoque Anterior','estoque_final':'Estoque Final','status':'Status'}
+                ativa = st.session_state.get(CHAVE_TAREFA)
+                em_andamento = bool(ativa) and fila_tarefas(EMPRESA['id']).progresso(ativa)['estado'] in tarefas.ATIVAS
+                if st.button(label_btn, type="primary", use_container_width=True, disabled=em_andamento):
+                    st.session_state[CHAVE_TAREFA] = fila_tarefas(EMPRESA['id']).submeter(
+                        ok, colaborador_fatura, test_mode=test_mode, webhook_url=fonte_atual['webhook'],
+                        digests=digests, rotulo="; ".join(digests)
                     )
-                    st.dataframe(show, use_container_width=True, height=420)
 
-                    st.download_button("📥 Baixar Relatório (CSV)", df_res.to_csv(index=False, encoding='utf-8-sig'),
-                                       file_name=f"relatorio_baixas_{datetime.now():%Y%m%d_%H%M%S}.csv", mime="text/csv")
+    # ---------- tarefa de baixa (roda em background; a página só acompanha) ----------
+    def painel_tarefa(tid):
+        p = fila_tarefas(EMPRESA['id']).progresso(tid)
+        ativa = p['estado'] in tarefas.ATIVAS
+        st.markdown("---"); st.subheader("📄 Relatório de Baixas")
+        st.caption(f"Tarefa `{tid}` — {p['estado']}{' (simulação)' if p['test_mode'] else ''} · "
+                   f"{p['colaborador']} · {p['rotulo'] or 'sem arquivo'}")
+        st.progress((p['total'] - p['pendentes']) / p['total'] if p['total'] else 1.0)
+        c1, c2, c3, c4, c5 = st.columns(5)
+        with c1: st.metric("✅ Sucessos", p['sucesso'])
+        with c2: st.metric("❌ Erros", p['erro'])
+        with c3: st.metric("⏳ Pendentes", p['pendentes'])
+        with c4: st.metric("⚡ Linhas/s", f"{p['linhas_por_s']:.1f}")
+        with c5: st.metric("⏱️ Restante", f"{p['eta_s']:.0f} s" if p['eta_s'] is not None else "—")
+
+        if p['incertas']:
+            st.warning(f"⚠️ {p['incertas']} linha(s) sem resposta do webhook (queda no meio do envio): a planilha pode "
+                       "já ter recebido a saída. Confira no Histórico de Baixas antes de reenviar.")
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            st.button("⏸️ Cancelar", disabled=not ativa, use_container_width=True,
+                      on_click=fila_tarefas(EMPRESA['id']).cancelar, args=(tid,), key=f"cancelar_{tid}")
+        with c2:
+            st.button("▶️ Retomar (pendentes e erros)", disabled=ativa or not (p['pendentes'] + p['erro']),
+                      use_container_width=True, on_click=fila_tarefas(EMPRESA['id']).retomar, args=(tid,), key=f"retomar_{tid}")
+        with c3:
+            st.button("🔁 Reenviar também as incertas", disabled=ativa or not p['incertas'], use_container_width=True,
+                      on_click=fila_tarefas(EMPRESA['id']).retomar, args=(tid, True), key=f"incertas_{tid}")
+
+        resultados = fila_tarefas(EMPRESA['id']).resultados(tid)
+        if resultados:
+            df_res = pd.DataFrame(resultados)
+            show = df_res[['codigo','nome','qtd_baixada','estoque_anterior','estoque_final','status']].rename(
+                columns={'codigo':'Código','nome':'Produto','qtd_baixada':'Qtd Baixada','estoque_anterior':'Estoque Anterior','estoque_final':'Estoque Final','status':'Status'}
+            )
+            st.dataframe(show, use_container_width=True, height=420)
+            if not ativa:
+                botao_exportar(df_res, "relatorio_baixas", versao=f"{tid}:{len(df_res)}", rotulo="📥 Baixar Relatório",
+                               empresa=EMPRESA['id'])
+        if p['estado'] == 'concluida':
+            # uma vez por tarefa: a planilha mudou, o catálogo em cache não vale mais
+            if not p['test_mode'] and p['sucesso'] and not st.session_state.get(f"recarregado_{tid}"):
+                st.session_state[f"recarregado_{tid}"] = True
+                recarregar_catalogo()
+            st.success("Processo concluído.")
+        return ativa
+
+    # enquanto roda, só este pedaço é atualizado (1 s); ao terminar, um rerun completo
+    @st.fragment(run_every=1)
+    def acompanhar_tarefa(tid):
+        if not painel_tarefa(tid):
+            st.rerun()
+
+    tarefa_atual = st.session_state.get(CHAVE_TAREFA)
+    if tarefa_atual:
+        if fila_tarefas(EMPRESA['id']).progresso(tarefa_atual)['estado'] in tarefas.ATIVAS:
+            acompanhar_tarefa(tarefa_atual)
+        else:
+            painel_tarefa(tarefa_atual)
 
-                    if not test_mode:
-                        st.cache_data.clear()
-                    st.success("Processo concluído.")
+    recentes = fila_tarefas(EMPRESA['id']).listar()
+    if not recentes.empty:
+        with st.expander(f"🧵 Tarefas de baixa recentes ({len(recentes)})"):
+            st.dataframe(recentes, use_container_width=True, hide_index=True)
+            escolhida = st.selectbox("Acompanhar tarefa", recentes['id'], key="tarefa_escolhida")
+            st.button("👁️ Acompanhar", on_click=st.session_state.__setitem__, args=(CHAVE_TAREFA, escolhida))
 
 # ======================
 # HISTÓRICO DE BAIXAS (da planilha)
 # ======================
 elif tipo_analise == "Histórico de Baixas":
-    st.subheader("Histórico de Baixas (planilha)")
-    url = "https://docs.google.com/spreadsheets/d/1PpiMQingHf4llA03BiPIuPJPIZqul4grRU_emWDEK1o/gviz/tq?tqx=out:csv&sheet=historico_baixas"
-    try:
-        r = requests.get(url, timeout=15); r.raise_for_status()
-        hist = pd.read_csv(StringIO(r.text))
-        if hist.empty:
-            st.info("Nenhum registro ainda.")
-        else:
+    @st.fragment
+    @medido('fragment', "Histórico de Baixas")
+    def pagina_historico():
+        st.subheader("Histórico de Baixas (planilha)")
+        url = EMPRESA['historico_url']
+        try:
+            with span('fetch', 'historico'):
+                r = requests.get(url, timeout=15); r.raise_for_status()
+            with span('parse', 'historico'):
+                hist = ler_csv(r.content)
+            versao_hist = hashlib.sha1(r.content).hexdigest()[:16]
+            if hist.empty:
+                st.info("Nenhum registro ainda.")
+                return
             st.dataframe(hist, use_container_width=True, height=520)
-            st.download_button("📥 Baixar CSV", hist.to_csv(index=False, encoding='utf-8-sig'),
-                               file_name=f"historico_baixas_{datetime.now():%Y%m%d_%H%M%S}.csv", mime="text/csv")
-    except Exception:
-        st.warning("Aba 'historico_baixas' não encontrada ou sem acesso.")
+            botao_exportar(hist, "historico_baixas", versao=versao_hist, empresa=EMPRESA['id'])
+        except Exception:
+            st.warning("Aba 'historico_baixas' não encontrada ou sem acesso.")
+            return
+        mostrar_conciliacao(hist, versao_hist)
+
+    def razao_empresa():
+        """Reprodução incremental do histórico (ver razao.py); checkpoint na pasta da empresa."""
+        return COMPARTILHADO.obter((EMPRESA['id'], 'razao'), lambda: razao.Razao(EMPRESA['razao']))
+
+    def conciliar_historico(hist, versao_hist, deposito):
+        """
+        Estoque esperado pelo histórico × planilha do depósito, uma vez por
+        (histórico, snapshot). Retorna (resultado, catálogo, versão do resultado).
+        """
+        catalogo = carregar_produtos()
+        versao = catalogo.attrs['versoes'][deposito]
+        catalogo = catalogo[catalogo['deposito'] == deposito]
+        def conciliar():
+            res = razao_empresa().atualizar(hist)
+            COMPARTILHADO.remedir((EMPRESA['id'], 'razao'))
+            return {**res, 'conciliacao': razao.conciliar(res['saldos'], catalogo)}
+        res = derivado('razao', (versao_hist, versao), conciliar)
+        return res, catalogo, (versao_hist, versao, res['base_aceita_em'], res['base_alterada'])
+
+    def aceitar_base(catalogo):
+        razao_empresa().rebasear(catalogo)
+        COMPARTILHADO.descartar((EMPRESA['id'], 'razao'))
+
+    def mostrar_conciliacao(hist, versao_hist):
+        # o histórico é a aba da planilha da primeira fonte
+        deposito = FONTES[0]['deposito']
+        st.markdown(f"#### ⚖️ Histórico × planilha ({deposito})")
+        try:
+            res, catalogo, versao_res = conciliar_historico(hist, versao_hist, deposito)
+        except KeyError as e:
+            st.info(f"Sem conciliação: {e.args[0]}")
+            return
+        conc, ocorrencias = res['conciliacao'], res['ocorrencias']
+        situacoes = conc['situacao'].value_counts()
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("SKUs conferidos", len(conc))
+        c2.metric("Divergentes", int(situacoes.get('divergente', 0)))
+        c3.metric("Fora do catálogo", int(situacoes.get('fora_do_catalogo', 0)))
+        c4.metric("Ocorrências no histórico", len(ocorrencias))
+        if res['base_alterada']:
+            st.warning("Linhas do histórico anteriores à base aceita foram alteradas ou apagadas. A base foi "
+                       "mantida e os movimentos seguintes foram reproduzidos sobre ela; confira as linhas "
+                       "alteradas e, se preciso, aceite o estoque atual como base de novo.")
+        modo = ("a partir do checkpoint" if res['incremental']
+                else "desde a base aceita" if res['com_base'] else "histórico inteiro")
+        st.caption(f"{res['linhas']} movimento(s); {res['novas']} reproduzido(s) nesta atualização ({modo}).")
+        if (conc['origem'] == 'zero').any():
+            st.caption("SKUs sem estoque_anterior no histórico partem de zero: aceite o estoque atual "
+                       "como base para conferir só os movimentos seguintes.")
+
+        divergentes = conc[conc['situacao'] != 'ok']
+        if divergentes.empty:
+            st.success("O estoque da planilha bate com o histórico.")
+        else:
+            st.dataframe(divergentes, use_container_width=True, hide_index=True, height=320)
+            botao_exportar(divergentes, "conciliacao_historico", versao=versao_res, empresa=EMPRESA['id'])
+        if not ocorrencias.empty:
+            with st.expander(f"Ocorrências no histórico ({len(ocorrencias)})"):
+                st.caption("registro_inconsistente: novo ≠ anterior ± quantidade · salto: o anterior não é o "
+                           "novo do movimento anterior (estoque mexido fora do app) · movimento_invalido: "
+                           "tipo ou quantidade ilegível. linha = linha na aba.")
+                st.dataframe(ocorrencias, use_container_width=True, hide_index=True)
+        st.button("📌 Aceitar o estoque atual da planilha como base", on_click=aceitar_base, args=(catalogo,),
+                  help="Os saldos passam a partir do estoque atual; divergências e ocorrências anteriores são descartadas.")
+
+    pagina_historico()
+
+# ======================
+# LINHA DO TEMPO
+# ======================
+elif tipo_analise == "Linha do Tempo":
+    @st.fragment
+    @medido('fragment', "Linha do Tempo")
+    def pagina_linha_do_tempo():
+        st.subheader("Linha do tempo do catálogo")
+        ldt = linha_do_tempo(EMPRESA['id'])
+        serie = fonte_atual['deposito']
+        inst = ldt.instantes(serie) if ldt else None
+        if ldt is None:
+            st.info("A linha do tempo grava os snapshots em Parquet e precisa do pacote pyarrow.")
+        elif inst.empty:
+            st.info("Nenhum snapshot gravado ainda — o primeiro é gravado na próxima carga da planilha.")
+        else:
+            st.caption(f"{len(inst)} snapshot(s) desde {inst['em'].min():%d/%m/%Y %H:%M} "
+                       f"({int((inst['tipo'] == 'checkpoint').sum())} completo(s), o resto em delta)")
+            c1, c2, c3 = st.columns(3)
+            with c1:
+                dia = st.date_input("Data", value=inst['em'].max().date(),
+                                    min_value=inst['em'].min().date(), max_value=datetime.now().date())
+            with c2:
+                hora = st.time_input("Hora", value=datetime.now().time().replace(second=0, microsecond=0))
+            with c3:
+                codigo_tt = st.text_input("Código (opcional)", placeholder="Todo o catálogo")
+            quando = datetime.combine(dia, hora).replace(second=59)   # o seletor é por minuto: inclui o minuto todo
+            anteriores = inst[inst['em'] <= quando]
+
+            if anteriores.empty:
+                st.warning(f"Nenhum snapshot até {quando:%d/%m/%Y %H:%M}.")
+            elif codigo_tt:
+                linha = ldt.sku_em(serie, codigo_tt, quando)
+                if linha is None:
+                    st.warning(f"{codigo_tt} não estava no catálogo em {quando:%d/%m/%Y %H:%M}.")
+                else:
+                    st.markdown(f"**{linha['codigo']} — {linha['nome']}** em {quando:%d/%m/%Y %H:%M}")
+                    c1, c2, c3 = st.columns(3)
+                    with c1: st.metric("Estoque", f"{linha['estoque_atual'] or 0:g}")
+                    with c2: st.metric("Mínimo", f"{linha['estoque_min'] or 0:g}")
+                    with c3: st.metric("Máximo", f"{linha['estoque_max'] or 0:g}")
+                hist_sku = ldt.historico_sku(serie, codigo_tt)
+                if 'estoque_atual' in hist_sku.columns:
+                    st.line_chart(hist_sku.set_index('em')['estoque_atual'])
+                    st.dataframe(hist_sku.drop(columns=['seq', 'codigo_key'], errors='ignore'),
+                                 use_container_width=True, hide_index=True)
+            else:
+                reg = anteriores.iloc[-1]
+                cat_tt = catalogo_no_instante(serie, int(reg['seq']), reg['em'])
+                st.write(f"Snapshot de **{reg['em']:%d/%m/%Y %H:%M}** — {len(cat_tt)} produto(s).")
+                st.dataframe(cat_tt.drop(columns=['codigo_key']), use_container_width=True, height=480, hide_index=True)
+                botao_exportar(cat_tt.drop(columns=['codigo_key']), f"catalogo_{reg['em']:%Y%m%d_%H%M}",
+                               chave=(serie,), versao=int(reg['seq']), empresa=EMPRESA['id'])
+
+    pagina_linha_do_tempo()
 
 # ======================
 # RELATÓRIO DE FALTANTES (NORMALIZADO)
 # ======================
 elif tipo_analise == "Relatório de Faltantes":
-    st.subheader("Relatório de Produtos Faltantes")
-    st.markdown("""
-    <div class="warning-box">
-      Faça upload do arquivo de vendas (CSV/XLS/XLSX com <em>Código</em> e <em>Quantidade</em>).
-      Kits são expandidos e cada componente é checado individualmente.
-    </div>
-    """, unsafe_allow_html=True)
-
-    arq = st.file_uploader("📁 Arquivo de vendas", type=['csv','xls','xlsx'], key="faltantes_up")
-    if arq:
-        try:
-            nm = arq.name.lower()
-            if nm.endswith('.csv'):
-                df_v = pd.read_csv(arq, encoding='latin1')
-            elif nm.endswith('.xlsx'):
-                df_v = pd.read_excel(arq, engine='openpyxl')
-            else:
-                df_v = pd.read_excel(arq, engine='xlrd')
+    @st.fragment
+    @medido('fragment', "Relatório de Faltantes")
+    def pagina_faltantes():
+        st.subheader("Relatório de Produtos Faltantes")
+        st.markdown("""
+        <div class="warning-box">
+          Faça upload do arquivo de vendas (CSV/XLS/XLSX com <em>Código</em> e <em>Quantidade</em>).
+          Kits são expandidos e cada componente é checado individualmente.
+        </div>
+        """, unsafe_allow_html=True)
+
+        arq = st.file_uploader("📁 Arquivo de vendas", type=['csv','xls','xlsx'], key="faltantes_up")
+        if arq:
+            try:
+                chave_vendas = (arq.name, digest_arquivo(arq))
+                df_v, falt, err = processar_vendas(chave_vendas, produtos_df.attrs.get('versao'), arq, produtos_df)
+                if err:
+                    st.error(err)
+                else:
+                    st.success(f"Arquivo carregado: {len(df_v)} linhas após normalização/expansão.")
 
-            df_v.columns = df_v.columns.str.lower().str.strip()
-            if 'codigo' not in df_v.columns or 'quantidade' not in df_v.columns:
-                st.error(f"Arquivo precisa de colunas 'codigo' e 'quantidade'. Colunas: {list(df_v.columns)}")
-            else:
-                df_v['codigo'] = df_v['codigo'].astype(str).str.strip()
-                df_v['quantidade'] = df_v['quantidade'].apply(lambda x: safe_int(x, 0)).astype(int)
-                df_v = df_v.groupby('codigo', as_index=False)['quantidade'].sum()
-
-                # Expande kits nas vendas e normaliza chaves
-                df_v = expandir_kits(df_v, produtos_df)
-                if 'codigo_key' not in df_v.columns:
-                    df_v['codigo_key'] = df_v['codigo'].map(normalize_key)
-
-                st.success(f"Arquivo carregado: {len(df_v)} linhas após normalização/expansão.")
-
-                falt = []
-                estoque_map = {row['codigo_key']: row for _, row in produtos_df.iterrows()}
-
-                for _, row in df_v.iterrows():
-                    key = row['codigo_key']
-                    q = safe_int(row['quantidade'], 0)
-                    if key in estoque_map:
-                        prod = estoque_map[key]
-                        est = safe_int(prod.get('estoque_atual', 0), 0)
-                        if est < q:
-                            falt.append({
-                                'kit_original': '-',
-                                'codigo': prod.get('codigo', row['codigo']),
-                                'produto': prod.get('nome',''),
-                                'estoque_atual': est,
-                                'qtd_necessaria': q,
-                                'falta': q - est,
-                                'tipo': 'Produto/Componente'
-                            })
+                    if not falt:
+                        st.success("Todos com estoque suficiente. 🔥")
                     else:
-                        falt.append({
-                            'kit_original': '-',
-                            'codigo': row.get('codigo','(não cadastrado)'),
-                            'produto': 'NÃO CADASTRADO',
-                            'estoque_atual': 0,
-                            'qtd_necessaria': q,
-                            'falta': q,
-                            'tipo': 'Não cadastrado'
-                        })
+                        df_f = pd.DataFrame(falt)
+                        df_f = df_f[['codigo','produto','estoque_atual','qtd_necessaria','falta','tipo']]
+                        df_f.columns = ['Código','Produto','Estoque Atual','Qtd Necessária','Falta','Tipo']
+                        st.dataframe(df_f, use_container_width=True, height=480)
+                        botao_exportar(df_f, "faltantes", versao=produtos_df.attrs.get('versao'),
+                                       chave=chave_vendas, rotulo="📥 Baixar faltantes", empresa=EMPRESA['id'])
 
-                if not falt:
-                    st.success("Todos com estoque suficiente. 🔥")
-                else:
-                    df_f = pd.DataFrame(falt)
-                    df_f = df_f[['codigo','produto','estoque_atual','qtd_necessaria','falta','tipo']]
-                    df_f.columns = ['Código','Produto','Estoque Atual','Qtd Necessária','Falta','Tipo']
-                    st.dataframe(df_f, use_container_width=True, height=480)
-                    st.download_button("📥 Baixar faltantes (CSV)", df_f.to_csv(index=False, encoding='utf-8-sig'),
-                                       file_name=f"faltantes_{datetime.now():%Y%m%d_%H%M%S}.csv", mime="text/csv")
+            except Exception as e:
+                st.error(f"Erro ao processar: {e}")
+
+    pagina_faltantes()
 
-        except Exception as e:
-            st.error(f"Erro ao processar: {e}")
+metricas.fim('render', t_render, tipo_analise)
 
 # ======================
 # FOOTER
@@ -690,8 +1002,10 @@ st.markdown("---")
 c1, c2, c3 = st.columns(3)
 with c1:
     if st.button("🔄 Atualizar Dados"):
-        st.cache_data.clear(); st.rerun()
+        recarregar_catalogo(); st.rerun()
 with c2:
     st.write(f"**Última atualização:** {datetime.now():%H:%M:%S}")
 with c3:
     st.write(f"**Filtros:** {categoria_filtro} | {status_filtro} | {'Teste' if test_mode else 'Definitivo'}")
+
+mostrar_painel()
@@ -0,0 +1,314 @@
+# tarefas.py
+"""
+Baixas em lote como tarefas em background, com estado persistido por linha.
+
+  <pasta>/<id>/tarefa.json    metadados (colaborador, modo teste, webhook, estado...)
+  <pasta>/<id>/linhas.json    as linhas a baixar (saída de processar_faturamento)
+  <pasta>/<id>/diario.jsonl   uma linha JSON por evento de linha:
+                              {"i", "fase": "enviando"} antes do POST e
+                              {"i", "fase": "feito", "resultado"} depois
+
+O envio roda numa thread do processo (uma tarefa por vez, em ordem), então
+fechar o navegador ou clicar em outra coisa não interrompe o lote. Cada
+evento vai para o diário antes de seguir para a próxima linha: ao retomar,
+as linhas com sucesso não são reenviadas e as com erro são tentadas de novo.
+Uma linha com "enviando" sem "feito" (o processo caiu no meio do POST) fica
+como incerta: não é reenviada sozinha, porque a planilha pode já ter
+recebido a saída — confira no histórico e use `retomar(..., incertas=True)`.
+
+Quem executa (a fila do app ou o CLI) segura um flock em <id>/execucao.lock
+enquanto envia: o app e o CLI dividem a pasta, e uma tarefa travada aparece
+como 'executando' em qualquer processo e não é retomada por outro. Quem
+vai executar espera a trava por alguns segundos (a consulta de estado
+também a pega, por um instante); sem fcntl (Windows) ela vale só dentro
+do processo.
+
+As faturas da tarefa entram no registro de aplicadas já ao criar, marcadas
+com o id da tarefa (ver estoque.registrar_aplicadas); a marca fica definitiva
+no fim, ou sai se nenhuma linha foi baixada.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from estoque import REGISTRO_APLICADAS, WEBHOOK_URL, baixar_linha, registrar_aplicadas, remover_pendentes
+from metricas import span
+
+try:
+    import fcntl
+except ImportError:     # Windows: sem trava entre processos
+    fcntl = None
+
+PASTA_PADRAO = os.environ.get('ESTOQUE_TAREFAS', 'tarefas_baixa')
+COLUNAS_LINHA = ['codigo', 'codigo_canonical', 'nome', 'quantidade', 'estoque_atual', 'arquivos']
+ATIVAS = ('na_fila', 'executando')
+ESPERA_TRAVA = 2.0      # s que executar() espera a trava antes de concluir que outro está enviando
+
+
+class Tarefas:
+    """Store + executor das tarefas de baixa. Thread-safe dentro do processo."""
+
+    def __init__(self, pasta=PASTA_PADRAO, registro_aplicadas=REGISTRO_APLICADAS):
+        self.pasta = Path(pasta)
+        self.registro_aplicadas = registro_aplicadas
+        self._lock = threading.Lock()
+        self._parar = {}      # id -> Event, das tarefas na fila/executando neste processo
+        self._travadas = set()  # ids em executar() neste processo (a trava sem fcntl)
+        self._fila = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tarefas-baixa')
+
+    # ---------- arquivos ----------
+    def _dir(self, tid):
+        return self.pasta / tid
+
+    def meta(self, tid):
+        with open(self._dir(tid) / 'tarefa.json', encoding='utf-8') as f:
+            m = json.load(f)
+        if m['estado'] in ATIVAS and tid not in self._parar:
+            # na fila de outro processo, ou executando nele (o CLI, o app): só a trava diz
+            m['estado'] = 'executando' if self.executando(tid) else 'interrompida'
+        return m
+
+    def _travar(self, tid, espera=0):
+        """
+        Trava de execução da tarefa: o arquivo travado (solte com _soltar) ou
+        None se continuar travada depois de `espera` segundos.
+        """
+        limite = time.monotonic() + espera
+        while True:
+            arq = self._tentar_travar(tid)
+            if arq is not None or time.monotonic() >= limite:
+                return arq
+            time.sleep(0.05)
+
+    def _tentar_travar(self, tid):
+        with self._lock:
+            if tid in self._travadas:
+                return None
+            self._travadas.add(tid)
+        arq = open(self._dir(tid) / 'execucao.lock', 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(arq, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                arq.close()
+                with self._lock:
+                    self._travadas.discard(tid)
+                return None
+        return arq
+
+    def _soltar(self, tid, arq):
+        arq.close()     # fechar solta o flock
+        with self._lock:
+            self._travadas.discard(tid)
+
+    def executando(self, tid):
+        """A tarefa está sendo enviada agora, por este ou por outro processo."""
+        arq = self._travar(tid)
+        if arq is None:
+            return True
+        self._soltar(tid, arq)
+        return False
+
+    def _gravar_meta(self, tid, **campos):
+        with self._lock:
+            caminho = self._dir(tid) / 'tarefa.json'
+            with open(caminho, encoding='utf-8') as f:
+                m = json.load(f)
+            m.update(campos)
+            tmp = caminho.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(m, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, caminho)
+            return m
+
+    def linhas(self, tid):
+        with open(self._dir(tid) / 'linhas.json', encoding='utf-8') as f:
+            return json.load(f)
+
+    def diario(self, tid):
+        """{i: último evento da linha}. Uma linha final truncada (queda na escrita) é ignorada."""
+        eventos = {}
+        try:
+            with open(self._dir(tid) / 'diario.jsonl', encoding='utf-8') as f:
+                for texto in f:
+                    try:
+                        ev = json.loads(texto)
+                    except ValueError:
+                        continue
+                    eventos[ev['i']] = ev
+        except FileNotFoundError:
+            pass
+        return eventos
+
+    def _abrir_diario(self, tid):
+        caminho = self._dir(tid) / 'diario.jsonl'
+        arq = open(caminho, 'a', encoding='utf-8')
+        if arq.tell():
+            with open(caminho, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    arq.write('\n')   # linha truncada por uma queda: o próximo evento começa numa linha nova
+        return arq
+
+    def _anotar(self, arq, evento):
+        arq.write(json.dumps(evento, ensure_ascii=False, default=str) + '\n')
+        arq.flush()
+        os.fsync(arq.fileno())
+
+    # ---------- criação / controle ----------
+    def criar(self, ok, colaborador, test_mode=False, webhook_url=WEBHOOK_URL, digests=None, rotulo=''):
+        """Grava a tarefa (sem executar). `digests` ({arquivo: sha256}) entra no registro de aplicadas no fim."""
+        tid = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+        self._dir(tid).mkdir(parents=True, exist_ok=True)
+        linhas = ok[[c for c in COLUNAS_LINHA if c in ok.columns]]
+        (self._dir(tid) / 'linhas.json').write_text(linhas.to_json(orient='records', force_ascii=False), encoding='utf-8')
+        meta = {'id': tid, 'rotulo': rotulo, 'criada_em': datetime.now().isoformat(timespec='seconds'),
+                'colaborador': colaborador, 'test_mode': bool(test_mode), 'webhook_url': webhook_url,
+                'digests': digests or {}, 'total': len(linhas), 'estado': 'na_fila',
+                'iniciada_em': None, 'concluida_em': None}
+        with open(self._dir(tid) / 'tarefa.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        if digests and not test_mode:
+            registrar_aplicadas(digests, colaborador, self.registro_aplicadas, tarefa=tid)
+        return tid
+
+    def submeter(self, ok, colaborador, **kwargs):
+        """`criar` + fila: a execução segue numa thread do processo. Retorna o id."""
+        tid = self.criar(ok, colaborador, **kwargs)
+        self._enfileirar(tid)
+        return tid
+
+    def _enfileirar(self, tid, incertas=False):
+        with self._lock:
+            if tid in self._parar:
+                return False
+            self._parar[tid] = threading.Event()
+        # contexto de quem enfileirou: os spans da tarefa vão para o painel da sessão
+        self._fila.submit(contextvars.copy_context().run, self._rodar, tid, incertas)
+        return True
+
+    def retomar(self, tid, incertas=False):
+        """
+        Põe de novo na fila uma tarefa parada: envia as linhas nunca enviadas e
+        as com erro (e as incertas, se `incertas`). False se não houver o que enviar.
+        """
+        p = self.progresso(tid)
+        if p['estado'] in ATIVAS or not (p['pendentes'] + p['erro'] + (p['incertas'] if incertas else 0)):
+            return False
+        self._gravar_meta(tid, estado='na_fila')
+        return self._enfileirar(tid, incertas)
+
+    def cancelar(self, tid):
+        """Para depois da linha em andamento (a tarefa fica retomável)."""
+        ev = self._parar.get(tid)
+        if ev:
+            ev.set()
+        return ev is not None
+
+    def _rodar(self, tid, incertas):
+        try:
+            self.executar(tid, self._parar[tid], incertas=incertas)
+        except Exception as e:
+            self._gravar_meta(tid, erro=str(e))
+        finally:
+            with self._lock:
+                self._parar.pop(tid, None)
+
+    def executar(self, tid, parar=None, incertas=False, progresso=None):
+        """
+        Envia as linhas que faltam, anotando cada uma no diário. Roda na thread
+        que chamar (a fila usa isto; o CLI também). Retorna o estado final, ou
+        'executando' sem enviar nada se outro processo já está com a tarefa.
+        """
+        # espera um pouco: quem segura pode ser só uma consulta de estado (executando())
+        trava = self._travar(tid, espera=ESPERA_TRAVA)
+        if trava is None:
+            return 'executando'
+        try:
+            return self._executar(tid, parar, incertas, progresso)
+        finally:
+            self._soltar(tid, trava)
+
+    def _executar(self, tid, parar, incertas, progresso):
+        # o diário é lido já com a trava: o que outro processo enviou antes não é reenviado
+        m = self.meta(tid)
+        linhas, feitas = self.linhas(tid), self.diario(tid)
+        pendentes = [i for i in range(len(linhas)) if self._precisa_enviar(feitas.get(i), incertas)]
+        self._gravar_meta(tid, estado='executando', rodando_desde=time.time(),
+                          iniciada_em=m['iniciada_em'] or datetime.now().isoformat(timespec='seconds'))
+        try:
+            with self._abrir_diario(tid) as arq, span('tarefa', 'baixa'):
+                for n, i in enumerate(pendentes):
+                    if parar is not None and parar.is_set():
+                        return self._gravar_meta(tid, estado='cancelada')['estado']
+                    if progresso:
+                        progresso(n, len(pendentes), linhas[i]['codigo'])
+                    self._anotar(arq, {'i': i, 'fase': 'enviando', 'em': time.time()})
+                    res = baixar_linha(linhas[i], m['colaborador'], test_mode=m['test_mode'], webhook_url=m['webhook_url'])
+                    self._anotar(arq, {'i': i, 'fase': 'feito', 'em': time.time(), 'resultado': res})
+        except BaseException:     # inclui Ctrl+C no CLI
+            self._gravar_meta(tid, estado='interrompida')
+            raise
+
+        resumo = self.progresso(tid)
+        if not m['test_mode'] and m['digests']:
+            if resumo['sucesso']:
+                registrar_aplicadas(m['digests'], m['colaborador'], self.registro_aplicadas)
+            else:
+                remover_pendentes(m['digests'], tid, self.registro_aplicadas)
+        return self._gravar_meta(tid, estado='concluida', concluida_em=datetime.now().isoformat(timespec='seconds'))['estado']
+
+    @staticmethod
+    def _precisa_enviar(ev, incertas):
+        if ev is None:
+            return True
+        if ev['fase'] == 'enviando':
+            return incertas
+        return ev['resultado']['status'] != 'Sucesso'
+
+    # ---------- consulta ----------
+    def progresso(self, tid):
+        """
+        dict: metadados + feitas, sucesso, erro, incertas, pendentes (nunca
+        enviadas), linhas_por_s (último minuto) e eta_s.
+        """
+        m = self.meta(tid)
+        eventos = self.diario(tid).values()
+        feitos = [e for e in eventos if e['fase'] == 'feito']
+        sucesso = sum(e['resultado']['status'] == 'Sucesso' for e in feitos)
+        incertas = sum(e['fase'] == 'enviando' for e in eventos)
+        ultimo = max(eventos, key=lambda e: e['em'], default=None)
+        if (m['estado'] == 'executando' and ultimo and ultimo['fase'] == 'enviando'
+                and ultimo['em'] >= m.get('rodando_desde', 0)):
+            incertas -= 1      # a linha em andamento nesta execução (as de uma queda anterior continuam incertas)
+        # vazão da execução atual (uma pausa antes de retomar não conta), no último minuto
+        tempos = sorted(e['em'] for e in feitos if e['em'] >= m.get('rodando_desde', 0))
+        recentes = [t for t in tempos if t >= tempos[-1] - 60] if tempos else []
+        taxa = (len(recentes) - 1) / (recentes[-1] - recentes[0]) if len(recentes) > 1 and recentes[-1] > recentes[0] else 0.0
+        pendentes = m['total'] - len(feitos) - incertas
+        return {
+            **m, 'feitas': len(feitos), 'sucesso': sucesso, 'erro': len(feitos) - sucesso,
+            'incertas': incertas, 'pendentes': pendentes, 'linhas_por_s': taxa,
+            'eta_s': pendentes / taxa if taxa and m['estado'] in ATIVAS else None,
+        }
+
+    def resultados(self, tid):
+        """Relatório de baixas (mesmas colunas de aplicar_baixas), na ordem das linhas."""
+        eventos = self.diario(tid)
+        return [eventos[i]['resultado'] for i in sorted(eventos) if eventos[i]['fase'] == 'feito']
+
+    def listar(self, limite=20):
+        """DataFrame das tarefas mais recentes (id, criada_em, colaborador, estado, total, sucesso...)."""
+        if not self.pasta.exists():
+            return pd.DataFrame()
+        ids = sorted((d.name for d in self.pasta.iterdir() if (d / 'tarefa.json').exists()), reverse=True)[:limite]
+        cols = ['id', 'rotulo', 'criada_em', 'colaborador', 'test_mode', 'estado', 'total', 'sucesso', 'erro', 'incertas', 'pendentes']
+        return pd.DataFrame([self.progresso(t) for t in ids], columns=cols)
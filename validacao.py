@@ -0,0 +1,167 @@
+# validacao.py
+"""
+Integridade do catálogo, verificada uma vez por snapshot.
+
+Problemas que não quebram a carga mas levam a baixas erradas ou números
+sem sentido:
+
+  colisao_chave            códigos diferentes com a mesma codigo_key ("AÇO-1"
+                           e "ACO-1"): o matching fica com um só deles e a
+                           baixa pode cair no SKU errado
+  codigo_duplicado         o mesmo código em mais de uma linha
+  min_maior_que_max        estoque_min > estoque_max
+  estoque_negativo         estoque_atual < 0
+  kit_tamanhos             kit com listas de componentes e quantidades de
+                           tamanhos diferentes (ou vazias): o kit é ignorado
+                           na expansão e baixa como um SKU comum
+  componente_desconhecido  componente de kit que não está no catálogo
+
+Cada verificação é uma passada vetorizada sobre o catálogo inteiro
+(groupby/duplicated/comparações; os componentes de kit viram uma coluna
+com explode). Com a coluna 'deposito' (visão consolidada), tudo é por
+depósito: o mesmo código em dois depósitos não é duplicado.
+"""
+import pandas as pd
+
+from estoque import normalize_key
+
+TIPOS = {
+    'colisao_chave': 'erro',
+    'codigo_duplicado': 'erro',
+    'kit_tamanhos': 'erro',
+    'componente_desconhecido': 'erro',
+    'min_maior_que_max': 'aviso',
+    'estoque_negativo': 'aviso',
+}
+COLUNAS = ['tipo', 'gravidade', 'deposito', 'codigo', 'codigo_key', 'detalhe']
+ROTULOS = {
+    'colisao_chave': 'Chave normalizada repetida',
+    'codigo_duplicado': 'Código duplicado',
+    'kit_tamanhos': 'Kit com componentes ≠ quantidades',
+    'componente_desconhecido': 'Componente fora do catálogo',
+    'min_maior_que_max': 'Mínimo maior que máximo',
+    'estoque_negativo': 'Estoque negativo',
+}
+
+
+def validar(produtos_df):
+    """DataFrame com um problema por linha (COLUNAS), erros primeiro. Vazio = catálogo íntegro."""
+    if produtos_df.empty:
+        return pd.DataFrame(columns=COLUNAS)
+    df = pd.DataFrame({
+        'deposito': produtos_df['deposito'].astype(str) if 'deposito' in produtos_df.columns else '',
+        'codigo': produtos_df['codigo'].astype(str).str.strip(),
+        'codigo_key': produtos_df['codigo_key'].astype(str),
+    })
+    partes = [p for p in (_colisoes(df), _duplicados(df), _kits(produtos_df, df), _numericos(produtos_df, df))
+              if not p.empty]
+    if not partes:
+        return pd.DataFrame(columns=COLUNAS)
+    problemas = pd.concat(partes, ignore_index=True)
+    problemas['gravidade'] = problemas['tipo'].map(TIPOS)
+    ordem = problemas['tipo'].map({t: i for i, t in enumerate(TIPOS)})
+    return problemas.assign(_o=ordem).sort_values(['_o', 'deposito', 'codigo_key', 'codigo'], kind='stable') \
+        .drop(columns='_o').reset_index(drop=True)[COLUNAS]
+
+
+def resumo(problemas):
+    """{tipo: quantidade} só dos tipos com problema, na ordem de TIPOS."""
+    contagem = problemas['tipo'].value_counts()
+    return {t: int(contagem[t]) for t in TIPOS if t in contagem.index}
+
+
+def chaves_em_colisao(problemas, deposito=None):
+    """codigo_key com mais de um código (no depósito, se informado)."""
+    col = problemas[problemas['tipo'] == 'colisao_chave']
+    if deposito is not None:
+        col = col[col['deposito'] == deposito]
+    return set(col['codigo_key'])
+
+
+def _linhas(df, mask, tipo, detalhe):
+    out = df.loc[mask, ['deposito', 'codigo', 'codigo_key']].copy()
+    out['tipo'] = tipo
+    out['detalhe'] = detalhe[mask] if isinstance(detalhe, pd.Series) else detalhe
+    return out
+
+
+def _colisoes(df):
+    # códigos distintos por (depósito, chave); a mesma grafia repetida é 'codigo_duplicado'
+    com_chave = df[df['codigo_key'] != '']
+    distintos = com_chave.drop_duplicates(['deposito', 'codigo_key', 'codigo'])
+    n = distintos.groupby(['deposito', 'codigo_key'], sort=False)['codigo'].transform('size')
+    colididos = distintos[n > 1]
+    if colididos.empty:
+        return pd.DataFrame(columns=COLUNAS)
+    grupos = colididos.groupby(['deposito', 'codigo_key'], sort=False)['codigo'].agg(lambda c: ', '.join(sorted(c)))
+    detalhe = pd.Series(grupos.reindex(pd.MultiIndex.from_frame(colididos[['deposito', 'codigo_key']])).to_numpy(),
+                        index=colididos.index)
+    return _linhas(colididos, pd.Series(True, index=colididos.index), 'colisao_chave',
+                   'códigos com esta chave: ' + detalhe)
+
+
+def _duplicados(df):
+    mask = df.duplicated(['deposito', 'codigo'], keep='first')
+    if not mask.any():
+        return pd.DataFrame(columns=COLUNAS)
+    vezes = df.groupby(['deposito', 'codigo'], sort=False)['codigo'].transform('size')
+    return _linhas(df, mask, 'codigo_duplicado', vezes.astype(str) + ' linhas com este código')
+
+
+def _numericos(produtos_df, df):
+    atual = pd.to_numeric(produtos_df['estoque_atual'], errors='coerce')
+    minimo = pd.to_numeric(produtos_df['estoque_min'], errors='coerce')
+    maximo = pd.to_numeric(produtos_df['estoque_max'], errors='coerce')
+    fmt = lambda s: s.map('{:g}'.format)
+    partes = []
+    mask = (minimo > maximo).to_numpy()
+    if mask.any():
+        partes.append(_linhas(df, mask, 'min_maior_que_max', 'mín ' + fmt(minimo) + ' > máx ' + fmt(maximo)))
+    mask = (atual < 0).to_numpy()
+    if mask.any():
+        partes.append(_linhas(df, mask, 'estoque_negativo', 'estoque ' + fmt(atual)))
+    return pd.concat(partes) if partes else pd.DataFrame(columns=COLUNAS)
+
+
+def _kits(produtos_df, df):
+    if 'eh_kit' not in produtos_df.columns:
+        return pd.DataFrame(columns=COLUNAS)
+    eh_kit = (produtos_df['eh_kit'].astype(str).str.strip().str.lower() == 'sim').to_numpy()
+    if not eh_kit.any():
+        return pd.DataFrame(columns=COLUNAS)
+    kits = df[eh_kit]
+
+    # mesma leitura de estoque.mapa_kits: itens vazios somem, quantidade precisa ser número
+    comps = produtos_df.loc[eh_kit, 'componentes'].astype(str).str.split(',').explode().str.strip()
+    comps = comps[(comps != '') & (comps.str.lower() != 'nan')]
+    quants = produtos_df.loc[eh_kit, 'quantidades'].astype(str).str.split(',').explode().str.strip()
+    quants = pd.to_numeric(quants.str.replace(',', '.', regex=False), errors='coerce').dropna()
+    n_comps = comps.groupby(level=0).size().reindex(kits.index, fill_value=0)
+    n_quants = quants.groupby(level=0).size().reindex(kits.index, fill_value=0)
+
+    partes = []
+    mask = (n_comps != n_quants) | (n_comps == 0)
+    if mask.any():
+        partes.append(_linhas(kits, mask, 'kit_tamanhos',
+                              n_comps.astype(str) + ' componente(s), ' + n_quants.astype(str) + ' quantidade(s)'))
+
+    # componentes contra as chaves do mesmo depósito; normalize_key só para
+    # o que não estiver escrito exatamente como um código do catálogo
+    if not comps.empty:
+        por_codigo = dict(zip(df['codigo'].tolist(), df['codigo_key'].tolist()))
+        unicos = comps.unique()
+        chave = pd.Series([por_codigo.get(c) or normalize_key(c) for c in unicos], index=unicos)
+        comp_key = chave[comps.to_numpy()].to_numpy()
+        conhecidas = df['codigo_key']
+        if df['deposito'].nunique() > 1:
+            comp_key = df.loc[comps.index, 'deposito'].to_numpy(dtype=object) + '|' + comp_key
+            conhecidas = df['deposito'] + '|' + conhecidas
+        # isin em object: o de strings arrow converte o conjunto elemento a elemento
+        fora = ~pd.Series(comp_key, dtype=object).isin(conhecidas.to_numpy(dtype=object)).to_numpy()
+        if fora.any():
+            faltam = comps[fora]
+            out = df.loc[faltam.index, ['deposito', 'codigo', 'codigo_key']].copy()
+            out['tipo'] = 'componente_desconhecido'
+            out['detalhe'] = ('componente ' + faltam + ' não está no catálogo').to_numpy()
+            partes.append(out)
+    return pd.concat(partes) if partes else pd.DataFrame(columns=COLUNAS)